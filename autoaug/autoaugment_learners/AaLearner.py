@@ -2,12 +2,22 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 from autoaug.main import train_child_network, create_toy
-from autoaug.autoaugment_learners.autoaugment import AutoAugment
+from autoaug.warm_start import pretrain_child_network, freeze_early_layers
+from autoaug.validation import ValidationSubsample, QuantizedValidation
+from autoaug.autotune import autotune_loader_config, DEFAULT_CACHE_PATH
+from autoaug.distributed import train_child_network_distributed
+from autoaug.evaluators import SerialEvaluator
+from autoaug.dataset_views import transform_view
+from autoaug.autoaugment_learners.autoaugment import AutoAugment, RandAugment, RandAugmentPolicy
 
 import torchvision.transforms as transforms
 
+import concurrent.futures
 import copy
+import hashlib
 import types
+import uuid
+from pprint import pprint
 
 
 
@@ -47,11 +57,118 @@ class AaLearner:
 
         early_stop_num (int, optional): child_network training parameter. Defaults to 20.
 
+        stopping_rule (stopping_rules.MedianStoppingRule, optional): if given, 
+                        evaluations whose learning curves fall behind the 
+                        learning curves of previous evaluations are stopped early.
+                        Defaults to None.
+
+        checkpoint_store (checkpoints.CheckpointStore, optional): if given, the 
+                        training state of every child network is saved in it
+                        under its evaluation id (e.g. 'pol3', the same key as in
+                        self.policy_record), so that an evaluation can later be
+                        continued with a larger budget instead of being 
+                        retrained from scratch. In the store, the id is made
+                        unique to this learner, the policy and the child network
+                        training parameters (see self._checkpoint_id), so
+                        several learners, or runs, can share a store without 
+                        resuming each other's checkpoints. Defaults to None.
+
+        warm_start (bool, optional): if True, the child network is pretrained once
+                        on the un-augmented toy dataset, and each policy is 
+                        evaluated by fine tuning a copy of the pretrained child
+                        network for fine_tune_epochs epochs (without early
+                        stopping). See warm_start.warm_start_rank_correlation to
+                        check whether this ranks policies like training from
+                        scratch does. Defaults to False.
+
+        pretrain_epochs (int, optional): maximum number of epochs we pretrain
+                        for when warm_start is True. Defaults to 20.
+
+        fine_tune_epochs (int, optional): number of epochs each policy is fine
+                        tuned for when warm_start is True. Defaults to 5.
+
+        freeze_layers (int, optional): number of early layers (modules with 
+                        parameters, e.g. conv1 of LeNet) that are frozen while 
+                        fine tuning. Defaults to 0.
+
+        val_ci (float, optional): if given, the validation accuracy during child
+                        network training is measured on a cached subsample of the
+                        validation set, just big enough for the confidence interval
+                        of the accuracy to have this half-width (see 
+                        validation.ValidationSubsample). Only the final score is
+                        measured on the whole validation set. Defaults to None,
+                        which means we always validate on the whole validation set.
+
+        val_every (int, optional): check the validation accuracy every val_every
+                        epochs. Defaults to 1.
+
+        val_on_plateau (bool, optional): also check the validation accuracy
+                        whenever the training loss stops improving. Defaults to False.
+
+        quantized_validation (bool, optional): if True, validation during child
+                        network training runs through an int8 dynamically quantized
+                        copy of the child network, falling back to fp32 whenever
+                        their argmax agree on less than quant_min_agreement of a
+                        calibration sample (see validation.QuantizedValidation).
+                        Defaults to False.
+
+        quant_min_agreement (float, optional): see quantized_validation. 
+                        Defaults to 0.99.
+
+        quant_check_every (int, optional): the agreement is checked in the 
+                        first validation of each child network and then every
+                        quant_check_every validations. Defaults to 5.
+
+        num_workers (int, optional): child_network training parameter. Number of
+                        DataLoader worker processes. Defaults to 0.
+
+        auto_tune (bool, optional): if True, before the first evaluation we
+                        measure which batch size, number of DataLoader workers
+                        and number of intra-op threads train the child network
+                        fastest (see autotune.autotune_loader_config), and use
+                        those instead of batch_size and num_workers. The
+                        number of threads is set with torch.set_num_threads.
+                        Defaults to False.
+
+        max_batch_size (int, optional): largest batch size auto_tune may
+                        choose. Defaults to 256.
+
+        memory_limit (int, optional): auto_tune only chooses batch sizes whose
+                        estimated training memory is at most this many bytes.
+                        Defaults to None (no limit).
+
+        autotune_cache (str, optional): json file the auto_tune results are
+                        cached in per (dataset, architecture, machine,
+                        max_batch_size, memory_limit).
+                        Defaults to ~/.cache/autoaug/autotune.json
+
+        num_processes (int, optional): if more than 1, each child network is
+                        trained data-parallel across this many local processes
+                        (see distributed.train_child_network_distributed). 
+                        Cannot be used with checkpoint_store, val_ci or
+                        quantized_validation. Defaults to 1.
+
+        evaluator (evaluators.Evaluator, optional): trains the child networks
+                        for the policies we evaluate, e.g. an
+                        evaluators.ProcessPoolEvaluator to evaluate several
+                        policies at once. Defaults to None, which means 
+                        evaluators.SerialEvaluator().
+
     
     Attributes:
         history (list): list of policies that has been input into 
                         self._test_autoaugment_policy as well as their respective obtained
                         accuracies
+
+        learning_curves (list): list of learning curves ((epoch, validation accuracy)
+                        of each validation) of every evaluation, in the same order
+                        as self.history
+
+        autotune_result (dict): the configuration auto_tune chose and the
+                        measurements it is based on. None until auto_tune has run.
+
+        pending (dict): the policies self.propose has proposed which have not
+                        been passed to self.observe yet, by proposal id
                         
         augmentation_space (list): list of image functions that the user has chosen to 
                         include in the search space.
@@ -71,6 +188,25 @@ class AaLearner:
                 max_epochs=float('inf'),
                 early_stop_num=20,
                 exclude_method = [],
+                stopping_rule=None,
+                checkpoint_store=None,
+                warm_start=False,
+                pretrain_epochs=20,
+                fine_tune_epochs=5,
+                freeze_layers=0,
+                val_ci=None,
+                val_every=1,
+                val_on_plateau=False,
+                quantized_validation=False,
+                quant_min_agreement=0.99,
+                quant_check_every=5,
+                num_workers=0,
+                auto_tune=False,
+                max_batch_size=256,
+                memory_limit=None,
+                autotune_cache=DEFAULT_CACHE_PATH,
+                num_processes=1,
+                evaluator=None,
                 ):
         
         # related to defining the search space
@@ -83,12 +219,51 @@ class AaLearner:
         self.batch_size = batch_size
         self.toy_size = toy_size
         self.learning_rate = learning_rate
+        self.num_workers = num_workers
+        self.num_processes = num_processes
+        if num_processes > 1 and checkpoint_store is not None:
+            raise ValueError('checkpoint_store cannot be used with num_processes > 1')
+        # each process would subsample (or calibrate on) its own validation
+        # shard, and the processes could disagree on when to stop
+        if num_processes > 1 and (val_ci is not None or quantized_validation):
+            raise ValueError('val_ci and quantized_validation cannot be used with '
+                            'num_processes > 1')
 
         self.max_epochs = max_epochs
         self.early_stop_num = early_stop_num
+        self.stopping_rule = stopping_rule
+        self.checkpoint_store = checkpoint_store
+        # makes the checkpoint ids of this learner unique
+        self.run_id = uuid.uuid4().hex
+
+        self.evaluator = evaluator if evaluator is not None else SerialEvaluator()
+
+        # related to warm starting child networks
+        self.warm_start = warm_start
+        self.pretrain_epochs = pretrain_epochs
+        self.fine_tune_epochs = fine_tune_epochs
+        self.freeze_layers = freeze_layers
+        self._warm_start_states = {}
+
+        # related to validation during child network training
+        self.val_ci = val_ci
+        self.val_every = val_every
+        self.val_on_plateau = val_on_plateau
+        self._val_subsamples = {}
+        self.quantized_validation = QuantizedValidation(min_agreement=quant_min_agreement,
+                                                        check_every=quant_check_every) \
+                                        if quantized_validation else None
+
+        # related to auto tuning the child network training throughput
+        self.auto_tune = auto_tune
+        self.max_batch_size = max_batch_size
+        self.memory_limit = memory_limit
+        self.autotune_cache = autotune_cache
+        self.autotune_result = None
 
         # TODO: We should probably use a different way to store results than self.history
         self.history = []
+        self.learning_curves = []
 
         # this is the full augmentation space. We take out some image functions
         # if the user specifies so in the exclude_method parameter
@@ -135,11 +310,18 @@ class AaLearner:
         self.op_tensor_length = self.fun_num + p_bins + m_bins if discrete_p_m else self.fun_num +2
         self.num_pols_tested = 0
         self.policy_record = {}
+        # {key in self.policy_record: index in self.history}
+        self._record_idx = {}
+
+        # related to the ask/tell interface (self.propose and self.observe)
+        self.pending = {}
+        self._num_proposed = 0
 
 
 
 
-    def _translate_operation_tensor(self, operation_tensor, return_log_prob=False, argmax=False):
+    def _translate_operation_tensor(self, operation_tensor, return_log_prob=False, argmax=False,
+                                    return_indices=False):
         """
         takes in a tensor representing an operation and returns an actual operation which
         is in the form of:
@@ -167,6 +349,13 @@ class AaLearner:
                             Whether we are taking the argmax of the softmaxed tensors. 
                             If this is False, we treat the softmaxed outputs as multinomial pdf's.
 
+            return_indices (boolean):
+                            When this is on, we also return the indices (fun_idx, prob_idx,
+                            mag_idx) that were chosen, so that the log probability of the
+                            operation can be computed again later (e.g. under updated
+                            controller weights in the GruLearner).
+                            Can only be used when self.discrete_p_m.
+
         Returns:
             operation (list of tuples):
                                 An operation in the format that can be directly put into an
@@ -184,6 +373,9 @@ class AaLearner:
         if (not self.discrete_p_m) and return_log_prob:
             raise ValueError("You are not supposed to use return_log_prob=True when the agent's \
                             self.discrete_p_m is False!")
+        if (not self.discrete_p_m) and return_indices:
+            raise ValueError("You are not supposed to use return_indices=True when the agent's \
+                            self.discrete_p_m is False!")
 
         # make sure shape is correct
         assert operation_tensor.shape==(self.op_tensor_length, ), operation_tensor.shape
@@ -252,12 +444,139 @@ class AaLearner:
         else:
             operation =  (function, prob, None)
         
-        if return_log_prob:
+        if return_log_prob and return_indices:
+            return operation, log_prob, indices
+        elif return_log_prob:
             return operation, log_prob
+        elif return_indices:
+            return operation, indices
         else:
             return operation
         
 
+    def _translate_operation_tensors(self, operation_tensors, return_log_prob=False, argmax=False,
+                                    validate=False):
+        """
+        Does what self._translate_operation_tensor does for all the operations
+        of a policy (or of a batch of policies) at once: one torch.multinomial 
+        (or argmax) call per kind of choice (function, probability, magnitude)
+        for all the operations, rather than three per operation. The tensors are
+        not checked unless validate is True.
+
+        Args:
+            operation_tensors (tensor): of shape (num_ops, self.op_tensor_length),
+                                or (batch_size, num_ops, self.op_tensor_length)
+                                for a batch of policies. Each operation tensor is
+                                as in self._translate_operation_tensor.
+
+            return_log_prob (boolean): When this is on, we also return the sum
+                                of the log probabilities of the operations of 
+                                each policy. Can only be used when self.discrete_p_m.
+
+            argmax (boolean): see self._translate_operation_tensor
+
+            validate (boolean): whether to check operation_tensors with 
+                                self._validate_operation_tensors first. Defaults
+                                to False.
+
+        Returns:
+            operations (list): the num_ops operations, or a list of them for 
+                                each policy of the batch
+            log_prob (tensor): of shape () or (batch_size,)
+        """
+        if (not self.discrete_p_m) and return_log_prob:
+            raise ValueError("You are not supposed to use return_log_prob=True when the agent's \
+                            self.discrete_p_m is False!")
+        if validate:
+            self._validate_operation_tensors(operation_tensors, argmax=argmax)
+
+        batched = operation_tensors.dim() == 3
+        if not batched:
+            operation_tensors = operation_tensors.unsqueeze(0)
+
+        def _choose(probs):
+            if argmax:
+                return probs.argmax(dim=-1)
+            return torch.multinomial(probs.reshape(-1, probs.shape[-1]), 1).view(probs.shape[:-1])
+
+        if self.discrete_p_m:
+            fun_t, prob_t, mag_t = operation_tensors.split([self.fun_num, self.p_bins, self.m_bins], dim=-1)
+            # (batch_size, num_ops, 3)
+            indices = torch.stack((_choose(fun_t), _choose(prob_t), _choose(mag_t)), dim=-1)
+            operations = [self._indices_to_operations(policy_indices)
+                            for policy_indices in indices.tolist()]
+        else:
+            fun_t, prob_t, mag_t = operation_tensors.split([self.fun_num, 1, 1], dim=-1)
+            operations = []
+            for fun_idxs, probs, mags in zip(_choose(fun_t).tolist(), 
+                                            prob_t.squeeze(-1).tolist(),
+                                            mag_t.squeeze(-1).tolist()):
+                # round prob to nearest first decimal digit and mag to nearest integer
+                operations.append([self._make_operation(fun_idx, round(prob, 1), round(mag))
+                                    for fun_idx, prob, mag in zip(fun_idxs, probs, mags)])
+
+        if not batched:
+            operations = operations[0]
+        if not return_log_prob:
+            return operations
+
+        # log probability is the sum of the log of the softmax values of the indices 
+        # (of fun_t, prob_t, mag_t) that we have chosen
+        log_prob = 0
+        for probs, idx in zip((fun_t, prob_t, mag_t), indices.unbind(dim=-1)):
+            log_prob = log_prob + torch.log(probs.gather(-1, idx.unsqueeze(-1)).squeeze(-1))
+        log_prob = log_prob.sum(dim=1)
+        return operations, log_prob if batched else log_prob[0]
+
+
+    def _validate_operation_tensors(self, operation_tensors, argmax=False):
+        """
+        Checks operation_tensors (see self._translate_operation_tensors) the way
+        self._translate_operation_tensor checks each operation tensor. This is 
+        kept out of the translation itself, because the checks cost more than
+        the translation.
+        """
+        assert operation_tensors.dim() in (2, 3), operation_tensors.shape
+        assert operation_tensors.shape[-1] == self.op_tensor_length, operation_tensors.shape
+
+        if self.discrete_p_m:
+            if not argmax:
+                # we need these to add up to 1 to be valid pdf's of multinomials
+                for probs in operation_tensors.split([self.fun_num, self.p_bins, self.m_bins], dim=-1):
+                    sums = probs.sum(dim=-1)
+                    assert torch.allclose(sums, torch.ones_like(sums)), sums
+        else:
+            fun_t, prob_t, mag_t = operation_tensors.split([self.fun_num, 1, 1], dim=-1)
+            if not argmax:
+                sums = fun_t.sum(dim=-1)
+                assert torch.allclose(sums, torch.ones_like(sums)), sums
+            assert ((prob_t > -0.05) & (prob_t < 1.05)).all(), prob_t
+            assert ((mag_t > -0.5) & (mag_t < self.m_bins-0.5)).all(), (mag_t, self.m_bins)
+
+
+    def _indices_to_operations(self, indices):
+        """
+        Turns the indices (fun_idx, prob_idx, mag_idx) chosen for each operation
+        into operations, the way self._translate_operation_tensor does when
+        self.discrete_p_m
+        """
+        return [self._make_operation(fun_idx, prob_idx/(self.p_bins-1), mag_idx)
+                    for fun_idx, prob_idx, mag_idx in indices]
+
+
+    def _make_operation(self, fun_idx, prob, mag):
+        # if the image function does not require a magnitude, we set the magnitude to None
+        function, has_magnitude = self.augmentation_space[fun_idx]
+        return (function, prob, mag if has_magnitude else None)
+
+
+    def _operations_to_policy(self, operations):
+        """
+        Pairs up operations into the subpolicies of a policy
+        """
+        return [tuple(operations[i:i+2]) for i in range(0, len(operations), 2)]
+
+
     def _generate_new_policy(self):
         """
         Generate a new policy which can be fed into an AutoAugment object 
@@ -284,6 +603,115 @@ class AaLearner:
         raise NotImplementedError('_generate_new_policy not implemented in AaLearner')
 
 
+    def propose(self, n=1):
+        """
+        Proposes up to n new policies to evaluate (the "ask" of an ask/tell
+        interface). Whoever evaluates them reports the results with 
+        self.observe, in any order. This way the search can be driven by
+        an external scheduler which evaluates several policies at once.
+
+        A learner proposes fewer than n policies (possibly none) when it needs
+        the results of pending policies before it can propose more, e.g. the
+        GruLearner at the end of a controller minibatch.
+
+        Args:
+            n (int, optional): maximum number of policies. Defaults to 1.
+
+        Returns:
+            list[tuple]: (proposal_id, policy) pairs
+        """
+        proposals = []
+        for _ in range(n):
+            proposal = self._propose_policy()
+            if proposal is None:
+                break
+            policy, info = proposal
+
+            proposal_id = self._new_id()
+            self.pending[proposal_id] = (policy, info)
+            proposals.append((proposal_id, policy))
+
+        return proposals
+
+
+    def observe(self, proposal_id, accuracy, curve=None):
+        """
+        Reports the accuracy of a policy proposed by self.propose (the "tell"
+        of an ask/tell interface). The result is recorded in self.history and 
+        self.policy_record, and the learner updates its state (e.g. its 
+        controller) with it.
+
+        Args:
+            proposal_id (int): the id self.propose returned with the policy
+
+            accuracy (float): the accuracy the policy reached
+
+            curve (list[tuple], optional): the learning curve of the evaluation
+                        ((epoch, validation accuracy) of each validation)
+        """
+        if proposal_id not in self.pending:
+            raise KeyError(f'{proposal_id} is not the id of a pending proposal')
+        policy, info = self.pending.pop(proposal_id)
+
+        self._record_result(policy, accuracy, [] if curve is None else list(curve),
+                            eval_id=self._eval_id(proposal_id))
+        self._observe_policy(policy, accuracy, info)
+
+
+    def _new_id(self):
+        """
+        Returns a new proposal id. Evaluations which were not proposed (e.g.
+        direct calls of self._test_autoaugment_policy) take their ids from
+        the same counter, so no two evaluations share a key in
+        self.policy_record
+        """
+        new_id = self._num_proposed
+        self._num_proposed += 1
+        return new_id
+
+
+    @staticmethod
+    def _eval_id(proposal_id):
+        """
+        Returns the key in self.policy_record (and the eval_id of the
+        checkpoint) of the evaluation of proposal proposal_id
+        """
+        return f'pol{proposal_id}'
+
+
+    def _propose_policy(self):
+        """
+        Returns (policy, info) for self.propose, where info is anything
+        self._observe_policy needs to know about how policy was proposed,
+        or None if no policy can be proposed before more results are observed.
+        """
+        return self._generate_new_policy(), None
+
+
+    def _observe_policy(self, policy, accuracy, info):
+        """
+        Updates the learner's state with the accuracy of policy. info is what
+        self._propose_policy returned with policy.
+        """
+
+
+    def get_migrants(self, n):
+        """
+        Returns (at most) n of the best members of the learner's population,
+        for island-model searches (see autoaug.islands), as picklable objects
+        which self.add_migrants of another learner of the same class takes
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support island-model searches')
+
+
+    def add_migrants(self, migrants):
+        """
+        Adds migrants (from get_migrants of learners on other islands) to the
+        learner's population
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support island-model searches')
+
+
     def learn(self, train_dataset, test_dataset, child_network_architecture, iterations=15):
         """
         Runs the main loop (of finding a good policy for the given child network,
@@ -296,6 +724,8 @@ class AaLearner:
             2. <see how good that policy is>
             3. <save how good the policy is in a list/dictionary and (if applicable,) update the controller (e.g. RL agent)>
 
+        using self.propose for 1., self.evaluator for 2. and self.observe for 3.
+
         If ``child_network_architecture`` is a ``<function>``, then we make an 
         instance of it. If this is a ``<nn.Module>``, we make a ``copy.deepcopy``
         of it. We make a copy of it because we we want to keep an untrained 
@@ -325,19 +755,106 @@ class AaLearner:
         Example code:
 
         .. code-block::
-            :caption: This is how a child class might implement this method:
+            :caption: This is how a scheduler can drive the search itself:
             
-            for _ in range(15):
-                policy = self._generate_new_policy()
+            while len(learner.history) < 15:
+                for proposal_id, policy in learner.propose(n=4):
+                    <hand policy to a worker>
+                for proposal_id, accuracy, curve in <finished evaluations>:
+                    learner.observe(proposal_id, accuracy, curve)
+        """
+        self._run_search(train_dataset, test_dataset, child_network_architecture, iterations)
 
-                print(policy)
-                reward = self._test_autoaugment_policy(policy,
-                                        child_network_architecture,
-                                        train_dataset,
-                                        test_dataset)
+
+    def _run_search(self,
+                    train_dataset,
+                    test_dataset,
+                    child_network_architecture,
+                    num_evaluations):
+        """
+        Evaluates num_evaluations policies, asking self.propose for as many
+        policies at a time as self.evaluator can evaluate at once, and 
+        passing the results to self.observe in the order they were proposed.
         """
+        if len(self.pending) > 0:
+            raise RuntimeError(f'{len(self.pending)} proposed policies have not been '
+                                'observed yet')
+
+        num_evaluated = 0
+        while num_evaluated < num_evaluations:
+            proposals = self.propose(min(self.evaluator.num_workers,
+                                        num_evaluations - num_evaluated))
+            # with nothing pending, a learner can propose something unless
+            # it has searched all of its search space
+            if len(proposals) == 0:
+                break
+
+            policies = [policy for _, policy in proposals]
+            for policy in policies:
+                pprint(policy)
+            results = self._evaluate_policies(policies,
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset,
+                                            eval_ids=[self._eval_id(proposal_id)
+                                                        for proposal_id, _ in proposals])
+
+            for (proposal_id, _), (accuracy, acc_log) in zip(proposals, results):
+                self.observe(proposal_id, accuracy, acc_log)
+            num_evaluated += len(proposals)
+
+
+    def _run_search_async(self,
+                        train_dataset,
+                        test_dataset,
+                        child_network_architecture,
+                        num_evaluations):
+        """
+        Like self._run_search, but without waiting for a whole batch of
+        evaluations: whenever an evaluation finishes, its result is passed to
+        self.observe and a new policy is proposed for the free worker. The 
+        results are observed in the order they finish, so the learner has to
+        cope with policies proposed before some earlier results were observed.
+
+        Only evaluators whose submit method runs in the background (e.g. the
+        ThreadPoolEvaluator) evaluate several policies at once this way.
+        """
+        if len(self.pending) > 0:
+            raise RuntimeError(f'{len(self.pending)} proposed policies have not been '
+                                'observed yet')
+
+        running = {}
+        num_submitted = 0
+        num_evaluated = 0
+        while num_evaluated < num_evaluations:
+            # keep every worker busy
+            while len(running) < self.evaluator.num_workers and num_submitted < num_evaluations:
+                proposals = self.propose()
+                if len(proposals) == 0:
+                    break
+                (proposal_id, policy), = proposals
+                pprint(policy)
+                task, = self._evaluation_tasks([policy],
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset,
+                                            eval_ids=[self._eval_id(proposal_id)])
+                future = self.evaluator.submit(self,
+                                            task,
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset)
+                running[future] = proposal_id
+                num_submitted += 1
+            assert len(running) > 0
+
+            finished, _ = concurrent.futures.wait(running,
+                                            return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                accuracy, acc_log = future.result()
+                self.observe(running.pop(future), accuracy, acc_log)
+                num_evaluated += 1
 
-    
 
     def _test_autoaugment_policy(self,
                                 policy,
@@ -345,7 +862,9 @@ class AaLearner:
                                 train_dataset,
                                 test_dataset,
                                 logging=False,
-                                print_every_epoch=True):
+                                print_every_epoch=True,
+                                eval_id=None,
+                                max_epochs=None):
         """
         Given a policy (using AutoAugment paper terminology), we train a child network
         using the policy and return the accuracy (how good the policy is for the dataset and 
@@ -360,15 +879,193 @@ class AaLearner:
                                 of it.
             train_dataset (torchvision.dataset.vision.VisionDataset)
             test_dataset (torchvision.dataset.vision.VisionDataset)
-            logging (boolean): Whether we want to save logs
+            logging (boolean): Whether we want to also return the learning curve.
+                                The learning curve is always stored in 
+                                self.learning_curves
+            eval_id (str, optional): id under which the training state is kept
+                                in self.checkpoint_store. If a checkpoint with this
+                                id exists, training continues from it, and the
+                                result replaces that of eval_id in self.history
+                                and self.policy_record. Defaults to a new id
+                                (see self._new_id)
+            max_epochs (Union[int, float], optional): overrides self.max_epochs
+                                for this evaluation, e.g. to continue a
+                                checkpointed evaluation with a larger budget
         
         Returns:
-            accuracy (float): best accuracy reached in any
+            accuracy (float): best accuracy reached in any epoch
+            acc_log (list[tuple]): (epoch, validation accuracy) of each validation.
+                                Only returned if logging is True
+        """
+
+        accuracy, acc_log = self._test_autoaugment_policies(
+                                    [policy],
+                                    child_network_architecture,
+                                    train_dataset,
+                                    test_dataset,
+                                    logging=True,
+                                    print_every_epoch=print_every_epoch,
+                                    eval_ids=None if eval_id is None else [eval_id],
+                                    max_epochs=max_epochs)[0]
+
+        if logging:
+            return accuracy, acc_log
+        return accuracy
+
+
+    def _test_autoaugment_policies(self,
+                                policies,
+                                child_network_architecture,
+                                train_dataset,
+                                test_dataset,
+                                logging=False,
+                                print_every_epoch=True,
+                                eval_ids=None,
+                                max_epochs=None):
         """
+        Does what self._test_autoaugment_policy does for each of the policies,
+        letting self.evaluator decide how many of them are evaluated at once.
+        The results are recorded in self.history in the order of policies,
+        whichever evaluation finishes first.
+
+        Args:
+            policies (list): list of policies
+            eval_ids (list[str], optional): one eval_id per policy
+            see self._test_autoaugment_policy for the rest
 
-        # we create an instance of the child network that we're going
-        # to train. The method of creation depends on the type of 
-        # input we got for child_network_architecture
+        Returns:
+            list: the accuracy of each policy, or (accuracy, acc_log) of each
+                                policy if logging is True
+        """
+        if eval_ids is None:
+            eval_ids = [self._eval_id(self._new_id()) for _ in policies]
+        results = self._evaluate_policies(policies,
+                                        child_network_architecture,
+                                        train_dataset,
+                                        test_dataset,
+                                        print_every_epoch=print_every_epoch,
+                                        eval_ids=eval_ids,
+                                        max_epochs=max_epochs)
+
+        for policy, eval_id, (accuracy, acc_log) in zip(policies, eval_ids, results):
+            self._record_result(policy, accuracy, acc_log, eval_id=eval_id)
+
+        if logging:
+            return results
+        return [accuracy for accuracy, _ in results]
+
+
+    def _evaluate_policies(self,
+                        policies,
+                        child_network_architecture,
+                        train_dataset,
+                        test_dataset,
+                        print_every_epoch=True,
+                        eval_ids=None,
+                        max_epochs=None):
+        """
+        Does the training part of self._test_autoaugment_policies, without
+        recording anything in self.history or self.policy_record.
+
+        Returns:
+            list[tuple]: (accuracy, acc_log) of each policy
+        """
+        if len(policies) == 0:
+            return []
+
+        tasks = self._evaluation_tasks(policies,
+                                    child_network_architecture,
+                                    train_dataset,
+                                    test_dataset,
+                                    print_every_epoch=print_every_epoch,
+                                    eval_ids=eval_ids,
+                                    max_epochs=max_epochs)
+        return self.evaluator.evaluate(self,
+                                    tasks,
+                                    child_network_architecture,
+                                    train_dataset,
+                                    test_dataset)
+
+
+    def _evaluation_tasks(self,
+                        policies,
+                        child_network_architecture,
+                        train_dataset,
+                        test_dataset,
+                        print_every_epoch=True,
+                        eval_ids=None,
+                        max_epochs=None):
+        """
+        Returns the tasks (see Evaluator.evaluate) which evaluate policies,
+        after doing what all the evaluations share (auto-tuning the child
+        network training, and training the warm start state).
+        """
+        # things all evaluations share are done once, here, rather than in
+        # every worker of the evaluator
+        if self.auto_tune and self.autotune_result is None:
+            self._auto_tune(self._policy_transform(policies[0]),
+                            child_network_architecture,
+                            train_dataset)
+        if self.warm_start:
+            self._get_warm_start_state(child_network_architecture, train_dataset, test_dataset)
+
+        if eval_ids is None:
+            eval_ids = [self._eval_id(self._new_id()) for _ in policies]
+        tasks = [{'policy': policy,
+                    'eval_id': eval_id,
+                    'checkpoint_id': self._checkpoint_id(policy,
+                                                        eval_id,
+                                                        child_network_architecture),
+                    'max_epochs': max_epochs,
+                    'print_every_epoch': print_every_epoch}
+                    for policy, eval_id in zip(policies, eval_ids)]
+        return tasks
+
+
+    def _checkpoint_id(self, policy, eval_id, child_network_architecture):
+        """
+        Returns the id under which evaluation eval_id of policy keeps its
+        training state in self.checkpoint_store (None if there is no store).
+        Besides eval_id, it depends on this learner's run_id, the policy and
+        the parameters of the child network training except for the budget
+        (max_epochs), so that only a continuation of the same evaluation
+        resumes a checkpoint.
+        """
+        if self.checkpoint_store is None:
+            return None
+
+        config = tuple((key, getattr(self, key)) for key in (
+                    'batch_size', 'toy_size', 'learning_rate', 'early_stop_num',
+                    'warm_start', 'pretrain_epochs', 'fine_tune_epochs',
+                    'freeze_layers', 'val_ci', 'val_every', 'val_on_plateau'))
+        architecture = getattr(child_network_architecture, '__name__',
+                                type(child_network_architecture).__name__)
+        key = repr((self.run_id, eval_id, policy, architecture, config,
+                    self.quantized_validation is not None))
+        return f'{eval_id}-{hashlib.sha1(key.encode()).hexdigest()[:16]}'
+
+
+    def _child_training_config(self):
+        """
+        The attributes the child network training of self._evaluate_policy
+        depends on. Evaluators which train child networks in other processes
+        set these on their own learner.
+        """
+        return {key: getattr(self, key) for key in (
+                    'batch_size', 'toy_size', 'learning_rate', 'num_workers',
+                    'num_processes', 'max_epochs', 'early_stop_num', 
+                    'stopping_rule', 'checkpoint_store', 'warm_start',
+                    'pretrain_epochs', 'fine_tune_epochs', 'freeze_layers',
+                    '_warm_start_states', 'val_ci', 'val_every', 'val_on_plateau',
+                    'quantized_validation')}
+
+
+    def _make_child_network(self, child_network_architecture):
+        """
+        we create an instance of the child network that we're going
+        to train. The method of creation depends on the type of 
+        input we got for child_network_architecture
+        """
         if isinstance(child_network_architecture, types.FunctionType):
             child_network = child_network_architecture()
         elif isinstance(child_network_architecture, type):
@@ -380,48 +1077,228 @@ class AaLearner:
                             a <function> or a <torch.nn.Module>. Type of : ',
                             child_network_architecture, ': ' ,
                             type(child_network_architecture))
+        return child_network
+
+
+    def _evaluate_policy(self,
+                        policy,
+                        child_network_architecture,
+                        train_dataset,
+                        test_dataset,
+                        print_every_epoch=True,
+                        checkpoint_id=None,
+                        max_epochs=None,
+                        warm_start=None):
+        """
+        Does the training part of self._test_autoaugment_policy, without
+        recording anything in self.history or self.policy_record.
+
+        Args:
+            checkpoint_id (str, optional): id of the evaluation in 
+                                self.checkpoint_store (see self._checkpoint_id).
+                                Defaults to that of a new id if there is a
+                                store
+
+            see self._test_autoaugment_policy for the rest
+
+            warm_start (bool, optional): overrides self.warm_start for this
+                                evaluation
+
+        Returns:
+            accuracy (float): best accuracy reached in any epoch
+            acc_log (list[tuple]): (epoch, validation accuracy) of each validation
+        """
+        if warm_start is None:
+            warm_start = self.warm_start
+
+        child_network = self._make_child_network(child_network_architecture)
+
+        # the default budget of an evaluation, which is shorter if we start
+        # from a pretrained child network
+        if warm_start:
+            pretrained_state = self._get_warm_start_state(child_network_architecture,
+                                                        train_dataset,
+                                                        test_dataset)
+            child_network.load_state_dict(pretrained_state)
+            freeze_early_layers(child_network, self.freeze_layers)
+            default_max_epochs = self.fine_tune_epochs
+            # fine tuning has a fixed budget, so we do not early stop
+            early_stop_num = float('inf')
+        else:
+            default_max_epochs = self.max_epochs
+            early_stop_num = self.early_stop_num
+
+        train_transform = self._policy_transform(policy)
+        
+        if self.auto_tune and self.autotune_result is None:
+            self._auto_tune(train_transform, child_network_architecture, train_dataset)
+
+        # We feed the transformation into a view of the Dataset object, so
+        # that train_dataset itself can be shared by concurrent evaluations
+        train_view = transform_view(train_dataset, train_transform)
+
+        # create Dataloader objects out of the Dataset objects
+        train_loader, test_loader = create_toy(train_view,
+                                            test_dataset,
+                                            batch_size=self.batch_size,
+                                            n_samples=self.toy_size,
+                                            seed=100,
+                                            num_workers=self.num_workers)
         
+        # an evaluation we are not told the id of gets a new one, if it needs
+        # one at all: without a store, tasks have no checkpoint_id either
+        if checkpoint_id is None and self.checkpoint_store is not None:
+            checkpoint_id = self._checkpoint_id(policy,
+                                                self._eval_id(self._new_id()),
+                                                child_network_architecture)
+        if max_epochs is None:
+            max_epochs = default_max_epochs
+
+        train_kwargs = dict(max_epochs = max_epochs,
+                            early_stop_num = early_stop_num,
+                            print_every_epoch=print_every_epoch,
+                            stopping_rule=self.stopping_rule,
+                            val_subsample=self._get_val_subsample(test_dataset,
+                                                                test_loader),
+                            val_every=self.val_every,
+                            val_on_plateau=self.val_on_plateau,
+                            quantized_validation=self.quantized_validation)
+
+        # train the child network with the dataloaders equipped with our specific policy
+        if self.num_processes > 1:
+            accuracy, acc_log = train_child_network_distributed(
+                                        child_network,
+                                        train_loader.dataset,
+                                        test_loader.dataset,
+                                        num_processes=self.num_processes,
+                                        batch_size=self.batch_size,
+                                        learning_rate=self.learning_rate,
+                                        num_workers=self.num_workers,
+                                        **train_kwargs)
+        else:
+            accuracy, acc_log = train_child_network(child_network, 
+                                        train_loader, 
+                                        test_loader, 
+                                        sgd = optim.SGD([p for p in child_network.parameters()
+                                                            if p.requires_grad],
+                                                        lr=self.learning_rate),
+                                        # sgd = optim.Adadelta(
+                                        #               child_network.parameters(),
+                                        #               lr=self.learning_rate),
+                                        cost = nn.CrossEntropyLoss(),
+                                        logging = True,
+                                        checkpoint_store=self.checkpoint_store,
+                                        checkpoint_id=checkpoint_id,
+                                        **train_kwargs)
+        acc_log = [(epoch, float(acc)) for epoch, acc in acc_log]
+
+        return accuracy, acc_log
+
+
+    def _policy_transform(self, policy):
+        """
+        Returns the transform which augments images with policy (or with
+        RandAugment, if policy is a RandAugmentPolicy)
+        """
+        if isinstance(policy, RandAugmentPolicy):
+            return transforms.Compose([
+                                    RandAugment(num_ops=policy.num_ops,
+                                                magnitude=policy.magnitude,
+                                                num_magnitude_bins=policy.num_magnitude_bins),
+                                    transforms.ToTensor()
+                                ])
 
         # We need to define an object aa_transform which takes in the image and 
         # transforms it with the policy (specified in its .policies attribute)
         # in its forward pass
         aa_transform = AutoAugment()
         aa_transform.subpolicies = policy
-        train_transform = transforms.Compose([
-                                                aa_transform,
-                                                transforms.ToTensor()
-                                            ])
-        
-        # We feed the transformation into the Dataset object
-        train_dataset.transform = train_transform
+        return transforms.Compose([
+                                    aa_transform,
+                                    transforms.ToTensor()
+                                ])
 
-        # create Dataloader objects out of the Dataset objects
-        train_loader, test_loader = create_toy(train_dataset,
+
+    def _auto_tune(self, train_transform, child_network_architecture, train_dataset):
+        """
+        Sets self.batch_size, self.num_workers and the number of torch threads
+        to the fastest configuration autotune.autotune_loader_config finds,
+        using the policy of train_transform as the representative policy.
+        """
+        self.autotune_result = autotune_loader_config(
+                                        train_dataset,
+                                        self._make_child_network,
+                                        child_network_architecture,
+                                        train_transform,
+                                        max_batch_size=self.max_batch_size,
+                                        memory_limit=self.memory_limit,
+                                        learning_rate=self.learning_rate,
+                                        cache_path=self.autotune_cache)
+        self.batch_size = self.autotune_result['batch_size']
+        self.num_workers = self.autotune_result['num_workers']
+        torch.set_num_threads(self.autotune_result['num_threads'])
+
+
+    def _get_warm_start_state(self, child_network_architecture, train_dataset, test_dataset):
+        """
+        Returns the state dict of child_network_architecture pretrained on the
+        un-augmented toy dataset. The child network is only pretrained the 
+        first time this is called for child_network_architecture; after that the
+        cached state dict is returned.
+        """
+        if child_network_architecture not in self._warm_start_states:
+            child_network = self._make_child_network(child_network_architecture)
+            self._warm_start_states[child_network_architecture] = pretrain_child_network(
+                                            child_network,
+                                            train_dataset,
                                             test_dataset,
                                             batch_size=self.batch_size,
-                                            n_samples=self.toy_size,
-                                            seed=100)
-        
-        # train the child network with the dataloaders equipped with our specific policy
-        accuracy = train_child_network(child_network, 
-                                    train_loader, 
-                                    test_loader, 
-                                    sgd = optim.SGD(child_network.parameters(),
-                                                    lr=self.learning_rate),
-                                    # sgd = optim.Adadelta(
-                                    #               child_network.parameters(),
-                                    #               lr=self.learning_rate),
-                                    cost = nn.CrossEntropyLoss(),
-                                    max_epochs = self.max_epochs, 
-                                    early_stop_num = self.early_stop_num, 
-                                    logging = logging,
-                                    print_every_epoch=print_every_epoch)
+                                            toy_size=self.toy_size,
+                                            learning_rate=self.learning_rate,
+                                            max_epochs=self.pretrain_epochs,
+                                            early_stop_num=self.early_stop_num)
+
+        return self._warm_start_states[child_network_architecture]
 
 
+    def _get_val_subsample(self, test_dataset, test_loader):
+        """
+        Returns the validation.ValidationSubsample of the toy validation set
+        of test_dataset (which test_loader loads), or None if we validate on the
+        whole validation set. We only make one per test_dataset, so that all
+        evaluations use the same cached subsample.
+        """
+        if self.val_ci is None:
+            return None
+
+        # setdefault, so that evaluations running in threads at once all end
+        # up with the same subsample
+        if id(test_dataset) not in self._val_subsamples:
+            self._val_subsamples.setdefault(id(test_dataset), ValidationSubsample(
+                                                        test_loader.dataset,
+                                                        target_ci=self.val_ci,
+                                                        batch_size=self.batch_size))
+        return self._val_subsamples[id(test_dataset)]
+
+
+    def _record_result(self, policy, accuracy, acc_log, eval_id=None):
+        """
+        Adds the result of evaluating policy to self.history, 
+        self.policy_record and self.learning_curves, under the key eval_id in
+        self.policy_record (by default, a new one, see self._new_id). If eval_id already
+        has a result (e.g. the evaluation was resumed from its checkpoint with
+        a larger budget), the new result replaces it.
+        """
+
         # turn policy into dictionary format and add it into self.policy_record
-        curr_pol = f'pol{self.num_pols_tested}'
+        curr_pol = self._eval_id(self._new_id()) if eval_id is None else eval_id
         pol_dict = {}
-        for subpol in policy:
+        # a RandAugmentPolicy has no subpolicies
+        if isinstance(policy, RandAugmentPolicy):
+            policy_components = []
+        else:
+            policy_components = policy
+        for subpol in policy_components:
             first_trans, first_prob, first_mag = subpol[0]
             second_trans, second_prob, second_mag = subpol[1]
             components = (first_prob, first_mag, second_prob, second_mag)
@@ -434,9 +1311,29 @@ class AaLearner:
                 pol_dict[first_trans]= {second_trans: [components]}
         self.policy_record[curr_pol] = (pol_dict, accuracy)
 
+        if curr_pol in self._record_idx:
+            idx = self._record_idx[curr_pol]
+            self.history[idx] = (policy, accuracy)
+            self.learning_curves[idx] = acc_log
+            return
+
+        self._record_idx[curr_pol] = len(self.history)
         self.num_pols_tested += 1
         self.history.append((policy,accuracy))
-        return accuracy
+        self.learning_curves.append(acc_log)
+
+
+    def get_compute_saved(self):
+        """
+        Reports how much child network training self.stopping_rule has saved
+
+        Returns:
+            dict: see ``stopping_rules.MedianStoppingRule.get_compute_saved``,
+                    or None if this learner has no stopping rule
+        """
+        if self.stopping_rule is None:
+            return None
+        return self.stopping_rule.get_compute_saved()
     
 
     def get_mega_policy(self, number_policies=5):
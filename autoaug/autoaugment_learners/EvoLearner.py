@@ -1,3 +1,6 @@
+import copy
+
+import numpy as np
 import torch
 import torch.nn as nn
 import pygad
@@ -6,9 +9,15 @@ import torchvision
 import torch
 
 from autoaug.autoaugment_learners.AaLearner import AaLearner
+from autoaug.dataset_views import transform_view
 import autoaug.controller_networks as cont_n
 
 
+# torch.func (vmap over the weights of a module) is new in torch 2.0. With
+# older versions, the controllers of a population are run one at a time
+_HAS_TORCH_FUNC = hasattr(torch, 'func')
+
+
 class EvoLearner(AaLearner):
     """Evolutionary Strategy learner
     
@@ -51,11 +60,26 @@ class EvoLearner(AaLearner):
         controller (nn.Module, optional): Controller network for the evolutionary 
                             algorithm. Defaults to cont_n.EvoController
 
+        cache_fitness (bool, optional): whether solutions whose subpolicy has
+                            already been evaluated get its accuracy instead of
+                            training another child network. Defaults to True.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
+
 
     Notes
     -----
     The Evolutionary algorithm runs in generations, and so batches of child networks
-    are trained at specific time intervals.
+    are trained at specific time intervals. All the solutions of a generation
+    are proposed at once, so with an evaluator with num_solutions workers
+    (e.g. ``ProcessPoolEvaluator(num_workers=num_solutions)``, which sends the
+    datasets to each worker process once) a generation takes the wall-time
+    of training one child network.
+
+    Many solutions of a generation often select the same subpolicy. Each
+    distinct subpolicy is only evaluated once: the other solutions get its
+    accuracy (see cache_fitness).
 
 
     Examples
@@ -80,7 +104,9 @@ class EvoLearner(AaLearner):
                 # evolutionary learner specific settings
                 num_solutions=5,
                 num_parents_mating=3,
-                controller=cont_n.EvoController
+                controller=cont_n.EvoController,
+                cache_fitness=True,
+                **kwargs,
                 ):
         super().__init__(
                     num_sub_policies=num_sub_policies, 
@@ -92,7 +118,8 @@ class EvoLearner(AaLearner):
                     learning_rate=learning_rate,
                     max_epochs=max_epochs,
                     early_stop_num=early_stop_num,
-                    exclude_method=exclude_method
+                    exclude_method=exclude_method,
+                    **kwargs,
                     )
 
         self.controller = controller(
@@ -109,11 +136,41 @@ class EvoLearner(AaLearner):
         self.num_parents_mating = num_parents_mating
         self.initial_population = self.torch_ga.population_weights
 
-        # store our logs
-        self.policy_dict = {}
+        # the current generation, and the fitness of each of its solutions as
+        # they are observed
+        self.population = np.array(self.initial_population)
+        self.fitness = [None]*num_solutions
+        self._generation_policies = None
+        self._solutions_to_propose = []
+        self.generations_completed = 0
+        self.best_solution = None
+        # the last completed generation and its fitness, and the solutions
+        # of other islands which join the next generation
+        self.last_generation = None
+        self.immigrants = []
+
+        # accuracies of the subpolicies evaluated so far, and the solutions
+        # waiting for the accuracy of a subpolicy which is being evaluated
+        self.cache_fitness = cache_fitness
+        self.fitness_cache = {}
+        self._waiting_solutions = {}
+
+        # only used for its selection, crossover and mutation operators: we
+        # run the generations ourselves, so that the solutions of a
+        # generation can be evaluated in parallel
+        self.ga_instance = pygad.GA(num_generations=1,
+                num_parents_mating=self.num_parents_mating,
+                initial_population=self.population,
+                mutation_percent_genes = 0.1,
+                fitness_func=lambda ga_instance, solution, sol_idx: 0)
 
+        # store our logs
         self.running_policy = []
-        self.first_run = True 
+        self.history_best = []
+
+        # input of the controller, see self.set_controller_input
+        self.controller_input = None
+        self._controller_input_dataset = None
 
         self.fun_num = len(self.augmentation_space)
         # evolutionary algorithm settings
@@ -141,66 +198,119 @@ class EvoLearner(AaLearner):
             Subpolicy consisting of two tuples of policies, each with a string associated 
             to a transformation, a float for a probability, and a float for a magnittude
         """
-        section = self.fun_num + self.p_bins + self.m_bins
-
         y = self.controller.forward(x)
+        return self._select_subpolicies(y.unsqueeze(0), alpha=alpha)[0]
 
-        y_1 = torch.softmax(y[:,:self.fun_num], dim = 1) 
-        y[:,:self.fun_num] = y_1
-        y_2 = torch.softmax(y[:,section:section+self.fun_num], dim = 1)
-        y[:,section:section+self.fun_num] = y_2
-        concat = torch.cat((y_1, y_2), dim = 1)
-
-        cov_mat = torch.cov(concat.T)
-        cov_mat = cov_mat[:self.fun_num, self.fun_num:]
-        shape_store = cov_mat.shape
 
-        counter, prob1, prob2, mag1, mag2 = (0, 0, 0, 0, 0)
+    def _get_population_policies(self, population, x, alpha = 0.5):
+        """
+        Does what self._get_single_policy_cov does for every solution of
+        population at once: the controllers of all the solutions are run in
+        one batched forward (torch.func.vmap over their weights) and their
+        subpolicies selected with tensor operations. Without torch.func
+        (torch < 2.0), the controllers are run one after the other instead.
 
+        Parameters
+        ------------
+        population -> numpy array of shape (num_solutions, num_weights)
+            Weight vectors of controllers, as pygad stores them
 
-        prob_mat = torch.zeros(shape_store)
-        for idx in range(y.shape[0]):
-            prob_mat[torch.argmax(y_1[idx])][torch.argmax(y_2[idx])] += 1
-        prob_mat = prob_mat / torch.sum(prob_mat)
+        x -> PyTorch Tensor
+            Input data for the AutoAugment network 
 
-        cov_mat = (alpha * cov_mat) + ((1 - alpha)*prob_mat)
+        Returns
+        -----------
+        list of one subpolicy per solution
+        """
+        if not _HAS_TORCH_FUNC:
+            # a copy, so that self.controller keeps its own weights
+            controller = copy.deepcopy(self.controller)
+            y = []
+            with torch.no_grad():
+                for solution in population:
+                    controller.load_state_dict(
+                            torchga.model_weights_as_dict(model=controller,
+                                                        weights_vector=solution))
+                    y.append(controller(x))
+            return self._select_subpolicies(torch.stack(y), alpha=alpha)
+
+        weights = torch.as_tensor(population, dtype=torch.float32)
+
+        # the weight vectors of all the solutions, cut into the controller's
+        # parameters (in the order pygad.torchga uses)
+        params = {}
+        start = 0
+        for name, tensor in self.controller.state_dict().items():
+            params[name] = weights[:, start:start + tensor.numel()].reshape(-1, *tensor.shape)
+            start += tensor.numel()
+
+        def _forward(solution_params):
+            return torch.func.functional_call(self.controller, solution_params, (x,))
+
+        with torch.no_grad():
+            y = torch.func.vmap(_forward)(params)
+        return self._select_subpolicies(y, alpha=alpha)
+
+
+    def _select_subpolicies(self, y, alpha = 0.5):
+        """
+        Selects a subpolicy for each solution from the outputs y of its
+        controller, of shape (num_solutions, batch_size, output_size). 
+        
+        For each solution, we choose the pair of transformations (one from
+        each half of the output) with the highest mix of covariance and 
+        co-occurence (of being the argmax of the same image), and average
+        the probabilities and magnitudes of the images which chose that pair.
+        """
+        section = self.fun_num + self.p_bins + self.m_bins
+        num_images = y.shape[1]
 
-        cov_mat = torch.reshape(cov_mat, (1, -1)).squeeze()
-        max_idx = torch.argmax(cov_mat)
-        val = (max_idx//shape_store[0])
-        max_idx = (val, max_idx - (val * shape_store[0]))
+        y_1 = torch.softmax(y[..., :self.fun_num], dim=-1)
+        y_2 = torch.softmax(y[..., section:section+self.fun_num], dim=-1)
 
+        # the covariance between the two halves of each solution's output
+        y_1_centered = y_1 - y_1.mean(dim=1, keepdim=True)
+        y_2_centered = y_2 - y_2.mean(dim=1, keepdim=True)
+        cov_mat = y_1_centered.transpose(1, 2) @ y_2_centered / (num_images - 1)
 
-        if not self.augmentation_space[max_idx[0]][1]:
-            mag1 = None
-        if not self.augmentation_space[max_idx[1]][1]:
-            mag2 = None
-    
-        for idx in range(y.shape[0]):
-            if (torch.argmax(y_1[idx]) == max_idx[0]) and (torch.argmax(y_2[idx]) == max_idx[1]):
-                prob1 += torch.sigmoid(y[idx, self.fun_num]).item()
-                prob2 += torch.sigmoid(y[idx, section+self.fun_num]).item()
-                if mag1 is not None:
-                    mag1 += min(9, 10 * torch.sigmoid(y[idx, self.fun_num+1]).item())
-                if mag2 is not None:
-                    mag2 += min(9, 10 * torch.sigmoid(y[idx, self.fun_num+1]).item())
-
-                counter += 1
-
-        prob1 = round(prob1/counter, 1) if counter != 0 else 0
-        prob2 = round(prob2/counter, 1) if counter != 0 else 0
-        if mag1 is not None:
-            mag1 = int(mag1/counter)
-        if mag2 is not None:
-            mag2 = int(mag2/counter)  
+        # how often each pair of transformations is the argmax of an image
+        choice_1 = torch.argmax(y_1, dim=-1)
+        choice_2 = torch.argmax(y_2, dim=-1)
+        one_hot_1 = nn.functional.one_hot(choice_1, self.fun_num).float()
+        one_hot_2 = nn.functional.one_hot(choice_2, self.fun_num).float()
+        prob_mat = one_hot_1.transpose(1, 2) @ one_hot_2 / num_images
 
-        
-        return [((self.augmentation_space[max_idx[0]][0], prob1, mag1), (self.augmentation_space[max_idx[1]][0], prob2, mag2))]
+        cov_mat = (alpha * cov_mat) + ((1 - alpha)*prob_mat)
+        max_idx = torch.argmax(cov_mat.flatten(start_dim=1), dim=1)
+        trans_1 = max_idx // self.fun_num
+        trans_2 = max_idx % self.fun_num
+
+        # average the probabilities and magnitudes over the images which chose
+        # the selected pair (summed in double precision, like python floats)
+        chosen = ((choice_1 == trans_1[:, None]) & (choice_2 == trans_2[:, None])).double()
+        counter = chosen.sum(dim=1)
+        prob1 = (torch.sigmoid(y[..., self.fun_num]).double() * chosen).sum(dim=1)
+        prob2 = (torch.sigmoid(y[..., section+self.fun_num]).double() * chosen).sum(dim=1)
+        mag = ((10 * torch.sigmoid(y[..., self.fun_num+1]).double()).clamp(max=9) * chosen).sum(dim=1)
+
+        subpolicies = []
+        for trans_1_idx, trans_2_idx, count, p1, p2, m in zip(trans_1.tolist(), trans_2.tolist(),
+                                                            counter.tolist(), prob1.tolist(),
+                                                            prob2.tolist(), mag.tolist()):
+            p1 = round(p1/count, 1) if count != 0 else 0
+            p2 = round(p2/count, 1) if count != 0 else 0
+            m = int(m/count) if count != 0 else 0
+            mag1 = m if self.augmentation_space[trans_1_idx][1] else None
+            mag2 = m if self.augmentation_space[trans_2_idx][1] else None
+            subpolicies.append([((self.augmentation_space[trans_1_idx][0], p1, mag1),
+                                (self.augmentation_space[trans_2_idx][0], p2, mag2))])
+        return subpolicies
 
 
     def learn(self, train_dataset, test_dataset, child_network_architecture, iterations = 15, return_weights = False):
         """
-        Runs the GA instance and returns the model weights as a dictionary
+        Runs ``iterations`` generations of the genetic algorithm and returns
+        the best solution
 
         Parameters
         ------------
@@ -219,147 +329,188 @@ class EvoLearner(AaLearner):
 
             Solution_idx -> int
         """
-
-        self.num_generations = iterations
-        self.history_best = []
-
-        self._set_up_instance(train_dataset, test_dataset, child_network_architecture)
-
-        self.ga_instance.run()
-
-        solution, solution_fitness, solution_idx = self.ga_instance.best_solution()
+        self.set_controller_input(train_dataset)
+        self.early_stop_num = 10
+
+        # solutions answered from the fitness cache are not evaluated, so we
+        # count generations rather than evaluations
+        last_generation = self.generations_completed + iterations
+        while self.generations_completed < last_generation:
+            if self._generation_policies is None:
+                self._start_generation()
+            self._run_search(train_dataset,
+                            test_dataset,
+                            child_network_architecture,
+                            len(self._solutions_to_propose))
+
+        solution, solution_fitness, solution_idx = self.best_solution
         if return_weights:
             return torchga.model_weights_as_dict(model=self.controller, weights_vector=solution)
         else:
             return solution, solution_fitness, solution_idx
 
 
-    def _in_pol_dict(self, new_policy):
+    def set_controller_input(self, train_dataset):
         """
-        Checks if a potential subpolicy has already been testing by the agent
-
-        Parameters
-        ------------
-        new_policy -> subpolicy
-
-        Returns
-        ------------
-        if subpolicy has been tested:
-            -> True 
-        else: 
-            -> False
-
-        
+        Sets the images the controller networks compute their subpolicies
+        from (the first 500 images of train_dataset). learn calls this; call
+        it yourself before using self.propose.
         """
-        new_policy = new_policy[0]
-        trans1, trans2 = new_policy[0][0], new_policy[1][0]
-        new_set = {new_policy[0][1], new_policy[0][2], new_policy[1][1], new_policy[1][2]}
-        if trans1 in self.policy_dict:
-            if trans2 in self.policy_dict[trans1]:
-                for test_pol in self.policy_dict[trans1][trans2]:
-                    if new_set == test_pol:
-                        return True
-                self.policy_dict[trans1][trans2].append(new_set)
-            else:
-                self.policy_dict[trans1] = {trans2: [new_set]}
-        return False
+        if train_dataset is self._controller_input_dataset:
+            return
+        train_loader = torch.utils.data.DataLoader(
+                                    transform_view(train_dataset,
+                                                torchvision.transforms.ToTensor()),
+                                    batch_size=500)
+        self.controller_input, _ = next(iter(train_loader))
+        self._controller_input_dataset = train_dataset
 
 
-    def _set_up_instance(self, train_dataset, test_dataset, child_network_architecture):
+    def _propose_policy(self):
         """
-        Initialises GA instance, as well as the fitness and 'on generation' functions
-        
+        Proposes the subpolicy of the next solution (controller network) of
+        the current generation. The next generation is bred once the whole
+        current generation has been observed.
         """
+        if self._generation_policies is None:
+            self._start_generation()
+        if not self._solutions_to_propose:
+            return None
 
-        def _fitness_func(solution, sol_idx):
-            """
-            Defines the fitness function for the parent selection
+        sol_idx = self._solutions_to_propose.pop(0)
+        sub_pol = self._generation_policies[sol_idx]
+        print("subpol: ", sub_pol)
 
-            Parameters
-            --------------
-            solution -> GA solution instance (parsed automatically)
+        return sub_pol, sol_idx
 
-            sol_idx -> GA solution index (parsed automatically)
 
-            Returns 
-            --------------
-            fit_val -> float            
-            """
+    def _start_generation(self):
+        """
+        Computes the subpolicies of the current generation and decides which
+        solutions have to be evaluated. 
+        
+        With self.cache_fitness, solutions whose subpolicy has already been
+        evaluated get its accuracy straight away, and only the first of the
+        solutions sharing a new subpolicy is proposed: the others get its
+        accuracy when it is observed.
+        """
+        if self.controller_input is None:
+            raise RuntimeError('call set_controller_input before proposing policies')
+
+        # the subpolicies of the whole generation come from one batched forward
+        self._generation_policies = self._get_population_policies(self.population,
+                                                                self.controller_input)
+        if not self.cache_fitness:
+            self._solutions_to_propose = list(range(self.num_solutions))
+            return
 
-            model_weights_dict = torchga.model_weights_as_dict(model=self.controller,
-                                                            weights_vector=solution)
+        cached = []
+        for sol_idx, sub_pol in enumerate(self._generation_policies):
+            key = tuple(sub_pol)
+            if key in self._waiting_solutions:
+                self._waiting_solutions[key].append(sol_idx)
+            elif key in self.fitness_cache:
+                cached.append(sol_idx)
+            else:
+                self._waiting_solutions[key] = []
+                self._solutions_to_propose.append(sol_idx)
 
-            self.controller.load_state_dict(model_weights_dict)
-            train_dataset.transform = torchvision.transforms.ToTensor()
-            self.train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=500)
-            count = 0
+        # a generation made only of known subpolicies evaluates one of them
+        # again, so that every generation is observed through an evaluation
+        if not self._solutions_to_propose:
+            key = tuple(self._generation_policies[cached[0]])
+            self._solutions_to_propose.append(cached[0])
+            self._waiting_solutions[key] = [sol_idx for sol_idx in cached[1:]
+                                            if tuple(self._generation_policies[sol_idx]) == key]
+            cached = [sol_idx for sol_idx in cached
+                        if tuple(self._generation_policies[sol_idx]) != key]
 
-            new_pol = True
-            for idx, (test_x, label_x) in enumerate(self.train_loader):
-                count += 1
-                sub_pol = self._get_single_policy_cov(test_x)
-                print("subpol: ", sub_pol)
+        for sol_idx in cached:
+            sub_pol = self._generation_policies[sol_idx]
+            print("subpol (cached): ", sub_pol)
+            self._set_fitness(sub_pol, self.fitness_cache[tuple(sub_pol)], sol_idx)
 
 
-                if idx == 0:
-                    break
+    def _observe_policy(self, sub_pol, fit_val, sol_idx):
+        print("fit_val: ", fit_val)
+        key = tuple(sub_pol)
+        if self.cache_fitness:
+            self.fitness_cache[key] = fit_val
 
-            print("start test")
-            self.print_every_epoch = True 
-            self.early_stop_num = 10
-            if new_pol:
-                fit_val = self._test_autoaugment_policy(sub_pol,child_network_architecture,train_dataset,test_dataset)
-            print("fit_val: ", fit_val)
-            print("end test")
+        for idx in [sol_idx] + self._waiting_solutions.pop(key, []):
+            self._set_fitness(sub_pol, fit_val, idx)
 
+        if all(fitness is not None for fitness in self.fitness):
+            self._next_generation()
 
-            self.running_policy.append((sub_pol, fit_val))
 
-            if len(self.running_policy) > self.num_sub_policies:
-                self.running_policy = sorted(self.running_policy, key=lambda x: x[1], reverse=True)
-                self.running_policy = self.running_policy[:self.num_sub_policies]
+    def _set_fitness(self, sub_pol, fit_val, sol_idx):
+        self.fitness[sol_idx] = fit_val
 
+        self.running_policy.append((sub_pol, fit_val))
 
-            if len(self.history_best) == 0:
-                self.history_best.append(fit_val)
-                self.new_pop = self.torch_ga.population_weights
-            elif fit_val > self.history_best[-1]:
-                self.history_best.append(fit_val) 
-                self.new_pop = self.torch_ga.population_weights
-            else:
-                self.history_best.append(self.history_best[-1])
-            self.first_run = False
+        if len(self.running_policy) > self.num_sub_policies:
+            self.running_policy = sorted(self.running_policy, key=lambda x: x[1], reverse=True)
+            self.running_policy = self.running_policy[:self.num_sub_policies]
 
-            return fit_val
+        if len(self.history_best) == 0 or fit_val > self.history_best[-1]:
+            self.history_best.append(fit_val)
+        else:
+            self.history_best.append(self.history_best[-1])
 
-        def _on_generation(ga_instance):
-            """
-            Prints information of generation's fitness
+        if self.best_solution is None or fit_val > self.best_solution[1]:
+            self.best_solution = (self.population[sol_idx].copy(), fit_val, sol_idx)
 
-            Parameters 
-            -------------
-            ga_instance -> GA instance
 
-            Returns
-            -------------
-            None
-            """
-            print("Generation = {generation}".format(generation=ga_instance.generations_completed))
-            print("Fitness    = {fitness}".format(fitness=ga_instance.best_solution()[1]))
-            return
+    def _next_generation(self):
+        """
+        Breeds the next generation from the current (fully evaluated) one with
+        pygad's steady state selection, single point crossover and random
+        mutation. As with pygad's default keep_elitism=1, the best solution
+        is kept and the offspring replace all the others
+        """
+        fitness = np.array(self.fitness)
+        self.generations_completed += 1
+        print("Generation = {generation}".format(generation=self.generations_completed))
+        print("Fitness    = {fitness}".format(fitness=fitness.max()))
+
+        self.ga_instance.population = self.population
+        parents = self.ga_instance.steady_state_selection(fitness, self.num_parents_mating)
+        # pygad >= 3.0 also returns the indices of the parents
+        if isinstance(parents, tuple):
+            parents = parents[0]
+
+        elite = self.population[np.argsort(-fitness, kind='stable')[:1]]
+        offspring_size = (self.num_solutions - len(elite), self.population.shape[1])
+        offspring = self.ga_instance.single_point_crossover(parents, offspring_size)
+        offspring = self.ga_instance.random_mutation(offspring)
+
+        # immigrants (see self.add_migrants) take the place of offspring
+        immigrants = self.immigrants[:len(offspring)]
+        if len(immigrants) > 0:
+            offspring[len(offspring)-len(immigrants):] = immigrants
+        self.immigrants = []
+
+        self.last_generation = (self.population, fitness)
+        self.population = np.concatenate((elite, offspring))
+        self.fitness = [None]*self.num_solutions
+        self._generation_policies = None
+
+
+    def get_migrants(self, n):
+        """
+        Returns the weight vectors of the n best solutions of the last
+        completed generation
+        """
+        if self.last_generation is None:
+            return []
+        population, fitness = self.last_generation
+        return [population[idx].copy() for idx in np.argsort(-fitness, kind='stable')[:n]]
 
-        if self.first_run:
 
-            self.ga_instance = pygad.GA(num_generations=self.num_generations, 
-                num_parents_mating=self.num_parents_mating, 
-                initial_population=self.initial_population,
-                mutation_percent_genes = 0.1,
-                fitness_func=_fitness_func,
-                on_generation = _on_generation)
-        else:
-            self.ga_instance = pygad.GA(num_generations=self.num_generations, 
-                num_parents_mating=self.num_parents_mating, 
-                initial_population=self.new_pop,
-                mutation_percent_genes = 0.1,
-                fitness_func=_fitness_func,
-                on_generation = _on_generation)           
+    def add_migrants(self, migrants):
+        """
+        Makes the solutions migrants (weight vectors) part of the next
+        generation, in place of some of its offspring
+        """
+        self.immigrants += [np.asarray(migrant) for migrant in migrants]
@@ -1,14 +1,19 @@
-import torch
+import bisect
+
+import numpy as np
 
-import autoaug.child_networks as cn
 from autoaug.autoaugment_learners.AaLearner import AaLearner
-import random
-from pprint import pprint
 
 
 class GenLearner(AaLearner):
     """Genetic Algorithm learner
-    
+
+    Subpolicies are encoded as genomes of 6 int8 genes: the image function,
+    probability bin and magnitude bin of each of their two operations.
+    Children are bred from pairs of tested subpolicies chosen in proportion
+    to their accuracies, by crossover and mutation of the genomes, for a
+    whole batch of candidate children at once. A hashed set of the genomes
+    proposed so far keeps the learner from proposing a subpolicy twice.
 
     Args:
         num_sub_policies (int, optional): number of subpolicies per policy. Defaults to 5.
@@ -34,7 +39,39 @@ class GenLearner(AaLearner):
         toy_size (int, optional): child_network training parameter. ratio of original
                             dataset used in toy dataset. Defaults to 0.1.
 
-        num_offsprings (int, optional): Defaults to 1
+        num_offspring (int, optional): number of random subpolicies tested before
+                        children are bred (at least 2). Defaults to 2.
+
+        mutation_rate (float, optional): probability with which each gene of a
+                        child is replaced by a random value. Defaults to 0.1.
+
+        num_candidates (int, optional): number of children bred at a time, of
+                        which the first one not proposed before is proposed.
+                        Defaults to 64.
+
+        elite_size (int, optional): number of the best subpolicies tested so
+                        far which parents are chosen from. Defaults to None
+                        (all of them).
+
+        steady_state (bool, optional): If True, learn evaluates policies
+                        asynchronously, breeding a child whenever a worker of
+                        the evaluator frees up (see Notes). Defaults to False.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
+
+
+    Notes
+    -----
+    The learner has no generations: every child is bred from the subpolicies
+    tested so far, kept ranked by accuracy as results arrive. With
+    ``steady_state=True`` and an evaluator whose submit method runs in the
+    background (e.g. ``ThreadPoolEvaluator(num_workers=N)``), a child is
+    bred and dispatched as soon as one of the N workers is free, and its
+    result joins the ranking when it arrives. No worker waits for the
+    slowest evaluation of a batch, and random subpolicies are proposed until
+    there are enough results to breed from, so the workers are busy from the
+    start.
     
 
     Examples
@@ -58,6 +95,11 @@ class GenLearner(AaLearner):
                 toy_size=1,
                 # GenLearner specific settings
                 num_offspring=2, 
+                mutation_rate=0.1,
+                num_candidates=64,
+                elite_size=None,
+                steady_state=False,
+                **kwargs,
                 ):
 
         super().__init__(
@@ -70,240 +112,211 @@ class GenLearner(AaLearner):
                     learning_rate=learning_rate,
                     max_epochs=max_epochs,
                     early_stop_num=early_stop_num,
-                    exclude_method=exclude_method
+                    exclude_method=exclude_method,
+                    **kwargs,
                     )
 
-        self.bin_to_aug =  {}
-        for idx, augmentation in enumerate(self.augmentation_space):
-            bin_rep = '{0:b}'.format(idx)
-            while len(bin_rep) < len('{0:b}'.format(len(self.augmentation_space))):
-                bin_rep = '0' + bin_rep
-            self.bin_to_aug[bin_rep] = augmentation[0]
-
-        self.just_augs = [x[0] for x in self.augmentation_space]
-    
-        self.mag_to_bin = {
-            '0': "0000",
-            '1': '0001',
-            '2': '0010',
-            '3': '0011',
-            '4': '0100',
-            '5': '0101',
-            '6': '0110',
-            '7': '0111',
-            '8' : '1000',
-            '9': '1001',
-            '10': '1010',
-        }
-
-        self.prob_to_bin = {
-            '0': "0000",
-            '0.0' : '0000',
-            '0.1': '0001',
-            '0.2': '0010',
-            '0.3': '0011',
-            '0.4': '0100',
-            '0.5': '0101',
-            '0.6': '0110',
-            '0.7': '0111',
-            '0.8' : '1000',
-            '0.9': '1001',
-            '1.0': '1010',
-            '1' : '1010',
-        }
-
-        self.bin_to_prob = dict((value, key) for key, value in self.prob_to_bin.items())
-        self.bin_to_mag = dict((value, key) for key, value in self.mag_to_bin.items())
-        self.aug_to_bin = dict((value, key) for key, value in self.bin_to_aug.items())
-
-        self.num_offspring = num_offspring
-        self.pol_dict = {}
-
-
-    def _gen_random_subpol(self):
+        # a subpolicy is a genome of 6 genes: the indices of the image
+        # function, probability bin and magnitude bin of its two operations
+        self._gene_high = np.array([self.fun_num, self.p_bins, self.m_bins]*2)
+        assert self._gene_high.max() <= np.iinfo(np.int8).max, 'too many bins for int8 genes'
+        self._has_magnitude = np.array([has_magnitude for _, has_magnitude
+                                        in self.augmentation_space])
+        self._function_idx = {function: idx for idx, (function, _)
+                                in enumerate(self.augmentation_space)}
+        # genomes as integers in mixed radix, for the visited set
+        self._gene_radix = np.cumprod(np.concatenate(([1], self._gene_high[:-1]))).astype(np.int64)
+
+        # we need two different parents to breed a child
+        self.num_offspring = max(num_offspring, 2)
+        self.mutation_rate = mutation_rate
+        self.num_candidates = num_candidates
+        self.elite_size = elite_size
+        self.steady_state = steady_state
+
+        # the genomes we have tested and their accuracies, and the genomes
+        # we have proposed so far
+        self.population = np.empty((0, 6), dtype=np.int8)
+        self.population_fitness = np.empty(0)
+        self.visited = set()
+        # (-accuracy, index into self.population), sorted as results arrive
+        self.ranking = []
+
+
+    def _canonical(self, genomes):
+        """
+        Sets the magnitude gene of operations whose image function has no
+        magnitude to 0, so that genomes of the same subpolicy are equal
         """
-        Generates a random subpolicy using the reduced augmentation_space
+        genomes = genomes.astype(np.int8)
+        genomes[:, [2, 5]] *= self._has_magnitude[genomes[:, [0, 3]]]
+        return genomes
 
-        Returns
-        --------
-        subpolicy -> ((transformation, probability, magnitude), (trans., prob., mag.))
+
+    def _random_genomes(self, n):
         """
-        choose_items = [x[0] for x in self.augmentation_space]
-        trans1 = str(random.choice(choose_items))
-        trans2 = str(random.choice(choose_items))
-        prob1 = float(random.randrange(0, 11, 1) / 10)
-        prob2 = float(random.randrange(0, 11, 1) / 10)
-
-        if self.aug_space_dict[trans1]:
-            mag1 = int(random.randrange(0, 10, 1))
-        else:
-            mag1 = None
+        Returns n random genomes, an int8 array of shape (n, 6)
+        """
+        return self._canonical(np.random.randint(0, self._gene_high, size=(n, 6)))
 
-        if self.aug_space_dict[trans2]:
-            mag2 = int(random.randrange(0, 10, 1))
-        else:
-            mag2 = None
 
-        subpol = ((trans1, prob1, mag1), (trans2, prob2, mag2))
-        return subpol
+    def _genome_codes(self, genomes):
+        """
+        Returns the genomes (of shape (n, 6)) as n distinct integers
+        """
+        return genomes.astype(np.int64) @ self._gene_radix
 
 
-    def _gen_random_policy(self):
+    def _genome_to_policy(self, genome):
         """
-        Generates a random policy, consisting of num_sub_policies subpolicies
+        Converts a genome to a policy made of its subpolicy
 
         Returns
-        ------------
-        policy -> [subpolicy, subpolicy, ...]
+        -----------
+        policy -> [((transformation, probability, magnitude), (trans., prob., mag.))]
         """
-        pol = []
-        for _ in range(self.num_sub_policies):
-            pol.append(self._gen_random_subpol())
-        return pol
+        operations = self._indices_to_operations(genome.reshape(2, 3).tolist())
+        return self._operations_to_policy(operations)
 
-    
-    def _bin_to_subpol(self, subpol_bin):
+
+    def _policy_to_genome(self, policy):
+        """
+        Converts a policy made of one subpolicy to a genome, or returns None
+        if one of its image functions is not in our augmentation space
         """
-        Converts a binary string representation of a subpolicy to a subpolicy
+        genes = []
+        for function, prob, mag in policy[0]:
+            if function not in self._function_idx:
+                return None
+            genes += [self._function_idx[function], round(prob*(self.p_bins-1)),
+                    0 if mag is None else mag]
+        return self._canonical(np.array([genes]))[0]
 
-        Parameters
-        ------------
-        subpol_bin -> str
-            Binary representation of a subpolicy
 
-        
+    def _select_parents(self, n):
+        """
+        Chooses n pairs of parents from the elite (the best elite_size
+        genomes of the population), with probabilities proportional to their
+        accuracies
+
         Returns
-        -----------
-        policy -> [(subpolicy)]
+        ------------
+        parents -> int array of shape (n, 2), indices into self.population
         """
-        pol = []
-        for idx in range(2):
+        elite = np.array([idx for _, idx in self.ranking[:self.elite_size]])
+        weights = self.population_fitness[elite]
+        p = weights/weights.sum() if weights.sum() > 0 else None
+        parents = np.random.choice(len(elite), size=(n, 2), p=p)
 
-            if subpol_bin[idx*12:(idx*12)+4] in self.bin_to_aug:
-                trans = self.bin_to_aug[subpol_bin[idx*12:(idx*12)+4]]
-            else:
-                trans = random.choice(self.just_augs)
+        # the two parents of a child should be different
+        for _ in range(10):
+            same = parents[:, 0] == parents[:, 1]
+            if not same.any():
+                break
+            parents[same, 1] = np.random.choice(len(elite), size=same.sum(), p=p)
+        return elite[parents]
 
-            mag_is_none = not self.aug_space_dict[trans]
 
-            if subpol_bin[(idx*12)+4: (idx*12)+8] in self.bin_to_prob:
-                prob = float(self.bin_to_prob[subpol_bin[(idx*12)+4: (idx*12)+8]])
-            else:
-                prob = float(random.randrange(0, 11, 1) / 10)
+    def _crossover(self, parents1, parents2):
+        """
+        Single point crossover within each operation: a child takes the first
+        one or two genes of each of its operations from its first parent and
+        the rest from its second parent
+        """
+        n = len(parents1)
+        cuts = np.random.randint(1, 3, size=(n, 2, 1))
+        from_first = (np.arange(3) < cuts).reshape(n, 6)
+        return np.where(from_first, parents1, parents2)
 
-            if subpol_bin[(idx*12)+8:(idx*12)+12] in self.bin_to_mag:
-                mag = int(self.bin_to_mag[subpol_bin[(idx*12)+8:(idx*12)+12]])
-            else:
-                mag = int(random.randrange(0, 10, 1))
 
-            if mag_is_none:
-                mag = None
-            pol.append((trans, prob, mag))
-        pol = [tuple(pol)]
-        return pol   
+    def _mutate(self, genomes):
+        """
+        Replaces each gene with a random value with probability self.mutation_rate
+        """
+        mutated = np.random.random(genomes.shape) < self.mutation_rate
+        return np.where(mutated, np.random.randint(0, self._gene_high, size=genomes.shape),
+                        genomes)
 
 
-    def _subpol_to_bin(self, subpol):
+    def _breed(self, n):
         """
-        Converts a subpolicy to its binary representation 
-
-        Parameters
-        ------------
-        subpol -> ((transforamtion, probability, magnitude), (trans., prob., mag.))
+        Breeds n children from the population
 
         Returns
         ------------
-        bin_pol -> str
-            Binary representation of the subpolicy
+        children -> int8 array of shape (n, 6)
         """
-        bin_pol = ''  
-        trans1, prob1, mag1 = subpol[0]
-        trans2, prob2, mag2 = subpol[1]
-
-        bin_pol += self.aug_to_bin[trans1] + self.prob_to_bin[str(prob1)]
-        
-        if mag1 == None:
-            bin_pol += '1111' 
-        else:
-            bin_pol += self.mag_to_bin[str(mag1)]
-        
-        bin_pol += self.aug_to_bin[trans2] + self.prob_to_bin[str(prob2)]
-        
-        if mag2 == None:
-            bin_pol += '1111' 
-        else:
-            bin_pol += self.mag_to_bin[str(mag2)]
-            
-        return bin_pol
+        parents = self._select_parents(n)
+        children = self._crossover(self.population[parents[:, 0]],
+                                self.population[parents[:, 1]])
+        return self._canonical(self._mutate(children))
 
 
-    def _choose_parents(self, parents, parents_weights):
+    def _new_genome(self, candidates):
         """
-        Chooses parents from which the next policy will be generated from
-
-        Parameters
-        ------------
-        parents -> [policy, policy, ...]
+        Returns the first of the candidate genomes which has not been proposed
+        before (or a random one which has not, or candidates[0] if the search
+        space seems exhausted), and marks it as visited
+        """
+        for genomes in (candidates, self._random_genomes(len(candidates))):
+            for genome, code in zip(genomes, self._genome_codes(genomes).tolist()):
+                if code not in self.visited:
+                    self.visited.add(code)
+                    return genome
+        return candidates[0]
 
-        parents_weights -> [float, float, ...]
 
-        Returns
-        ------------
-        (parent1, parent2) -> (policy, policy)
-        
+    def _propose_policy(self):
+        """
+        Proposes a random subpolicy until we have num_offspring results to
+        choose parents from, and a child of the subpolicies tested so far
+        after that. In steady state mode, we never wait for the random
+        subpolicies: more random ones keep the workers busy meanwhile.
         """
-        parent1 = random.choices(parents, parents_weights, k=1)[0][0]
-        parent2 = random.choices(parents, parents_weights, k=1)[0][0]
-        while parent2 == parent1:
-            parent2 = random.choices(parents, parents_weights, k=1)[0][0]
-        parent1 = self._subpol_to_bin(parent1)
-        parent2 = self._subpol_to_bin(parent2)
-        return (parent1, parent2)
+        if len(self.population) >= self.num_offspring:
+            genome = self._new_genome(self._breed(self.num_candidates))
+        elif (self.steady_state
+                or len(self.population) + len(self.pending) < self.num_offspring):
+            genome = self._new_genome(self._random_genomes(self.num_candidates))
+        else:
+            # we have to wait for the random policies before we can breed children
+            return None
+        return self._genome_to_policy(genome), genome
 
-    
 
-    def _in_policy_dict(self, policy):
-        
-        for subpol in policy:
-            first_trans, first_prob, first_mag = subpol[0]
-            second_trans, second_prob, second_mag = subpol[1]
-            components = (first_prob, first_mag, second_prob, second_mag)
-            if first_trans in self.pol_dict:
-                if second_trans in self.pol_dict[first_trans]:
-                    if components in self.pol_dict[first_trans][second_trans]:
-                        return True
-                    else:
-                        self.pol_dict[first_trans][second_trans].append(components)
-                        return False
-            else:
-                self.pol_dict[first_trans]= {second_trans: [components]}
-                return False
-
-
-    def _generate_children(self):
+    def _observe_policy(self, policy, accuracy, genome):
+        self._add_to_population(genome, accuracy)
+
+
+    def _add_to_population(self, genome, accuracy):
+        bisect.insort(self.ranking, (-accuracy, len(self.population)))
+        self.population = np.concatenate((self.population, genome[None]))
+        self.population_fitness = np.append(self.population_fitness, accuracy)
+
+
+    def get_migrants(self, n):
         """
-        Generates children via the random crossover method
+        Returns the n best subpolicies tested so far, as [(policy, accuracy)]
+        """
+        return [(self._genome_to_policy(self.population[idx]), -neg_accuracy)
+                    for neg_accuracy, idx in self.ranking[:n]]
 
-        Returns 
-        ------------
-        new_pols -> [child_policy, child_policy, ...]
+
+    def add_migrants(self, migrants):
+        """
+        Adds the subpolicies of migrants ([(policy, accuracy)]) we have not
+        proposed ourselves to the population, so that they can be parents
         """
-        parent_acc = sorted(self.history, key = lambda x: x[1], reverse=True)
-        parents = [x[0] for x in parent_acc]
-        parents_weights = [x[1] for x in parent_acc]
-        new_pols = []
-        for _ in range(1):
-            parent1, parent2 = self._choose_parents(parents, parents_weights)
-            cross_over = random.randrange(1, int(len(parent2)/2), 1)
-            cross_over2 = random.randrange(int(len(parent2)/2), int(len(parent2)), 1)
-            child = parent1[:cross_over]
-            child += parent2[cross_over:int(len(parent2)/2)]
-            child += parent1[int(len(parent2)/2):int(len(parent2)/2)+cross_over2]
-            child += parent2[int(len(parent2)/2)+cross_over2:]
-            new_pols.append(child)
-        return new_pols
+        for policy, accuracy in migrants:
+            genome = self._policy_to_genome(policy)
+            if genome is None:
+                continue
+            code = int(self._genome_codes(genome[None])[0])
+            if code not in self.visited:
+                self.visited.add(code)
+                self._add_to_population(genome, accuracy)
+
 
-    
     def learn(self, train_dataset, test_dataset, child_network_architecture, iterations = 100):
         """
         Generates policies through a genetic algorithm. 
@@ -319,21 +332,8 @@ class GenLearner(AaLearner):
         iterations -> int
             number of iterations to run the instance for
         """
-        if self.num_offspring == 1:
-            self.num_offspring = 2
-            
-        for idx in range(iterations):
-            if len(self.history) < self.num_offspring:
-                policy = [self._gen_random_subpol()]
-            else:
-                policy = self._bin_to_subpol(random.choice(self._generate_children()))
-            pprint(policy)
-            reward = self._test_autoaugment_policy(policy,
-                                                child_network_architecture,
-                                                train_dataset,
-                                                test_dataset,)  
-
-
-
-
-
+        if self.steady_state:
+            self._run_search_async(train_dataset, test_dataset, child_network_architecture,
+                                iterations)
+        else:
+            self._run_search(train_dataset, test_dataset, child_network_architecture, iterations)
@@ -1,3 +1,5 @@
+import collections
+
 import torch
 
 import autoaug.child_networks as cn
@@ -61,6 +63,44 @@ class GruLearner(AaLearner):
         
         cont_lr (float, optional): The learning rate when updating the GRU
                             controller via proximal policy optimization update
+
+        async_updates (bool, optional): If True, the controller is updated as
+                            soon as cont_mb_size results have arrived, while
+                            the evaluator keeps evaluating policies sampled
+                            from the latest controller (see Notes). Defaults
+                            to False.
+
+        max_staleness (int, optional): In asynchronous mode, results of
+                            policies sampled from a controller more than this
+                            many updates older than the current one are not
+                            used to update the controller. Defaults to None
+                            (all results are used).
+
+        max_importance_weight (float, optional): In asynchronous mode, the
+                            importance weights which correct for stale
+                            policies are truncated at this value.
+                            Defaults to 1.0.
+
+        replay_size (int, optional): Number of evaluated policies kept in a
+                            replay buffer, so that every controller update
+                            also learns from policies of earlier minibatches
+                            (see Notes). The oldest policies are evicted when
+                            the buffer is full. Defaults to 0 (no replay).
+
+        replay_updates (int, optional): Number of gradient steps taken on the
+                            replay buffer per controller update. Defaults to 4.
+
+        clip_ratio (float, optional): The probability ratios of the
+                            clipped PPO objective used with the replay buffer
+                            are clipped to [1-clip_ratio, 1+clip_ratio].
+                            Defaults to 0.2.
+
+        fused_controller (bool, optional): Whether the controller runs on
+                            torch's fused GRU cell kernels (see RNNModel).
+                            Defaults to False.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
     
     Attributes:
         history (list): list of policies that has been input into 
@@ -70,6 +110,47 @@ class GruLearner(AaLearner):
         augmentation_space (list): list of image functions that the user has chosen to 
                         include in the search space.
 
+        controller_version (int): how many times the controller has been updated
+
+        policy_versions (list): the controller_version that sampled each policy
+                        of self.history
+
+        replay_buffer (collections.deque): (actions, log_prob, reward) of the
+                        policies in the replay buffer, where log_prob is the 
+                        log probability of the controller which sampled them
+
+    Notes
+    -----
+    The policies of a controller minibatch are all sampled from the same
+    controller weights and their evaluations are independent, so they are
+    proposed together and evaluated at once when the learner's evaluator has
+    ``num_workers >= cont_mb_size`` (e.g. 
+    ``evaluator=ThreadPoolEvaluator(num_workers=cont_mb_size)``). This cuts the
+    wall-clock time per controller update by up to ``cont_mb_size``. The
+    rewards are gathered in the order the policies were sampled, so the
+    controller update is the same as when the policies are evaluated one
+    after another.
+
+    In the synchronous mode above, the evaluator's workers wait for the
+    slowest evaluation of each minibatch. With ``async_updates=True``, the
+    learner instead keeps every worker of the evaluator busy with a policy
+    sampled from the latest controller, and updates the controller whenever
+    ``cont_mb_size`` results have arrived. A policy may then have been sampled
+    from an older controller, so its log probability is computed again under
+    the current controller and its term of the objective is weighted by the
+    ratio of its probabilities under the current and the sampling controller,
+    truncated at ``max_importance_weight`` (as in V-trace, see References).
+    Results older than ``max_staleness`` controller updates are dropped.
+
+    Every evaluation costs a child network training, but contributes to only
+    one controller update. With ``replay_size > 0``, evaluated policies are
+    kept in a replay buffer instead, and each controller update takes 
+    ``replay_updates`` gradient steps on the clipped PPO objective (see 
+    References) of the whole buffer. The clipping keeps the controller close
+    to the controllers which sampled the policies, so old policies can be
+    reused safely. ``benchmark/scripts/replay_buffer_gru.py`` compares the
+    search with and without replay.
+
     References
     ----------
     Ekin D. Cubuk, et al. 
@@ -79,6 +160,13 @@ class GruLearner(AaLearner):
         "Empirical Evaluation of Gated Recurrent Neural 
         Networks on Sequence Modeling"
         arXiv:1412.3555
+    Lasse Espeholt, et al.
+        "IMPALA: Scalable Distributed Deep-RL with Importance Weighted
+        Actor-Learner Architectures"
+        arXiv:1802.01561
+    John Schulman, et al.
+        "Proximal Policy Optimization Algorithms"
+        arXiv:1707.06347
 
 
 
@@ -99,7 +187,16 @@ class GruLearner(AaLearner):
                 # GRU-specific attributes that aren't in all other aa_learners's
                 alpha=0.2,
                 cont_mb_size=4,
-                cont_lr=0.03):
+                cont_lr=0.03,
+                async_updates=False,
+                max_staleness=None,
+                max_importance_weight=1.0,
+                replay_size=0,
+                replay_updates=4,
+                clip_ratio=0.2,
+                fused_controller=False,
+                **kwargs,
+                ):
         
         super().__init__(
                 num_sub_policies=num_sub_policies, 
@@ -112,6 +209,7 @@ class GruLearner(AaLearner):
                 max_epochs=max_epochs,
                 early_stop_num=early_stop_num,
                 exclude_method=exclude_method,
+                **kwargs,
                 )
 
         # GRU-specific attributes that aren't in general AaLearner's
@@ -122,10 +220,24 @@ class GruLearner(AaLearner):
 
         # CONTROLLER (GRU NETWORK) SETTINGS
         self.controller = RNNModel(mode='GRU', output_size=self.op_tensor_length, 
-                                    num_layers=2, bias=True)
+                                    num_layers=2, bias=True, fused=fused_controller)
         self.cont_optim = torch.optim.SGD(self.controller.parameters(), lr=cont_lr)
 
-        self.softmax = torch.nn.Softmax(dim=0)
+        # asynchronous controller updates
+        self.async_updates = async_updates
+        self.max_staleness = max_staleness
+        self.max_importance_weight = max_importance_weight
+        self.controller_version = 0
+        self.policy_versions = []
+
+        # replay buffer
+        self.replay_updates = replay_updates
+        self.clip_ratio = clip_ratio
+        self.replay_buffer = collections.deque(maxlen=replay_size)
+
+        # (reward, log_prob, actions) of the observed policies of the current
+        # minibatch. Only plain numbers are kept, no autograd graphs
+        self._mb = []
 
 
     def _generate_new_policy(self):
@@ -144,11 +256,11 @@ class GruLearner(AaLearner):
         choice of function, prob, and mag seperately, so that the
         resulting tensor's values sums up to 3.
 
-        Then we input each tensor into self._translate_operation_tensor
-        with parameter (return_log_prob=True), which outputs a tuple
-        in the form of ('img_function_name', prob, mag) and a float
-        representing the log probability that we chose the chosen 
-        func, prob and mag. 
+        Then we sample a func, prob and mag from each tensor (treating
+        its parts as multinomial pdf's) and translate them into a tuple
+        in the form of ('img_function_name', prob, mag), like
+        self._translate_operation_tensor does, and compute the log 
+        probability that we chose the chosen func, prob and mag.
 
         We add up the log probabilities of each operation.
 
@@ -165,80 +277,235 @@ class GruLearner(AaLearner):
         We return a tuple of the list and the sum of the log probs
         """
 
-        log_prob = 0
+        new_policy, log_prob, _ = self._sample_policy()
+        return new_policy, log_prob
+
+
+    def _softmaxed_vectors(self):
+        """
+        Runs the controller and returns its softmaxed output tensor for each
+        of the 2*self.num_sub_policies operations (see self._generate_new_policy)
 
+        Returns:
+            torch.Tensor: of shape (2*self.num_sub_policies, self.op_tensor_length)
+        """
         # we need a random input to put in
         random_input = torch.zeros(self.op_tensor_length, requires_grad=False)
 
         # 2*self.num_sub_policies because we need 2 operations for every subpolicy
-        vectors = self.controller(input=random_input, time_steps=2*self.num_sub_policies)
+        vectors = torch.stack(self.controller(input=random_input, time_steps=2*self.num_sub_policies))
 
         # softmax the funcion vector, probability vector, and magnitude vector
         # of each timestep
-        softmaxed_vectors = []
-        for vector in vectors:
-            fun_t, prob_t, mag_t = vector.split([self.fun_num, self.p_bins, self.m_bins])
-            fun_t = self.softmax(fun_t * self.alpha)
-            prob_t = self.softmax(prob_t * self.alpha)
-            mag_t = self.softmax(mag_t * self.alpha)
-            softmaxed_vector = torch.cat((fun_t, prob_t, mag_t))
-            softmaxed_vectors.append(softmaxed_vector)
-            
-        new_policy = []
-
-        for subpolicy_idx in range(self.num_sub_policies):
-            # the vector corresponding to the first operation of this subpolicy
-            op1 = softmaxed_vectors[2*subpolicy_idx]
-            # the vector corresponding to the second operation of this subpolicy
-            op2 = softmaxed_vectors[2*subpolicy_idx+1]
-
-            # translate both vectors
-            op1, log_prob1 = self._translate_operation_tensor(op1, return_log_prob=True)
-            op2, log_prob2 = self._translate_operation_tensor(op2, return_log_prob=True)
-            
-            new_policy.append((op1,op2))
-            log_prob += (log_prob1+log_prob2)
-        
-        return new_policy, log_prob
+        fun_t, prob_t, mag_t = vectors.split([self.fun_num, self.p_bins, self.m_bins], dim=1)
+        fun_t = torch.softmax(fun_t * self.alpha, dim=1)
+        prob_t = torch.softmax(prob_t * self.alpha, dim=1)
+        mag_t = torch.softmax(mag_t * self.alpha, dim=1)
+        return torch.cat((fun_t, prob_t, mag_t), dim=1)
 
 
-    def learn(self, 
-            train_dataset, 
-            test_dataset, 
-            child_network_architecture, 
-            iterations=15,):
+    def sample_policies(self, n):
+        """
+        Samples n policies from the controller at once, e.g. to pre-screen
+        many candidate policies. This takes one run of the controller and 
+        one torch.multinomial call per kind of choice (function, probability,
+        magnitude), however large n is.
 
-        for _ in range(iterations):
-            self.cont_optim.zero_grad()
+        Args:
+            n (int): number of policies
+
+        Returns:
+            list: n policies
+        """
+        with torch.no_grad():
+            policies, _, _ = self._sample_policies(n)
+        return policies
+
+
+    def _sample_policies(self, n):
+        """
+        Samples n policies, and returns them with their log probabilities
+        and the actions the controller took: the indices (fun_idx, prob_idx,
+        mag_idx) chosen for each operation
+
+        Returns:
+            tuple: (policies, log_probs, actions)
+        """
+        softmaxed_vectors = self._softmaxed_vectors()
+        fun_t, prob_t, mag_t = softmaxed_vectors.split([self.fun_num, self.p_bins, self.m_bins], dim=1)
+
+        # the controller's outputs don't depend on the actions it takes, so
+        # all n policies are sampled from the same distributions: 
+        # (time steps, n, 3) -> (n, time steps, 3)
+        actions = torch.stack([torch.multinomial(probs, n, replacement=True)
+                                for probs in (fun_t, prob_t, mag_t)], dim=-1)
+        actions = actions.transpose(0, 1)
+
+        log_probs = self._gather_log_probs(softmaxed_vectors, actions)
+        actions = actions.tolist()
+        policies = [self._operations_to_policy(self._indices_to_operations(policy_actions))
+                    for policy_actions in actions]
+        return policies, log_probs, actions
+
+
+    def _sample_policy(self):
+        """
+        Does what self._generate_new_policy does, and also returns the actions
+        the controller took (see self._sample_policies)
+
+        Returns:
+            tuple: (policy, log_prob, actions)
+        """
+        policies, log_probs, actions = self._sample_policies(1)
+        return policies[0], log_probs[0], actions[0]
+
+
+    def _log_probs(self, actions):
+        """
+        Returns the log probabilities of the current controller taking each of
+        actions (a list with the actions of several policies, see 
+        self._sample_policies). All of them are computed from one run of the
+        controller, because the outputs of the controller don't depend on the
+        actions it takes.
+
+        Returns:
+            torch.Tensor: one log probability per policy
+        """
+        return self._gather_log_probs(self._softmaxed_vectors(), torch.tensor(actions))
+
+
+    def _gather_log_probs(self, softmaxed_vectors, actions):
+        """
+        Returns the log probability of each policy of actions, a tensor of
+        shape (policies, time steps, 3), under softmaxed_vectors
+        """
+        fun_t, prob_t, mag_t = softmaxed_vectors.split([self.fun_num, self.p_bins, self.m_bins], dim=1)
+        steps = torch.arange(softmaxed_vectors.shape[0])
+        log_probs = torch.log(fun_t[steps, actions[..., 0]]) \
+                    + torch.log(prob_t[steps, actions[..., 1]]) \
+                    + torch.log(mag_t[steps, actions[..., 2]])
+        return log_probs.sum(dim=1)
+
+
+    def _propose_policy(self):
+        """
+        Proposes policies until the controller minibatch is full. The
+        controller can only be updated (and propose the policies of the next
+        minibatch) once the results of the whole minibatch are observed.
+
+        In asynchronous mode, there is no such barrier: every policy is
+        sampled from the current controller.
+        """
+        if not self.async_updates and len(self._mb) + len(self.pending) >= self.cont_mb_size:
+            return None
+
+        # log_prob is $\sum_{t=1}^T log(P(a_t|a_{(t-1):1};\theta_c))$, used in PPO.
+        # We only keep the actions and the value of log_prob (rather than its
+        # autograd graph, through the whole child network training): the log
+        # probabilities are computed again when the controller is updated
+        with torch.no_grad():
+            policy, log_prob, actions = self._sample_policy()
+        return policy, (log_prob.item(), actions, self.controller_version)
+
+
+    def _observe_policy(self, policy, reward, info):
+        log_prob, actions, version = info
+        self.policy_versions.append(version)
+
+        if self.max_staleness is not None and \
+                self.controller_version - version > self.max_staleness:
+            return
+
+        self._mb.append((reward, log_prob, actions))
+        if len(self._mb) < self.cont_mb_size:
+            return
+
+        if self.replay_buffer.maxlen > 0:
+            self._replay_update()
+        else:
+            self._update_controller()
+
+        # update running mean of rewards
+        mb_rewards_sum = sum(reward for reward, _, _ in self._mb)
+        self.b = 0.7*self.b + 0.3*(mb_rewards_sum/self.cont_mb_size)
+
+        self.controller_version += 1
+        self._mb = []
 
-            # obj(objective) is $ \sum_{k=1}^m (reward_k-b) \sum_{t=1}^T log(P(a_t|a_{(t-1):1};\theta_c))$,
-            # which is used in PPO
-            obj = 0
 
-            # sum up the rewards within a minibatch in order to update the running mean, 'b'
-            mb_rewards_sum = 0
+    def _update_controller(self):
+        """
+        Updates the controller with the policies of the minibatch
+        """
+        self.cont_optim.zero_grad()
+
+        rewards = torch.tensor([reward for reward, _, _ in self._mb])
+        old_log_probs = torch.tensor([log_prob for _, log_prob, _ in self._mb])
+        log_probs = self._log_probs([actions for _, _, actions in self._mb])
 
-            for k in range(self.cont_mb_size):
-                # log_prob is $\sum_{t=1}^T log(P(a_t|a_{(t-1):1};\theta_c))$, used in PPO
-                policy, log_prob = self._generate_new_policy()
+        # obj(objective) is $ \sum_{k=1}^m (reward_k-b) \sum_{t=1}^T log(P(a_t|a_{(t-1):1};\theta_c))$,
+        # which is used in PPO
+        if self.async_updates:
+            # importance weights of policies sampled from older controllers
+            weights = torch.exp(log_probs.detach() - old_log_probs).clamp(max=self.max_importance_weight)
+            obj = (weights*(rewards-self.b)*log_probs).sum()
+        else:
+            obj = ((rewards-self.b)*log_probs).sum()
 
-                pprint(policy)
-                reward = self._test_autoaugment_policy(policy,
-                                                    child_network_architecture, 
-                                                    train_dataset,
-                                                    test_dataset)
-                mb_rewards_sum += reward
+        (-obj).backward() # We put a minus because we want to maximize the objective, not 
+                          # minimize it.
+        self.cont_optim.step()
 
 
-                # gradient accumulation
-                obj += (reward-self.b)*log_prob
-            
-            # update running mean of rewards
-            self.b = 0.7*self.b + 0.3*(mb_rewards_sum/self.cont_mb_size)
+    def _replay_update(self):
+        """
+        Adds the policies of the minibatch to the replay buffer and takes
+        self.replay_updates gradient steps on the clipped PPO objective of the
+        whole buffer
+        """
+        for reward, log_prob, actions in self._mb:
+            self.replay_buffer.append((actions, log_prob, reward))
+
+        rewards = torch.tensor([reward for _, _, reward in self.replay_buffer])
+        old_log_probs = torch.tensor([log_prob for _, log_prob, _ in self.replay_buffer])
+        advantages = rewards - self.b
+
+        for _ in range(self.replay_updates):
+            self.cont_optim.zero_grad()
+
+            log_probs = self._log_probs([actions for actions, _, _ in self.replay_buffer])
+            ratios = torch.exp(log_probs - old_log_probs)
+            obj = torch.min(ratios*advantages,
+                            ratios.clamp(1-self.clip_ratio, 1+self.clip_ratio)*advantages).sum()
+            # scaled to the size of a minibatch, so that the step size does
+            # not grow with the buffer
+            obj = obj * self.cont_mb_size / len(self.replay_buffer)
 
-            (-obj).backward() # We put a minus because we want to maximize the objective, not 
-                              # minimize it.
+            (-obj).backward()
             self.cont_optim.step()
+
+
+    def learn(self, 
+            train_dataset, 
+            test_dataset, 
+            child_network_architecture, 
+            iterations=15,):
+        """
+        Updates the controller ``iterations`` times, testing cont_mb_size
+        policies for each update (in asynchronous mode, this many policies are
+        tested, but results dropped for being stale don't count towards
+        updates)
+        """
+        if self.async_updates:
+            self._run_search_async(train_dataset,
+                                test_dataset,
+                                child_network_architecture,
+                                iterations*self.cont_mb_size)
+        else:
+            self._run_search(train_dataset,
+                            test_dataset,
+                            child_network_architecture,
+                            iterations*self.cont_mb_size)
              
 
 
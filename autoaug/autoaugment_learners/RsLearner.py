@@ -43,6 +43,9 @@ class RsLearner(AaLearner):
                             Defaults to float('inf').
 
         early_stop_num (int, optional): child_network training parameter. Defaults to 20.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
     
     Attributes:
         history (list): list of policies that has been input into 
@@ -75,6 +78,7 @@ class RsLearner(AaLearner):
                 learning_rate=1e-1,
                 max_epochs=float('inf'),
                 early_stop_num=30,
+                **kwargs,
                 ):
         
         super().__init__(
@@ -87,38 +91,11 @@ class RsLearner(AaLearner):
                     learning_rate=learning_rate,
                     max_epochs=max_epochs,
                     early_stop_num=early_stop_num,
-                    exclude_method=exclude_method
+                    exclude_method=exclude_method,
+                    **kwargs,
                     )
         
 
-    def _generate_new_discrete_operation(self):
-        """
-        generate a new random operation in the form of a tensor of dimension:
-            (fun_num + 11 + 10)
-
-        Used only when self.discrete_p_m=True
-
-        The first fun_num dimensions is a 1-hot encoding to specify which function to use.
-        The next 11 dimensions specify which 'probability' to choose.
-            (0.0, 0.1, ..., 1.0)
-        The next 10 dimensions specify which 'magnitude' to choose.
-            (0, 1, ..., 9)
-        """
-
-        random_fun = np.random.randint(0, self.fun_num)
-        random_prob = np.random.randint(0, self.p_bins)
-        random_mag = np.random.randint(0, self.m_bins)
-        
-        fun_t= torch.zeros(self.fun_num)
-        fun_t[random_fun] = 1.0
-        prob_t = torch.zeros(self.p_bins)
-        prob_t[random_prob] = 1.0
-        mag_t = torch.zeros(self.m_bins)
-        mag_t[random_mag] = 1.0
-
-        return torch.cat([fun_t, prob_t, mag_t])
-
-
     def _generate_new_continuous_operation(self):
         """
         Returns operation_tensor, which is a tensor representation of a random operation with
@@ -151,43 +128,25 @@ class RsLearner(AaLearner):
         Generates a new policy, with the elements chosen at random
         (unifom random distribution).
         """
+        # generate num_sub_policies subpolicies for each policy, with 2
+        # operations for each subpolicy
+        num_ops = 2*self.num_sub_policies
+
+        # if our agent uses discrete representations of probability and magnitude,
+        # we choose the indices of the function, prob and mag directly
+        if self.discrete_p_m:
+            indices = np.stack([np.random.randint(0, self.fun_num, num_ops),
+                                np.random.randint(0, self.p_bins, num_ops),
+                                np.random.randint(0, self.m_bins, num_ops)], axis=1)
+            new_ops = self._indices_to_operations(indices.tolist())
+        else:
+            operation_tensors = torch.stack([self._generate_new_continuous_operation()
+                                                for _ in range(num_ops)])
+            new_ops = self._translate_operation_tensors(operation_tensors, argmax=True)
+
+        return self._operations_to_policy(new_ops)
+
 
-        new_policy = []
-        
-        for _ in range(self.num_sub_policies): # generate num_sub_policies subpolicies for each policy
-            ops = []
-            # generate 2 operations for each subpolicy
-            for i in range(2):
-                # if our agent uses discrete representations of probability and magnitude
-                if self.discrete_p_m:
-                    new_op = self._generate_new_discrete_operation()
-                else:
-                    new_op = self._generate_new_continuous_operation()
-                new_op = self._translate_operation_tensor(new_op)
-                ops.append(new_op)
-
-            new_subpolicy = tuple(ops)
-
-            new_policy.append(new_subpolicy)
-
-        return new_policy
-
-
-    def learn(self, 
-            train_dataset, 
-            test_dataset, 
-            child_network_architecture, 
-            iterations=15):
-        # test out `iterations` number of  random policies
-        for _ in range(iterations):
-            policy = self._generate_new_policy()
-
-            pprint(policy)
-            reward = self._test_autoaugment_policy(policy,
-                                                child_network_architecture,
-                                                train_dataset,
-                                                test_dataset)
-    
 
 
 
@@ -0,0 +1,240 @@
+import numpy as np
+
+from .RsLearner import RsLearner
+
+
+class SubpolicyUcbLearner(RsLearner):
+    """
+    A hierarchical version of UcbLearner: the arms of the bandit are
+    subpolicies rather than whole policies. Every policy we test is made of
+    the num_sub_policies subpolicies with the highest UCB values, and its
+    accuracy is credited to each of them (and to each of their operations).
+    Policies which share subpolicies hence share what we learn from testing
+    them.
+
+    Args:
+        num_sub_policies (int, optional): number of subpolicies per policy. Defaults to 5.
+
+        p_bins (int, optional): number of bins we divide the interval [0,1] for
+                        probabilities. e.g. (0.0, 0.1, ... 1.0) Defaults to 11.
+
+        m_bins (int, optional): number of bins we divide the magnitude space.
+                        Defaults to 10.
+
+        exclude_method (list, optional): list of names(:type:str) of image operations
+                        the user wants to exclude from the search space. Defaults to [].
+
+        batch_size (int, optional): child_network training parameter. Defaults to 32.
+
+        toy_size (int, optional): child_network training parameter. ratio of original
+                            dataset used in toy dataset. Defaults to 0.1.
+
+        learning_rate (float, optional): child_network training parameter. Defaults to 1e-2.
+
+        max_epochs (Union[int, float], optional): child_network training parameter.
+                            Defaults to float('inf').
+
+        early_stop_num (int, optional): child_network training parameter. Defaults to 20.
+
+        num_subpolicies (int, optional): number of random subpolicies (arms) we
+                            search over. Defaults to 100.
+
+        share_operations (bool, optional): whether we also keep the average
+                            accuracy of each operation, and test first the
+                            untested subpolicies whose operations did best.
+                            Defaults to True.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
+
+    Attributes:
+        subpolicies (list): the subpolicies we are searching over (generated
+                        when they are first needed)
+
+        sums (numpy.ndarray): the nth element is the sum of the accuracies of
+                        the policies the nth subpolicy was part of
+
+        cnts (numpy.ndarray): the nth element is the number of policies the nth
+                        subpolicy was part of
+
+
+    Notes
+    -----
+    Untested subpolicies come first, so the first num_subpolicies/num_sub_policies
+    policies test every subpolicy once, where UcbLearner needs num_policies
+    evaluations to test each of its policies once. After that, the UCB value
+    of a subpolicy i is
+
+        avg_i + sqrt(2*ln(n)/n_i)
+
+    where avg_i is the average accuracy of the policies it was part of, n_i
+    their number, and n the total number of subpolicies tested. A subpolicy
+    whose policy is being evaluated is not used in other policies until the
+    result arrives, so that the policies proposed at once are all different.
+
+    ``get_mega_policy`` returns the subpolicies with the best average
+    accuracies.
+
+
+    Examples
+    --------
+    from autoaug.autoaugment_learners.SubpolicyUcbLearner import SubpolicyUcbLearner
+    learner = SubpolicyUcbLearner(num_subpolicies=200)
+
+    """
+    def __init__(self,
+                # parameters that define the search space
+                num_sub_policies=5,
+                p_bins=11,
+                m_bins=10,
+                exclude_method=[],
+                # hyperparameters for when training the child_network
+                batch_size=8,
+                toy_size=1,
+                learning_rate=1e-1,
+                max_epochs=float('inf'),
+                early_stop_num=30,
+                # SubpolicyUcbLearner specific hyperparameters
+                num_subpolicies=100,
+                share_operations=True,
+                **kwargs,
+                ):
+
+        super().__init__(
+                        num_sub_policies=num_sub_policies,
+                        p_bins=p_bins,
+                        m_bins=m_bins,
+                        batch_size=batch_size,
+                        toy_size=toy_size,
+                        learning_rate=learning_rate,
+                        max_epochs=max_epochs,
+                        early_stop_num=early_stop_num,
+                        exclude_method=exclude_method,
+                        **kwargs,
+                        )
+
+        assert num_subpolicies >= num_sub_policies, \
+                'we need at least num_sub_policies subpolicies to make a policy'
+
+        self.num_subpolicies = num_subpolicies
+        self.share_operations = share_operations
+        self.subpolicies = []
+
+        self.sums = np.zeros(num_subpolicies)
+        self.cnts = np.zeros(num_subpolicies, dtype=np.int64)
+        self.total_count = 0
+
+        # {operation: [sum of accuracies, count]}
+        self.operation_stats = {}
+
+
+    def _subpolicy(self, idx):
+        # random subpolicies are generated a policy's worth at a time
+        while len(self.subpolicies) <= idx:
+            self.subpolicies += self._generate_new_policy()
+        return self.subpolicies[idx]
+
+
+    def make_more_subpolicies(self, n):
+        """adds n more random subpolicies to search over
+
+        Args:
+            n (int): how many more subpolicies we want to search over
+        """
+        self.sums = np.concatenate((self.sums, np.zeros(n)))
+        self.cnts = np.concatenate((self.cnts, np.zeros(n, dtype=np.int64)))
+        self.num_subpolicies += n
+
+
+    def _operation_prior(self, idxs):
+        """
+        Returns the average accuracy of the operations of each of the
+        subpolicies idxs (0 for operations we have not tested yet)
+        """
+        priors = np.zeros(len(idxs))
+        if not self.share_operations:
+            return priors
+        for i, idx in enumerate(idxs):
+            for operation in self._subpolicy(idx):
+                acc_sum, count = self.operation_stats.get(operation, (0, 1))
+                priors[i] += acc_sum / count / 2
+        return priors
+
+
+    def get_ucb_values(self):
+        """
+        Returns the UCB value of every subpolicy (inf for untested ones)
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ucb = self.sums/self.cnts + np.sqrt(2*np.log(max(self.total_count, 1))/self.cnts)
+        return np.where(self.cnts > 0, ucb, np.inf)
+
+
+    def _propose_policy(self):
+        """
+        Proposes the policy made of the num_sub_policies subpolicies with the
+        highest UCB values (untested subpolicies first, those with the best
+        operations first among them) which are not part of a pending policy
+        """
+        available = np.ones(self.num_subpolicies, dtype=bool)
+        for _, idxs in self.pending.values():
+            available[idxs] = False
+        if np.count_nonzero(available) < self.num_sub_policies:
+            return None
+
+        # untested subpolicies first. We only look at the next few of them
+        # (so that only those have to be generated), and take those whose
+        # operations did best
+        untested = np.flatnonzero(available & (self.cnts == 0))[:2*self.num_sub_policies]
+        untested = untested[np.argsort(-self._operation_prior(untested), kind='stable')]
+        idxs = untested[:self.num_sub_policies]
+
+        # and then the tested subpolicies with the highest UCB values
+        if len(idxs) < self.num_sub_policies:
+            scores = np.where(available & (self.cnts > 0), self.get_ucb_values(), -np.inf)
+            best = np.argsort(-scores, kind='stable')[:self.num_sub_policies - len(idxs)]
+            idxs = np.concatenate((idxs, best))
+
+        idxs = idxs.tolist()
+        return [self._subpolicy(idx) for idx in idxs], idxs
+
+
+    def _observe_policy(self, policy, accuracy, idxs):
+        # every subpolicy (and operation) of the policy gets its accuracy
+        self.sums[idxs] += accuracy
+        self.cnts[idxs] += 1
+        self.total_count += len(idxs)
+
+        if self.share_operations:
+            for subpolicy in policy:
+                for operation in subpolicy:
+                    stats = self.operation_stats.setdefault(operation, [0, 0])
+                    stats[0] += accuracy
+                    stats[1] += 1
+
+        if len(self.history) % 5 == 0:
+            tested = self.cnts > 0
+            print("Iteration: {},\tSubpolicies tested: {}, Best avg acc: {}".format(
+                            len(self.history),
+                            int(np.count_nonzero(tested)),
+                            round(np.max(self.sums[tested]/self.cnts[tested]), 2)
+                            )
+                )
+
+
+    def get_mega_policy(self, number_policies=5):
+        """
+        Produces a mega policy made of the number_policies subpolicies with
+        the best average accuracies
+
+        Args:
+            number_policies (int): Number of subpolicies to be included in the mega
+            policy
+
+        Returns:
+            megapolicy ([subpolicy, subpolicy, ...])
+        """
+        tested = np.flatnonzero(self.cnts > 0)
+        avg_accs = self.sums[tested] / self.cnts[tested]
+        best = tested[np.argsort(-avg_accs, kind='stable')[:number_policies]]
+        return [self._subpolicy(idx) for idx in best.tolist()]
@@ -1,7 +1,5 @@
 import numpy as np
 
-from tqdm import trange
-
 from ..child_networks import *
 from .RsLearner import RsLearner
 
@@ -41,6 +39,13 @@ class UcbLearner(RsLearner):
     
         num_policies (int, optional): Number of policies we want to serach over. 
                             Defaults to 100.
+
+        batch_strategy (str, optional): how policies proposed at once are
+                            chosen (see Notes). 'ucb' or 'elimination'.
+                            Defaults to 'ucb'.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
         
     Attributes:
         history (list): list of policies that has been input into 
@@ -52,8 +57,11 @@ class UcbLearner(RsLearner):
 
         policies (list): A list of policies which we are currently searching over.
 
-        avg_accs (list): A list where the nth element indicates the average accuracy 
-                        obtained by the nth policy.
+        avg_accs (numpy.ndarray): the nth element is the average accuracy obtained
+                        by the nth policy (nan if it has not been tested yet).
+
+        cnts (numpy.ndarray): the nth element is the number of times the nth
+                        policy has been tested.
 
 
 
@@ -69,11 +77,30 @@ class UcbLearner(RsLearner):
     Then we can run ``self.learn(iterations=20)`` to continue the UCB1 algorithm
     with the extended search space.
 
+    The random policies are only generated when they are first tested, so
+    ``num_policies`` can be large (tens of thousands) at no upfront cost. The
+    statistics of the policies are numpy arrays, and the UCB values of all
+    of them are computed at once.
+
+    When several policies are proposed at once (e.g. for an evaluator with
+    several workers), untested policies come first, and then, with
+    ``batch_strategy='ucb'``, the policies with the highest UCB values, but
+    never a policy whose evaluation is pending. With
+    ``batch_strategy='elimination'``, we do successive elimination instead:
+    a policy is eliminated for good once its UCB value is below the lower
+    confidence bound of another policy, and the least tested of the
+    remaining policies are proposed.
+
     References
     ----------
     Peter Auer, et al.
         "Finite-time Analysis of the Multiarmed Bandit Problem"
         https://homes.di.unimi.it/~cesabian/Pubblicazioni/ml-02.pdf
+
+    Eyal Even-Dar, et al.
+        "Action Elimination and Stopping Conditions for the Multi-Armed
+        Bandit and Reinforcement Learning Problems"
+        https://jmlr.org/papers/v7/evendar06a.html
     
     """
     def __init__(self,
@@ -89,7 +116,9 @@ class UcbLearner(RsLearner):
                 max_epochs=float('inf'),
                 early_stop_num=30,
                 # UcbLearner specific hyperparameter
-                num_policies=100
+                num_policies=100,
+                batch_strategy='ucb',
+                **kwargs,
                 ):
         
         super().__init__(
@@ -102,44 +131,135 @@ class UcbLearner(RsLearner):
                         max_epochs=max_epochs,
                         early_stop_num=early_stop_num,
                         exclude_method=exclude_method,
+                        **kwargs,
                         )
         
 
         
 
+        assert batch_strategy in ('ucb', 'elimination'), batch_strategy
+
         # attributes used in the UCB1 algorithm
         self.num_policies = num_policies
+        self.batch_strategy = batch_strategy
 
-        self.policies = [self._generate_new_policy() for _ in range(num_policies)]
+        # the policies which have been generated (they are generated in order,
+        # when they are first needed), and the first policy we have never
+        # proposed
+        self._policies = []
+        self._next_untested = 0
 
-        self.avg_accs = [None]*self.num_policies
+        self.avg_accs = np.full(num_policies, np.nan)
         self.best_avg_accs = []
 
-        self.cnts = [0]*self.num_policies
-        self.q_plus_cnt = [0]*self.num_policies
+        self.cnts = np.zeros(num_policies, dtype=np.int64)
+        self.eliminated = np.zeros(num_policies, dtype=bool)
         self.total_count = 0
 
 
+    @property
+    def policies(self):
+        """
+        All the policies we are searching over (generating those which have
+        not been generated yet)
+        """
+        return [self._policy(idx) for idx in range(self.num_policies)]
+
+
+    def _policy(self, idx):
+        while len(self._policies) <= idx:
+            self._policies.append(self._generate_new_policy())
+        return self._policies[idx]
+
+
+    @property
+    def q_plus_cnt(self):
+        """
+        The UCB value of each policy (nan for untested policies)
+        """
+        return self.avg_accs + self._confidence_radius()
+
+
+    def _confidence_radius(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(2*np.log(max(self.total_count, 1))/self.cnts)
 
 
     def make_more_policies(self, n):
-        """generates n more random policies and adds it to self.policies
+        """adds n more random policies to self.policies
 
         Args:
             n (int): how many more policies to we want to randomly generate
                     and add to our list of policies
         """
-
-        self.policies += [self._generate_new_policy() for _ in range(n)]
-
         # all the below need to be lengthened to store information for the 
         # new policies
-        self.avg_accs += [None for _ in range(n)]
-        self.cnts += [0 for _ in range(n)]
-        self.q_plus_cnt += [None for _ in range(n)]
+        self.avg_accs = np.concatenate((self.avg_accs, np.full(n, np.nan)))
+        self.cnts = np.concatenate((self.cnts, np.zeros(n, dtype=np.int64)))
+        self.eliminated = np.concatenate((self.eliminated, np.zeros(n, dtype=bool)))
         self.num_policies += n
 
 
+    def _propose_policy(self):
+        """
+        Proposes a policy we haven't tested yet if there is one. Otherwise,
+        proposes the policy chosen by self.batch_strategy among those which
+        are not pending already, so that policies proposed at once are all
+        different.
+        """
+        if self._next_untested < self.num_policies:
+            this_policy_idx = self._next_untested
+            self._next_untested += 1
+            return self._policy(this_policy_idx), this_policy_idx
+
+        available = (self.cnts > 0) & ~self.eliminated
+        pending_idxs = [idx for _, idx in self.pending.values()]
+        available[pending_idxs] = False
+        if not available.any():
+            return None
+
+        if self.batch_strategy == 'ucb':
+            scores = np.where(available, self.q_plus_cnt, -np.inf)
+        else:
+            # the least tested remaining policy, the best one among those
+            scores = np.where(available, -self.cnts + self.avg_accs/2, -np.inf)
+        this_policy_idx = int(np.argmax(scores))
+
+        return self._policy(this_policy_idx), this_policy_idx
+
+
+    def _observe_policy(self, policy, accuracy, this_policy_idx):
+        # update q_values (average accuracy)
+        cnt = self.cnts[this_policy_idx]
+        if cnt == 0:
+            self.avg_accs[this_policy_idx] = accuracy
+        else:
+            self.avg_accs[this_policy_idx] = (self.avg_accs[this_policy_idx]*cnt + accuracy) / (cnt + 1)
+
+        # logging the best avg acc up to now
+        best_avg_acc = np.nanmax(self.avg_accs)
+        self.best_avg_accs.append(best_avg_acc)
+
+        # update counts
+        self.cnts[this_policy_idx] += 1
+        self.total_count += 1
+
+        if self.batch_strategy == 'elimination':
+            radius = self._confidence_radius()
+            tested = self.cnts > 0
+            best_lower_bound = np.max((self.avg_accs - radius)[tested])
+            self.eliminated |= tested & (self.avg_accs + radius < best_lower_bound)
+
+        # print progress for user
+        if self.total_count % 5 == 0:
+            print("Iteration: {},\tPolicies tested: {}, Eliminated: {}, Best this_iter: {}".format(
+                            self.total_count,
+                            int(np.count_nonzero(self.cnts)),
+                            int(np.count_nonzero(self.eliminated)),
+                            round(best_avg_acc, 2)
+                            )
+                )
+
 
     def learn(self, 
             train_dataset, 
@@ -149,61 +269,7 @@ class UcbLearner(RsLearner):
         """continue the UCB algorithm for ``iterations`` number of turns
 
         """
-
-        for this_iter in trange(iterations):
-
-            # choose which policy we want to test
-            if None in self.avg_accs:
-                # if there is a policy we haven't tested yet, we 
-                # test that one
-                this_policy_idx = self.avg_accs.index(None)
-                this_policy = self.policies[this_policy_idx]
-                acc = self._test_autoaugment_policy(
-                                this_policy,
-                                child_network_architecture,
-                                train_dataset,
-                                test_dataset,
-                                )
-                # update q_values (average accuracy)
-                self.avg_accs[this_policy_idx] = acc
-            else:
-                # if we have tested all policies before, we test the
-                # one with the best q_plus_cnt value
-                this_policy_idx = np.argmax(self.q_plus_cnt)
-                this_policy = self.policies[this_policy_idx]
-                acc = self._test_autoaugment_policy(
-                                this_policy,
-                                child_network_architecture,
-                                train_dataset,
-                                test_dataset,
-                                logging=False,
-                                )
-                # update q_values (average accuracy)
-                self.avg_accs[this_policy_idx] = (self.avg_accs[this_policy_idx]*self.cnts[this_policy_idx] + acc) / (self.cnts[this_policy_idx] + 1)
-    
-            # logging the best avg acc up to now
-            best_avg_acc = max([x for x in self.avg_accs if x is not None])
-            self.best_avg_accs.append(best_avg_acc)
-
-            # print progress for user
-            if (this_iter+1) % 5 == 0:
-                print("Iteration: {},\tQ-Values: {}, Best this_iter: {}".format(
-                                this_iter+1, 
-                                list(np.around(np.array(self.avg_accs),2)), 
-                                max(list(np.around(np.array(self.avg_accs),2)))
-                                )
-                    )
-
-            # update counts
-            self.cnts[this_policy_idx] += 1
-            self.total_count += 1
-
-            # update q_plus_cnt values every turn after the initial sweep through
-            for i in range(self.num_policies):
-                if self.avg_accs[i] is not None:
-                    self.q_plus_cnt[i] = self.avg_accs[i] + np.sqrt(2*np.log(self.total_count)/self.cnts[i])
-            
-            print(self.cnts)
+        self._run_search(train_dataset, test_dataset, child_network_architecture, iterations)
 
             
     def get_mega_policy(self, number_policies=5):
@@ -219,18 +285,9 @@ class UcbLearner(RsLearner):
         Returns:
             megapolicy -> [subpolicy, subpolicy, ...]
         """
-
-        temp_avg_accs = [x if x is not None  else 0 for x in self.avg_accs]
-
-        temp_history = list(zip(self.policies, temp_avg_accs))
-
-        number_policies = min(number_policies, len(temp_history))
-
-        inter_pol = sorted(temp_history, key=lambda x: x[1], reverse = True)[:number_policies]
-
         megapol = []
-        for pol in inter_pol:
-            megapol += pol[0]
+        for pol, _ in self.get_n_best_policies(number_policies):
+            megapol += pol
 
         return megapol
 
@@ -246,16 +303,13 @@ class UcbLearner(RsLearner):
         Returns:
             list of best n policies
         """
+        temp_avg_accs = np.nan_to_num(self.avg_accs)
 
-        temp_avg_accs = [x if x is not None  else 0 for x in self.avg_accs]
-
-        temp_history = list(zip(self.policies, temp_avg_accs))
-
-        number_policies = min(number_policies, len(temp_history))
+        number_policies = min(number_policies, self.num_policies)
 
-        inter_pol = sorted(temp_history, key=lambda x: x[1], reverse = True)[:number_policies]
+        best_idxs = np.argsort(-temp_avg_accs, kind='stable')[:number_policies]
 
-        return inter_pol
+        return [(self._policy(idx), temp_avg_accs[idx]) for idx in best_idxs.tolist()]
 
 
        
@@ -3,4 +3,6 @@ from .RsLearner import *
 from .GenLearner import *
 from .GruLearner import *
 from .EvoLearner import *
-from .UcbLearner import *
\ No newline at end of file
+from .UcbLearner import *
+from .SubpolicyUcbLearner import *
+from .rand_augment_learner import *
\ No newline at end of file
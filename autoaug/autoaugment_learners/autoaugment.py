@@ -8,11 +8,11 @@ import torch
 
 from enum import Enum
 from torch import Tensor
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, NamedTuple
 
 from torchvision.transforms import functional as F, InterpolationMode
 
-__all__ = ["AutoAugmentPolicy", "AutoAugment", "RandAugment", "TrivialAugmentWide"]
+__all__ = ["AutoAugmentPolicy", "AutoAugment", "RandAugment", "RandAugmentPolicy", "TrivialAugmentWide"]
 
 
 def _apply_op(img: Tensor, op_name: str, magnitude: float,
@@ -334,6 +334,14 @@ class RandAugment(torch.nn.Module):
         return s.format(**self.__dict__)
 
 
+class RandAugmentPolicy(NamedTuple):
+    """The parameters of a RandAugment transform, which learners can propose
+    and evaluate in place of a policy of subpolicies"""
+    num_ops: int
+    magnitude: int
+    num_magnitude_bins: int = 31
+
+
 class TrivialAugmentWide(torch.nn.Module):
     r"""Dataset-independent data-augmentation with TrivialAugment Wide, as described in
     `"TrivialAugment: Tuning-free Yet State-of-the-Art Data Augmentation" <https://arxiv.org/abs/2103.10158>`.
@@ -471,8 +479,8 @@ if __name__=='__main__':
     _, acc_log1 = _test_autoaugment_policy(subpolicies1, train_dataset, test_dataset)
     _, acc_log2 = _test_autoaugment_policy(subpolicies2, train_dataset, test_dataset)
 
-    plt.plot(acc_log1, label='subpolicies1')
-    plt.plot(acc_log2, label='subpolicies2')
+    plt.plot(*zip(*acc_log1), label='subpolicies1')
+    plt.plot(*zip(*acc_log2), label='subpolicies2')
     plt.xlabel('epochs')
     plt.ylabel('accuracy')
     plt.legend()
@@ -1,8 +1,307 @@
-import torch 
-import numpy as np
-from autoaug.autoaugment_learners.RsLearner import RsLearner
+import math
 
-class rand_augment_learner(RsLearner):
+from autoaug.autoaugment_learners.AaLearner import AaLearner
+from autoaug.autoaugment_learners.autoaugment import RandAugmentPolicy
 
-    def __init__(self):
-        pass
\ No newline at end of file
+
+class RandAugmentLearner(AaLearner):
+    """Searches the two parameters of RandAugment
+
+    RandAugment applies num_ops random image operations to each image, all
+    with the same magnitude, so its search space is a small grid of
+    (num_ops, magnitude) points rather than the space of AutoAugment
+    policies. We search it in two stages (see Notes): pruned magnitude sweeps
+    with a small training budget, and then successive halving.
+
+    Args:
+        num_ops (list, optional): the numbers of operations we try.
+                        Defaults to (1, 2, 3).
+
+        magnitudes (list, optional): the magnitudes we try, in increasing
+                        order. Each must be a bin of the RandAugment transform,
+                        i.e. in [0, num_magnitude_bins). Defaults to
+                        (0, 3, 6, ..., 30).
+
+        num_magnitude_bins (int, optional): number of magnitude bins of the
+                        RandAugment transform. Defaults to 31.
+
+        min_epochs (int, optional): maximum number of epochs each grid point is
+                        trained for in the sweeps. Defaults to 2.
+
+        eta (int, optional): each round of successive halving keeps the best
+                        1/eta of the grid points, and trains them for eta
+                        times as many epochs. Defaults to 3.
+
+        num_rounds (int, optional): number of rounds of successive halving
+                        after the sweeps. Defaults to 2.
+
+        prune_patience (int, optional): a magnitude sweep stops after this
+                        many consecutive magnitudes which did worse than the
+                        best magnitude of the sweep by more than prune_tolerance.
+                        Defaults to 2.
+
+        prune_tolerance (float, optional): Defaults to 0.0.
+
+        max_sweep_pending (int, optional): number of magnitudes of one sweep
+                        evaluated at once. Defaults to 2.
+
+        batch_size (int, optional): child_network training parameter. Defaults to 32.
+
+        toy_size (int, optional): child_network training parameter. ratio of original
+                            dataset used in toy dataset. Defaults to 0.1.
+
+        learning_rate (float, optional): child_network training parameter. Defaults to 1e-2.
+
+        max_epochs (Union[int, float], optional): child_network training parameter.
+                            No grid point is trained for more epochs than this.
+                            Defaults to float('inf').
+
+        early_stop_num (int, optional): child_network training parameter. Defaults to 20.
+
+        **kwargs: other keyword arguments (e.g. stopping_rule) are passed on to
+                        AaLearner.
+
+    Attributes:
+        results (list): the nth element is {RandAugmentPolicy: accuracy} for
+                        the grid points evaluated in the nth round (round 0
+                        being the sweeps)
+
+        pruned (list): the grid points which were never evaluated because
+                        their magnitude sweep stopped early
+
+
+    Notes
+    -----
+    For each number of operations, we first sweep the magnitudes in
+    increasing order, training the child network for at most min_epochs.
+    Accuracy tends to rise with the magnitude and then fall, so once
+    prune_patience magnitudes in a row have done worse than the best one of
+    the sweep, we stop it: higher magnitudes are not evaluated. The sweeps
+    are evaluated side by side (max_sweep_pending magnitudes of each at
+    once), and proposals keep every worker of the evaluator busy.
+
+    Then, in each round of successive halving, the best 1/eta of the grid
+    points of the previous round are evaluated again with eta times the
+    training budget, all at once. As every evaluation trains on the same
+    (seeded) toy dataset, evaluators which keep the datasets in their
+    workers (e.g. ``ProcessPoolEvaluator``) only send them once.
+
+    With the default grid of 3*11 points, a full search costs at most 33
+    short evaluations and 4 longer ones, usually fewer because of the
+    pruning, against the hundreds of full evaluations of an RsLearner run.
+
+    References
+    ----------
+    Ekin D. Cubuk, et al.
+        "RandAugment: Practical automated data augmentation with a reduced
+        search space"
+        arXiv:1909.13719
+
+    Kevin Jamieson, Ameet Talwalkar
+        "Non-stochastic Best Arm Identification and Hyperparameter Optimization"
+        arXiv:1502.07943
+
+
+    Examples
+    --------
+    from autoaug.autoaugment_learners.rand_augment_learner import RandAugmentLearner
+    learner = RandAugmentLearner(num_ops=(1, 2), magnitudes=range(0, 31, 5))
+    learner.learn(train_dataset, test_dataset, child_network_architecture)
+    print(learner.get_best_policy())
+
+    """
+    def __init__(self,
+                # search space settings
+                num_ops=(1, 2, 3),
+                magnitudes=tuple(range(0, 31, 3)),
+                num_magnitude_bins=31,
+                # child network settings
+                learning_rate=1e-1,
+                max_epochs=float('inf'),
+                early_stop_num=20,
+                batch_size=8,
+                toy_size=1,
+                # RandAugmentLearner specific settings
+                min_epochs=2,
+                eta=3,
+                num_rounds=2,
+                prune_patience=2,
+                prune_tolerance=0.0,
+                max_sweep_pending=2,
+                **kwargs,
+                ):
+        super().__init__(
+                    batch_size=batch_size,
+                    toy_size=toy_size,
+                    learning_rate=learning_rate,
+                    max_epochs=max_epochs,
+                    early_stop_num=early_stop_num,
+                    **kwargs,
+                    )
+
+        magnitudes = list(magnitudes)
+        bad_magnitudes = [magnitude for magnitude in magnitudes
+                            if not 0 <= magnitude < num_magnitude_bins]
+        if len(bad_magnitudes) > 0:
+            raise ValueError(f'magnitudes {bad_magnitudes} are not in '
+                            f'[0, num_magnitude_bins={num_magnitude_bins})')
+
+        self.num_ops = list(num_ops)
+        self.magnitudes = magnitudes
+        self.num_magnitude_bins = num_magnitude_bins
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.num_rounds = num_rounds
+        self.prune_patience = prune_patience
+        self.prune_tolerance = prune_tolerance
+        self.max_sweep_pending = max_sweep_pending
+
+        # the budget of each round is capped at the max_epochs we were given.
+        # self.max_epochs is the budget of the current round (it is what the
+        # evaluators train child networks for)
+        self.epoch_limit = max_epochs
+        self.max_epochs = self._round_budget(0)
+
+        self.round = 0
+        self.results = [{}]
+        self.pruned = []
+        self.finished = False
+
+        # the index in self.magnitudes of the next magnitude of each sweep
+        self._next_magnitude = {num_ops: 0 for num_ops in self.num_ops}
+        self._stopped_sweeps = set()
+        # the grid points left to evaluate in the current round (after the sweeps)
+        self._round_points = []
+
+
+    def _round_budget(self, round_idx):
+        return min(self.min_epochs * self.eta**round_idx, self.epoch_limit)
+
+
+    def _point(self, num_ops, magnitude):
+        return RandAugmentPolicy(num_ops, magnitude, self.num_magnitude_bins)
+
+
+    def _propose_policy(self):
+        """
+        Proposes the next magnitude of the sweep with the fewest pending
+        evaluations during the sweeps, and the next grid point of the round
+        of successive halving after that
+        """
+        if self.finished:
+            return None
+
+        if self.round > 0:
+            if len(self._round_points) == 0:
+                return None
+            return self._round_points.pop(0), self.round
+
+        num_pending = {num_ops: 0 for num_ops in self.num_ops}
+        for policy, _ in self.pending.values():
+            num_pending[policy.num_ops] += 1
+
+        for num_ops in sorted(self.num_ops, key=lambda num_ops: num_pending[num_ops]):
+            idx = self._next_magnitude[num_ops]
+            if (num_ops in self._stopped_sweeps or idx == len(self.magnitudes)
+                    or num_pending[num_ops] >= self.max_sweep_pending):
+                continue
+            self._next_magnitude[num_ops] += 1
+            return self._point(num_ops, self.magnitudes[idx]), 0
+
+        return None
+
+
+    def _observe_policy(self, policy, accuracy, round_idx):
+        self.results[round_idx][policy] = accuracy
+
+        if round_idx == 0:
+            self._update_sweep(policy.num_ops)
+
+        # the next round starts once the current one has been evaluated
+        if len(self.pending) == 0 and self._round_finished():
+            self._next_round()
+
+
+    def _round_finished(self):
+        if self.round > 0:
+            return len(self._round_points) == 0
+        return all(num_ops in self._stopped_sweeps
+                        or self._next_magnitude[num_ops] == len(self.magnitudes)
+                    for num_ops in self.num_ops)
+
+
+    def _update_sweep(self, num_ops):
+        """
+        Stops the magnitude sweep of num_ops if, among the magnitudes from
+        the smallest one whose results we have without gaps, the last
+        prune_patience did worse than the best one by more than
+        prune_tolerance
+        """
+        if num_ops in self._stopped_sweeps:
+            return
+
+        accuracies = []
+        for magnitude in self.magnitudes:
+            point = self._point(num_ops, magnitude)
+            if point not in self.results[0]:
+                break
+            accuracies.append(self.results[0][point])
+
+        best = -math.inf
+        num_worse = 0
+        for accuracy in accuracies:
+            if accuracy < best - self.prune_tolerance:
+                num_worse += 1
+            else:
+                num_worse = 0
+            best = max(best, accuracy)
+            if num_worse >= self.prune_patience:
+                self._stopped_sweeps.add(num_ops)
+                self.pruned += [self._point(num_ops, magnitude) for magnitude
+                                    in self.magnitudes[self._next_magnitude[num_ops]:]]
+                return
+
+
+    def _next_round(self):
+        """
+        Starts the next round of successive halving with the best 1/eta of
+        the grid points of the current round, or finishes the search
+        """
+        previous = self.results[self.round]
+        num_points = math.ceil(len(previous) / self.eta)
+        if self.round == self.num_rounds or len(previous) <= 1:
+            self.finished = True
+            return
+
+        self.round += 1
+        self.max_epochs = self._round_budget(self.round)
+        self.results.append({})
+        self._round_points = sorted(previous, key=previous.get, reverse=True)[:num_points]
+
+
+    def get_best_policy(self):
+        """
+        Returns the best grid point of the last round (the RandAugment
+        parameters we found) and its accuracy
+        """
+        results = next(results for results in reversed(self.results) if len(results) > 0)
+        best = max(results, key=results.get)
+        return best, results[best]
+
+
+    def get_mega_policy(self, number_policies=5):
+        raise NotImplementedError('RandAugment has no subpolicies, use get_best_policy')
+
+
+    def learn(self, train_dataset, test_dataset, child_network_architecture, iterations=None):
+        """
+        Runs the search until it is finished, or until iterations grid points
+        have been evaluated
+
+        Returns:
+            (RandAugmentPolicy, float): see self.get_best_policy
+        """
+        if iterations is None:
+            iterations = len(self.num_ops) * len(self.magnitudes) * (self.num_rounds + 1)
+        self._run_search(train_dataset, test_dataset, child_network_architecture, iterations)
+        return self.get_best_policy()
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import platform
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from autoaug.dataset_views import transform_view
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'autoaug', 'autotune.json')
+
+
+
+def _dataset_fingerprint(dataset, num_samples=8):
+    """
+    Returns a hash of the contents of num_samples images (and labels) of
+    dataset spread evenly over it, which tells apart datasets of the same
+    class and length
+    """
+    digest = hashlib.sha1()
+    for idx in np.linspace(0, len(dataset) - 1, num=min(num_samples, len(dataset)), dtype=int):
+        image, label = dataset[int(idx)]
+        if isinstance(image, torch.Tensor):
+            image = image.numpy()
+        image = np.asarray(image)
+        digest.update(repr((image.shape, image.dtype.str, label)).encode())
+        digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _cache_key(train_dataset, child_network_architecture, search_space):
+    """
+    The measurements depend on the dataset, the child network architecture,
+    the machine we are on and the configurations we were allowed to choose
+    from (search_space, e.g. the candidate batch sizes and memory_limit)
+    """
+    dataset_key = f'{type(train_dataset).__name__}({len(train_dataset)},' \
+                    f'{_dataset_fingerprint(train_dataset)})'
+    if isinstance(child_network_architecture, nn.Module):
+        architecture_key = type(child_network_architecture).__name__
+    else:
+        architecture_key = getattr(child_network_architecture, '__name__',
+                                        str(child_network_architecture))
+    machine_key = f'{platform.node()}-{os.cpu_count()}cpu-torch{torch.__version__}'
+    search_key = ','.join(f'{key}={value}' for key, value in sorted(search_space.items()))
+    return f'{dataset_key}|{architecture_key}|{machine_key}|{search_key}'
+
+
+def _load_cache(cache_path):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as file:
+        return json.load(file)
+
+
+def _save_cache(cache_path, cache):
+    if cache_path is None:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(cache, file, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def estimate_memory(child_network, sample, batch_size):
+    """
+    Rough estimate (in bytes) of the memory training child_network with
+    batches of batch_size samples like ``sample`` takes: the weights,
+    their gradients and optimizer state, the input batch, and the
+    activations of every layer (kept for the backward pass, plus their
+    gradients).
+    """
+    param_bytes = sum(p.numel() * p.element_size() for p in child_network.parameters())
+
+    activation_bytes = 0
+    def _hook(module, inputs, output):
+        nonlocal activation_bytes
+        if isinstance(output, torch.Tensor):
+            activation_bytes += output.numel() * output.element_size()
+
+    handles = [module.register_forward_hook(_hook) for module in child_network.modules()
+                    if len(list(module.children())) == 0]
+    with torch.no_grad():
+        child_network(sample.unsqueeze(0).float())
+    for handle in handles:
+        handle.remove()
+
+    input_bytes = sample.numel() * 4
+    return 3 * param_bytes + batch_size * (input_bytes + 2 * activation_bytes)
+
+
+def measure_throughput(train_dataset, child_network, batch_size, num_workers,
+                    num_threads, num_batches=5, learning_rate=1e-1):
+    """
+    Trains child_network for num_batches batches (after one warm up batch)
+    with the given configuration and returns the number of samples per second.
+    """
+    old_num_threads = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        train_loader = torch.utils.data.DataLoader(train_dataset,
+                                                batch_size=batch_size,
+                                                num_workers=num_workers,
+                                                shuffle=True)
+        sgd = optim.SGD(child_network.parameters(), lr=learning_rate)
+        cost = nn.CrossEntropyLoss()
+
+        num_samples = 0
+        start = None
+        child_network.train()
+        for idx, (train_x, train_label) in enumerate(train_loader):
+            # the first batch includes starting up the workers
+            if idx == 1:
+                start = time.perf_counter()
+            if idx >= 1:
+                num_samples += len(train_x)
+
+            sgd.zero_grad()
+            loss = cost(child_network(train_x.float()), train_label.long())
+            loss.backward()
+            sgd.step()
+
+            if idx >= num_batches:
+                break
+        elapsed = time.perf_counter() - start if start is not None else None
+    finally:
+        torch.set_num_threads(old_num_threads)
+
+    if not elapsed:
+        return 0.0
+    return num_samples / elapsed
+
+
+def autotune_loader_config(train_dataset,
+                        make_child_network,
+                        child_network_architecture,
+                        train_transform,
+                        batch_sizes=(8, 16, 32, 64, 128, 256),
+                        num_workers=(0, 2, 4),
+                        num_threads=None,
+                        max_batch_size=256,
+                        memory_limit=None,
+                        num_batches=5,
+                        learning_rate=1e-1,
+                        cache_path=DEFAULT_CACHE_PATH,
+                        verbose=True):
+    """
+    Finds the (batch size, DataLoader workers, intra-op threads) configuration
+    with which a child network trains the most samples per second on this
+    dataset, child network architecture and machine.
+
+    We measure the throughput of training on train_dataset augmented with
+    ``train_transform`` (that of a representative policy). Instead of trying every combination,
+    we first pick the batch size (with no workers and all threads), then the
+    number of workers, and then the number of threads. The result is cached in
+    ``cache_path`` per (dataset, architecture, machine, candidate values and
+    limits), so later searches with the same constraints skip the measurements.
+    If no candidate batch size meets max_batch_size and memory_limit, we
+    raise a ValueError rather than pick one which does not.
+
+    Args:
+        train_dataset (torchvision.dataset.vision.VisionDataset): we measure on
+                        a view of it with train_transform (it is not changed)
+
+        make_child_network (function): makes a fresh child network out of
+                        child_network_architecture, e.g.
+                        ``AaLearner._make_child_network``
+
+        child_network_architecture (Union[function, nn.Module])
+
+        train_transform (callable): transform of a representative policy, e.g.
+                        ``transforms.Compose([aa_transform, transforms.ToTensor()])``
+
+        batch_sizes, num_workers (tuple[int], optional): candidate values
+
+        num_threads (tuple[int], optional): candidate intra-op thread counts.
+                        Defaults to 1, half and all of torch.get_num_threads().
+
+        max_batch_size (int, optional): batch sizes above this are not considered.
+                        Defaults to 256.
+
+        memory_limit (int, optional): batch sizes whose estimated training
+                        memory (see estimate_memory) is above this many bytes
+                        are not considered. Defaults to None (no limit).
+
+        cache_path (str, optional): json file the results are cached in. None
+                        means no caching. Defaults to ~/.cache/autoaug/autotune.json
+
+    Returns:
+        dict: with keys 'batch_size', 'num_workers', 'num_threads',
+                        'samples_per_sec', and 'measurements' (a list of every
+                        measured configuration and its samples per second)
+    """
+    if num_threads is None:
+        max_threads = torch.get_num_threads()
+        num_threads = sorted({1, max(1, max_threads // 2), max_threads})
+
+    # a configuration measured under other constraints (e.g. a looser
+    # memory_limit) may not be allowed under these
+    key = _cache_key(train_dataset, child_network_architecture, {
+                        'batch_sizes': tuple(batch_sizes),
+                        'num_workers': tuple(num_workers),
+                        'num_threads': tuple(num_threads),
+                        'max_batch_size': max_batch_size,
+                        'memory_limit': memory_limit,
+                        'num_batches': num_batches,
+                        'learning_rate': learning_rate,
+                        })
+    cache = _load_cache(cache_path)
+    if key in cache:
+        if verbose:
+            print('autotune: using cached configuration', cache[key]['batch_size'],
+                    'batch size,', cache[key]['num_workers'], 'workers,',
+                    cache[key]['num_threads'], 'threads')
+        return cache[key]
+
+    train_dataset = transform_view(train_dataset, train_transform)
+
+    # filter out batch sizes which are too big
+    sample = train_dataset[0][0]
+    child_network = make_child_network(child_network_architecture)
+    candidates = []
+    for batch_size in batch_sizes:
+        if batch_size > max_batch_size:
+            continue
+        if memory_limit is not None and \
+                estimate_memory(child_network, sample, batch_size) > memory_limit:
+            continue
+        candidates.append(batch_size)
+    if len(candidates) == 0:
+        raise ValueError(f'none of the batch sizes {tuple(batch_sizes)} is at most '
+                        f'max_batch_size={max_batch_size} and fits in '
+                        f'memory_limit={memory_limit} bytes')
+
+    measurements = []
+    def _measure(batch_size, workers, threads):
+        samples_per_sec = measure_throughput(train_dataset,
+                                            make_child_network(child_network_architecture),
+                                            batch_size,
+                                            workers,
+                                            threads,
+                                            num_batches=num_batches,
+                                            learning_rate=learning_rate)
+        measurements.append({'batch_size': batch_size, 'num_workers': workers,
+                            'num_threads': threads, 'samples_per_sec': samples_per_sec})
+        if verbose:
+            print(f'autotune: batch size {batch_size}, {workers} workers, '
+                    f'{threads} threads: {samples_per_sec:.1f} samples/sec')
+        return samples_per_sec
+
+    # coordinate search: batch size, then workers, then threads
+    best_threads = max(num_threads)
+    best_batch_size = max(candidates, key=lambda b: _measure(b, 0, best_threads))
+    best_workers = max(num_workers, key=lambda w: _measure(best_batch_size, w, best_threads))
+    best_threads = max(num_threads, key=lambda t: _measure(best_batch_size, best_workers, t))
+
+    best = max((m for m in measurements if m['batch_size'] == best_batch_size
+                    and m['num_workers'] == best_workers and m['num_threads'] == best_threads),
+                key=lambda m: m['samples_per_sec'])
+    result = dict(best, measurements=measurements)
+
+    if verbose:
+        print('autotune: chose', best_batch_size, 'batch size,', best_workers, 'workers,',
+                best_threads, 'threads', f"({best['samples_per_sec']:.1f} samples/sec)")
+
+    cache[key] = result
+    _save_cache(cache_path, cache)
+    return result
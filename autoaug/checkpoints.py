@@ -0,0 +1,111 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import torch
+
+
+
+
+class CheckpointStore:
+    """Stores the training state of child networks on disk
+
+    ``main.train_child_network`` can save the state of a run (model and
+    optimizer state dicts, epoch, best accuracy, early stop counter,
+    learning curve and random number generator states) into a
+    CheckpointStore under an evaluation id when it finishes, and continue
+    from exactly that state the next time it is called with the same
+    evaluation id. This way, raising the budget (e.g. ``max_epochs``) of an
+    evaluation does not mean we have to train the child network from scratch.
+
+    Args:
+        root (str): directory in which the checkpoints are saved. It is created
+                        if it does not exist.
+
+        max_bytes (int, optional): disk quota of the store. When saving a
+                        checkpoint makes the store bigger than this, the least
+                        recently used checkpoints are evicted. None means that
+                        there is no quota. Defaults to None.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+
+    def _path(self, eval_id):
+        eval_id = str(eval_id)
+        # evaluation ids are used as file names, so anything unusual is hashed
+        if not re.fullmatch(r'[A-Za-z0-9_.\-]{1,100}', eval_id):
+            eval_id = hashlib.sha1(eval_id.encode()).hexdigest()
+        return os.path.join(self.root, eval_id + '.pt')
+
+
+    def __contains__(self, eval_id):
+        return os.path.exists(self._path(eval_id))
+
+
+    def save(self, eval_id, state):
+        """
+        Saves ``state`` (a dictionary which can be saved with ``torch.save``)
+        under ``eval_id`` and then evicts old checkpoints if we are over quota.
+        """
+        path = self._path(eval_id)
+
+        # write to a temporary file first so that we never leave a half
+        # written checkpoint behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            torch.save(state, file)
+        os.replace(tmp_path, path)
+
+        self._evict(keep=path)
+
+
+    def load(self, eval_id):
+        """
+        Returns the state saved under ``eval_id``, or None if there is none.
+        """
+        path = self._path(eval_id)
+        if not os.path.exists(path):
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        return torch.load(path)
+
+
+    def delete(self, eval_id):
+        path = self._path(eval_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+    def total_bytes(self):
+        return sum(os.path.getsize(path) for path in self._checkpoint_paths())
+
+
+    def _checkpoint_paths(self):
+        return [os.path.join(self.root, name) for name in os.listdir(self.root)
+                    if name.endswith('.pt')]
+
+
+    def _evict(self, keep=None):
+        """
+        Removes least recently used checkpoints until we are within quota.
+        The checkpoint at path ``keep`` is never removed.
+        """
+        if self.max_bytes is None:
+            return
+
+        paths = sorted(self._checkpoint_paths(), key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= os.path.getsize(path)
+            os.remove(path)
@@ -73,9 +73,29 @@ class GRUCell(nn.Module):
 
 
 class RNNModel(nn.Module):
-    def __init__(self, mode, output_size, num_layers, bias):
+    """
+    Recurrent controller which feeds its output at each timestep into the
+    next timestep
+
+    Args:
+        mode (str): 'GRU' or 'LSTM'
+
+        output_size (int): size of the input, hidden state and output
+
+        num_layers (int): number of cells
+
+        bias (bool): whether the cells have biases
+
+        fused (bool, optional): whether to run the cells with torch's fused
+                        GRU/LSTM cell kernels (the ones nn.GRUCell and
+                        nn.LSTMCell use) instead of the hand-written cells.
+                        The weights are the same, so this can be switched on
+                        and off at any time. Defaults to False.
+    """
+    def __init__(self, mode, output_size, num_layers, bias, fused=False):
         super(RNNModel, self).__init__()
         self.mode = mode
+        self.fused = fused
         self.input_size = output_size
         self.hidden_size = output_size
         self.num_layers = num_layers
@@ -114,29 +134,86 @@ class RNNModel(nn.Module):
 
         
     def forward(self, input, time_steps=10, hx=None):
+        """
+        Args:
+            input (torch.Tensor): the input of the first timestep, of shape
+                        (output_size, ) or, for a batch, (batch_size, output_size)
+
+            time_steps (int, optional): number of timesteps. Defaults to 10.
+
+            hx (list, optional): initial hidden state of each layer. Defaults
+                        to zeros.
+
+        Returns:
+            list[torch.Tensor]: input, followed by the outputs of the first
+                        time_steps-1 timesteps, each of the same shape as input
+        """
         # The 'input' is the input x into the first timestep
         # I think this should be a random vector
-        assert input.shape == (self.output_size, )
+        batched = input.dim() == 2
+        if not batched:
+            input = input.unsqueeze(0)
+        assert input.shape[1:] == (self.output_size, )
 
-        outs = []
         h0 = [None] * self.num_layers if hx is None else list(hx)
     
 
         X = [None] * time_steps
         X[0] = input # first input is 'input'
         for layer_idx, layer_cell in enumerate(self.rnn_cell_list):
-            hx = h0[layer_idx]
+            hx = self._initial_state(h0[layer_idx], input, batched)
+            step = self._fused_step(layer_cell) if self.fused else layer_cell
             for i in range(time_steps):
-                hx = layer_cell(X[i], hx)
+                hx = step(X[i], hx)
                 
                 # we feed in this timestep's output into the next timestep's input
                 # except if we are at the last timestep
                 if i != time_steps-1:
                     X[i+1] = hx if self.mode == 'GRU' else hx[0]
                 
-        outs = X
+        outs = X if batched else [x.squeeze(0) for x in X]
 
         return outs
+
+
+    def _initial_state(self, hx, input, batched):
+        """
+        Returns the hidden state (hx, or zeros) of a layer with a batch
+        dimension
+        """
+        if hx is None:
+            hx = input.new_zeros(input.size(0), self.hidden_size)
+            return hx if self.mode == 'GRU' else (hx, hx)
+        if not batched:
+            hx = hx.unsqueeze(0) if self.mode == 'GRU' else tuple(h.unsqueeze(0) for h in hx)
+        return hx
+
+
+    def _fused_step(self, cell):
+        """
+        Returns a function which does what cell does, with torch's fused cell
+        kernels. Their weights are the weights of cell in torch's layout: the
+        gates in the order (r, z, n) for the GRU and (i, f, g, o) for the LSTM.
+        """
+        H = self.hidden_size
+        if self.mode == 'GRU':
+            # our GRUCell computes (z, r) with x2h/h2h and n with x2r/h2r
+            def _gates(x2h, x2r):
+                return torch.cat((x2h[H:], x2h[:H], x2r))
+            w_ih = _gates(cell.x2h.weight, cell.x2r.weight)
+            w_hh = _gates(cell.h2h.weight, cell.h2r.weight)
+            b_ih = _gates(cell.x2h.bias, cell.x2r.bias) if self.bias else None
+            b_hh = _gates(cell.h2h.bias, cell.h2r.bias) if self.bias else None
+            return lambda x, hx: torch.gru_cell(x, hx, w_ih, w_hh, b_ih, b_hh)
+
+        # our LSTMCell computes the gates in the order (i, f, o, g)
+        def _gates(weight):
+            return torch.cat((weight[:2*H], weight[3*H:], weight[2*H:3*H]))
+        w_ih = _gates(cell.x2h.weight)
+        w_hh = _gates(cell.h2h.weight)
+        b_ih = _gates(cell.x2h.bias) if self.bias else None
+        b_hh = _gates(cell.h2h.bias) if self.bias else None
+        return lambda x, hx: torch.lstm_cell(x, hx, w_ih, w_hh, b_ih, b_hh)
     
 
 class BidirRecurrentModel(nn.Module):
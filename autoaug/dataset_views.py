@@ -0,0 +1,41 @@
+import copy
+
+import torch
+from torchvision.datasets.vision import StandardTransform
+
+
+
+
+def transform_view(dataset, transform):
+    """
+    Returns a view of dataset whose images are transformed by ``transform``
+    instead of dataset's own transform.
+
+    The view is a shallow copy of dataset: it shares dataset's data (e.g.
+    the image tensor of an MNIST dataset) and only has its own transform.
+    dataset itself is never changed, so one dataset can serve many
+    evaluations at once (in threads, or in the web app), each with its own
+    policy.
+
+    Args:
+        dataset (torch.utils.data.Dataset): a dataset with a ``transform``
+                        attribute (e.g. any torchvision dataset), or a
+                        ``torch.utils.data.Subset`` of one
+
+        transform (callable): the transform of the view
+
+    Returns:
+        torch.utils.data.Dataset: the view
+    """
+    if isinstance(dataset, torch.utils.data.Subset):
+        return torch.utils.data.Subset(transform_view(dataset.dataset, transform),
+                                    dataset.indices)
+
+    view = copy.copy(dataset)
+    view.transform = transform
+    # torchvision datasets which use self.transforms (rather than
+    # self.transform) in __getitem__
+    if hasattr(dataset, 'transforms') and \
+            (dataset.transforms is None or isinstance(dataset.transforms, StandardTransform)):
+        view.transforms = StandardTransform(transform, getattr(dataset, 'target_transform', None))
+    return view
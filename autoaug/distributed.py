@@ -0,0 +1,179 @@
+import os
+import pickle
+import shutil
+import tempfile
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+
+from autoaug.main import train_child_network
+
+
+
+
+def _copy_state(target, source):
+    """
+    Copies the attributes of source (an object that was changed in a worker
+    process) onto target (the object in this process it is a copy of)
+    """
+    if target is not None and source is not None:
+        target.__dict__.update(source.__dict__)
+
+
+def _train_worker(rank,
+                world_size,
+                init_file,
+                seed,
+                child_network,
+                train_dataset,
+                test_dataset,
+                batch_size,
+                learning_rate,
+                num_workers,
+                train_kwargs,
+                result_file):
+    """
+    What each process of train_child_network_distributed runs
+    """
+    dist.init_process_group('gloo',
+                            init_method='file://' + init_file,
+                            rank=rank,
+                            world_size=world_size)
+    try:
+        torch.manual_seed(seed + rank)
+        torch.set_num_threads(max(1, torch.get_num_threads() // world_size))
+
+        # every process trains on its own shard of the toy training set. The
+        # sampler pads the shards to the same length so that every process
+        # does the same number of steps (and gradient all-reduces)
+        train_sampler = torch.utils.data.distributed.DistributedSampler(
+                                                        train_dataset,
+                                                        num_replicas=world_size,
+                                                        rank=rank,
+                                                        shuffle=False)
+        train_loader = torch.utils.data.DataLoader(train_dataset,
+                                                batch_size=batch_size,
+                                                sampler=train_sampler,
+                                                num_workers=num_workers)
+        # the validation shards must not overlap, otherwise the accuracy
+        # gathered from them would count some images twice
+        test_shard = torch.utils.data.Subset(test_dataset,
+                                            range(rank, len(test_dataset), world_size))
+        test_loader = torch.utils.data.DataLoader(test_shard,
+                                                batch_size=batch_size,
+                                                num_workers=num_workers)
+
+        ddp_network = DistributedDataParallel(child_network)
+        train_kwargs = dict(train_kwargs)
+        train_kwargs['print_every_epoch'] = train_kwargs.get('print_every_epoch', True) \
+                                                and rank == 0
+
+        best_acc, acc_log = train_child_network(
+                                    ddp_network,
+                                    train_loader,
+                                    test_loader,
+                                    sgd=optim.SGD([p for p in ddp_network.parameters()
+                                                    if p.requires_grad],
+                                                lr=learning_rate),
+                                    cost=nn.CrossEntropyLoss(),
+                                    logging=True,
+                                    **train_kwargs)
+
+        if rank == 0:
+            with open(result_file, 'wb') as file:
+                pickle.dump((
+                    best_acc,
+                    [(epoch, float(acc)) for epoch, acc in acc_log],
+                    train_kwargs.get('stopping_rule'),
+                    ), file)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_child_network_distributed(child_network,
+                                    train_dataset,
+                                    test_dataset,
+                                    num_processes,
+                                    batch_size,
+                                    learning_rate,
+                                    num_workers=0,
+                                    **train_kwargs):
+    """
+    Does what ``main.train_child_network`` does, but data-parallel across
+    num_processes local processes (with the gloo backend, on cpu).
+
+    Every process gets a shard of train_dataset and of test_dataset. The
+    gradients are all-reduced by ``DistributedDataParallel``, so all the
+    processes keep the same weights, and the validation accuracy is gathered
+    from all the shards. Each process uses batches of
+    batch_size // num_processes images, so that one step of all the processes
+    together sees batch_size images, as in the single process case.
+
+    The stopping_rule in train_kwargs is updated with the state it has at the
+    end of training in the first process.
+
+    Args:
+        child_network (nn.Module): freshly initialised child network. Every
+                        process starts from a copy of its weights.
+
+        train_dataset, test_dataset (torch.utils.data.Dataset): the (toy)
+                        datasets, e.g. the datasets of the loaders made by
+                        ``main.create_toy``. They are pickled and sent to
+                        every process, transforms included.
+
+        num_processes (int): number of processes to train in
+
+        batch_size, learning_rate, num_workers: child_network training parameters
+
+        **train_kwargs: passed on to ``main.train_child_network``, e.g.
+                        max_epochs and early_stop_num. checkpoint_store,
+                        val_subsample and quantized_validation are not
+                        supported: each process would subsample (or
+                        calibrate on) its own validation shard, so the
+                        processes could decide differently when to stop,
+                        and wait for each other forever.
+
+    Returns:
+        best_acc (float), acc_log (list[tuple]): as ``main.train_child_network``
+                        with logging=True
+    """
+    if train_kwargs.get('checkpoint_store') is not None:
+        raise ValueError('checkpoint_store is not supported when training in '
+                        'several processes')
+    for key in ('val_subsample', 'quantized_validation'):
+        if train_kwargs.get(key) is not None:
+            raise ValueError(f'{key} is not supported when training in several processes')
+
+    # each process has its own random seed, drawn from this process' generator
+    # so that runs stay reproducible with torch.manual_seed
+    seed = int(torch.randint(2**31 - num_processes, (1,)))
+    child_network = child_network.cpu()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        mp.spawn(_train_worker,
+                args=(num_processes,
+                        os.path.join(tmp_dir, 'init'),
+                        seed,
+                        child_network,
+                        train_dataset,
+                        test_dataset,
+                        max(1, batch_size // num_processes),
+                        learning_rate,
+                        num_workers,
+                        train_kwargs,
+                        os.path.join(tmp_dir, 'result.pkl')),
+                nprocs=num_processes,
+                join=True)
+        with open(os.path.join(tmp_dir, 'result.pkl'), 'rb') as file:
+            best_acc, acc_log, stopping_rule = pickle.load(file)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _copy_state(train_kwargs.get('stopping_rule'), stopping_rule)
+
+    return best_acc, acc_log
@@ -0,0 +1,454 @@
+import concurrent.futures
+import copy
+import threading
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import torch.multiprocessing as mp
+
+
+
+
+class EvaluationError(RuntimeError):
+    """Raised when an evaluation failed in a worker (or kept crashing or
+    timing out after all retries)"""
+
+
+
+
+def _run_task(learner, child_network_architecture, train_dataset, test_dataset, task):
+    """
+    Evaluates task['policy'] with learner (without recording anything) and
+    returns (accuracy, acc_log, stopped), where stopped says whether
+    learner.stopping_rule stopped the evaluation early
+    """
+    stopping_rule = learner.stopping_rule
+    num_stopped = stopping_rule.num_stopped if stopping_rule is not None else 0
+
+    accuracy, acc_log = learner._evaluate_policy(task['policy'],
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset,
+                                            print_every_epoch=task['print_every_epoch'],
+                                            checkpoint_id=task['checkpoint_id'],
+                                            max_epochs=task['max_epochs'])
+
+    stopped = stopping_rule is not None and stopping_rule.num_stopped > num_stopped
+    return accuracy, acc_log, stopped
+
+
+def _add_curves(learner, tasks, results):
+    """
+    Adds the learning curves evaluated on copies of learner.stopping_rule to
+    the learner's own stopping rule, in the order the tasks were submitted
+    """
+    if learner.stopping_rule is None:
+        return
+    for task, (_, acc_log, stopped) in zip(tasks, results):
+        learner.stopping_rule.add_curve(acc_log, stopped=stopped,
+                                        curve_id=task['checkpoint_id'])
+
+
+class Evaluator:
+    """The parent class of all evaluators
+
+    An evaluator trains the child networks AaLearner needs to evaluate
+    policies. AaLearner._evaluate_policies hands it a list of tasks and the
+    learner records the results in the order of the tasks, however the
+    evaluator schedules them.
+
+    Attributes:
+        num_workers (int): how many evaluations the evaluator runs at once.
+                        Learners propose this many policies at a time when
+                        they can.
+    """
+
+    num_workers = 1
+
+    def evaluate(self,
+                learner,
+                tasks,
+                child_network_architecture,
+                train_dataset,
+                test_dataset):
+        """
+        Args:
+            learner (AaLearner): supplies the child network training parameters
+
+            tasks (list[dict]): each with keys 'policy', 'eval_id',
+                        'checkpoint_id', 'max_epochs' and 'print_every_epoch'
+                        (see AaLearner._test_autoaugment_policy and
+                        AaLearner._checkpoint_id)
+
+            child_network_architecture, train_dataset, test_dataset:
+                        see AaLearner._test_autoaugment_policy
+
+        Returns:
+            list[tuple]: (accuracy, acc_log) of each task, in the order of tasks
+        """
+        raise NotImplementedError('evaluate not implemented in Evaluator')
+
+
+    def submit(self,
+            learner,
+            task,
+            child_network_architecture,
+            train_dataset,
+            test_dataset):
+        """
+        Starts evaluating a single task and returns a 
+        ``concurrent.futures.Future`` of its (accuracy, acc_log). This is what
+        AaLearner._run_search_async uses to keep every worker busy instead of
+        waiting for a whole batch of tasks.
+
+        Evaluators which cannot evaluate tasks in the background evaluate the
+        task right away and return a finished future.
+        """
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self.evaluate(learner,
+                                            [task],
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset)[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+    def close(self):
+        """
+        Shuts down the workers of the evaluator, if it has any
+        """
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+
+class SerialEvaluator(Evaluator):
+    """Evaluates one policy after the other in this process. This is what
+    AaLearner uses by default."""
+
+    def evaluate(self,
+                learner,
+                tasks,
+                child_network_architecture,
+                train_dataset,
+                test_dataset):
+        results = []
+        for task in tasks:
+            accuracy, acc_log, _ = _run_task(learner,
+                                            child_network_architecture,
+                                            train_dataset,
+                                            test_dataset,
+                                            task)
+            results.append((accuracy, acc_log))
+        return results
+
+
+
+
+class ThreadPoolEvaluator(Evaluator):
+    """Evaluates policies in a pool of threads
+
+    Training child networks mostly runs in torch operations which release the
+    GIL, so threads can train several child networks at once. All the threads
+    share the datasets: every evaluation augments its own view of the
+    training set (see dataset_views.transform_view). Each thread gets its own
+    copy of the learner's stopping rule, while the validation helpers
+    (validation.ValidationSubsample and validation.QuantizedValidation) are
+    shared, and are safe to use from several threads. Threads cannot be
+    killed, so there are no timeouts; use a ProcessPoolEvaluator for that.
+
+    Args:
+        num_workers (int): number of threads
+    """
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+        # guards the learner's stopping rule, which submitted tasks update
+        # from the worker threads
+        self._lock = threading.Lock()
+
+
+    def evaluate(self,
+                learner,
+                tasks,
+                child_network_architecture,
+                train_dataset,
+                test_dataset):
+        futures = []
+        for task in tasks:
+            worker_learner = copy.copy(learner)
+            worker_learner.stopping_rule = copy.deepcopy(learner.stopping_rule)
+            futures.append(self._executor.submit(_run_task,
+                                                worker_learner,
+                                                child_network_architecture,
+                                                train_dataset,
+                                                test_dataset,
+                                                task))
+
+        results = [future.result() for future in futures]
+        with self._lock:
+            _add_curves(learner, tasks, results)
+        return [(accuracy, acc_log) for accuracy, acc_log, _ in results]
+
+
+    def submit(self,
+            learner,
+            task,
+            child_network_architecture,
+            train_dataset,
+            test_dataset):
+        with self._lock:
+            worker_learner = copy.copy(learner)
+            worker_learner.stopping_rule = copy.deepcopy(learner.stopping_rule)
+        return self._executor.submit(self._run_submitted_task,
+                                    learner,
+                                    worker_learner,
+                                    child_network_architecture,
+                                    train_dataset,
+                                    test_dataset,
+                                    task)
+
+
+    def _run_submitted_task(self,
+                            learner,
+                            worker_learner,
+                            child_network_architecture,
+                            train_dataset,
+                            test_dataset,
+                            task):
+        result = _run_task(worker_learner,
+                        child_network_architecture,
+                        train_dataset,
+                        test_dataset,
+                        task)
+        # submitted tasks finish in any order, so their curves are added
+        # as they finish
+        with self._lock:
+            _add_curves(learner, [task], [result])
+        accuracy, acc_log, _ = result
+        return accuracy, acc_log
+
+
+    def close(self):
+        self._executor.shutdown()
+
+
+
+
+def _process_worker(conn, train_dataset, test_dataset):
+    """
+    The main loop of the processes of a ProcessPoolEvaluator. Receives
+    (config, child_network_architecture, task) messages, evaluates them and
+    sends back ('ok', result) or ('error', traceback).
+    """
+    # imported here because the learners import this module
+    from autoaug.autoaugment_learners.AaLearner import AaLearner
+
+    # the worker keeps its learner (and so e.g. its cached validation
+    # subsample) between tasks, only its training parameters are updated
+    learner = AaLearner()
+    conn.send(('ready', None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        config, child_network_architecture, task = message
+        for key, value in config.items():
+            setattr(learner, key, value)
+        try:
+            result = _run_task(learner,
+                            child_network_architecture,
+                            train_dataset,
+                            test_dataset,
+                            task)
+            conn.send(('ok', result))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, ctx, train_dataset, test_dataset):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_process_worker,
+                                args=(child_conn, train_dataset, test_dataset),
+                                daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.ready = False
+        self.task_idx = None
+        self.start_time = None
+
+
+    def terminate(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+
+
+class ProcessPoolEvaluator(Evaluator):
+    """Evaluates policies in a pool of persistent worker processes
+
+    The workers are started the first time we evaluate something, and receive
+    the datasets only once, when they start (tensors in the datasets, e.g.
+    MNIST's data, go through shared memory rather than being copied). After
+    that, each task only sends the policy and the learner's child network
+    training parameters.
+
+    If a worker crashes, or a task runs for longer than ``timeout``
+    seconds, the worker is restarted and its task retried up to ``retries``
+    times. An exception raised while evaluating a policy is not retried
+    (it would happen again) and is raised as an EvaluationError.
+
+    Stateful helpers of the learner are copied to the workers with every
+    task: the learner's stopping rule is updated with the learning curves the
+    workers send back, but e.g. the counters of quantized validation are not.
+
+    Args:
+        num_workers (int): number of worker processes
+
+        timeout (float, optional): maximum number of seconds a single
+                        evaluation may take. Defaults to None (no limit).
+
+        retries (int, optional): how often a task is retried after its worker
+                        crashed or timed out. Defaults to 1.
+    """
+
+    def __init__(self, num_workers, timeout=None, retries=1):
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.retries = retries
+
+        self._ctx = mp.get_context('spawn')
+        self._workers = []
+        self._datasets = None
+
+
+    def _start(self, train_dataset, test_dataset):
+        """
+        Starts the workers, unless they are already running with these datasets
+        """
+        if self._datasets is not None and self._datasets[0] is train_dataset \
+                and self._datasets[1] is test_dataset:
+            return
+        self.close()
+        self._datasets = (train_dataset, test_dataset)
+        self._workers = [_Worker(self._ctx, train_dataset, test_dataset)
+                            for _ in range(self.num_workers)]
+
+
+    def _restart(self, worker):
+        worker.terminate()
+        new_worker = _Worker(self._ctx, *self._datasets)
+        self._workers[self._workers.index(worker)] = new_worker
+
+
+    def evaluate(self,
+                learner,
+                tasks,
+                child_network_architecture,
+                train_dataset,
+                test_dataset):
+        self._start(train_dataset, test_dataset)
+        config = learner._child_training_config()
+
+        results = [None] * len(tasks)
+        attempts = [0] * len(tasks)
+        pending = list(range(len(tasks)))
+
+        def _retry(worker, reason):
+            idx = worker.task_idx
+            self._restart(worker)
+            attempts[idx] += 1
+            if attempts[idx] > self.retries:
+                self._abort()
+                raise EvaluationError(f'evaluation {tasks[idx]["eval_id"]} {reason} '
+                                    f'{attempts[idx]} times')
+            pending.insert(0, idx)
+
+        while pending or any(worker.task_idx is not None for worker in self._workers):
+            # hand out tasks to idle workers
+            for worker in self._workers:
+                if pending and worker.ready and worker.task_idx is None:
+                    idx = pending.pop(0)
+                    worker.task_idx = idx
+                    worker.start_time = time.monotonic()
+                    worker.conn.send((config, child_network_architecture, tasks[idx]))
+
+            # wait for a message, or for the next timeout
+            wait_time = None
+            if self.timeout is not None:
+                deadlines = [worker.start_time + self.timeout for worker in self._workers
+                                if worker.task_idx is not None]
+                if deadlines:
+                    wait_time = max(0, min(deadlines) - time.monotonic())
+            ready_conns = wait([worker.conn for worker in self._workers], timeout=wait_time)
+
+            for worker in list(self._workers):
+                if worker.conn in ready_conns:
+                    try:
+                        status, result = worker.conn.recv()
+                    except (EOFError, ConnectionError):
+                        if worker.task_idx is None:
+                            self._restart(worker)
+                        else:
+                            _retry(worker, 'crashed')
+                        continue
+
+                    if status == 'ready':
+                        worker.ready = True
+                    elif status == 'ok':
+                        results[worker.task_idx] = result
+                        worker.task_idx = None
+                    else:
+                        self._abort()
+                        raise EvaluationError(result)
+
+                elif worker.task_idx is not None and self.timeout is not None \
+                        and time.monotonic() - worker.start_time > self.timeout:
+                    _retry(worker, 'timed out')
+
+        _add_curves(learner, tasks, results)
+        return [(accuracy, acc_log) for accuracy, acc_log, _ in results]
+
+
+    def _abort(self):
+        """
+        Restarts all busy workers, so that no results of an abandoned
+        evaluate call arrive later
+        """
+        for worker in list(self._workers):
+            if worker.task_idx is not None:
+                self._restart(worker)
+
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self._workers = []
+        self._datasets = None
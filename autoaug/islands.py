@@ -0,0 +1,211 @@
+"""
+Runs several populations of a genetic learner (islands) side by side
+
+Each island is a learner (e.g. a ``GenLearner`` or an ``EvoLearner``) with its
+own evaluator, searching on its own. Every migration_interval evaluations,
+an island publishes its best policies (its migrants, see
+``AaLearner.get_migrants``) in a directory shared by all the islands, and
+takes in the migrants the other islands have published since it last looked.
+No island ever waits for another, so K islands evaluate about K times as many
+policies per hour as one learner, and the migration keeps good policies
+spreading between populations which otherwise stay diverse.
+
+``run_islands`` runs the islands in local processes. To run islands on
+several nodes, call ``run_island`` on each node with the same (e.g. NFS)
+directory and distinct island ids, and collect the results with
+``merge_histories``.
+"""
+import glob
+import os
+import pickle
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+
+
+def _island_file(directory, island_id):
+    return os.path.join(directory, f'island{island_id}.pkl')
+
+
+def _publish(directory, island_id, migration_round, migrants, history):
+    """
+    Writes what island_id has to share (atomically, so that other islands
+    never read a half written file)
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        pickle.dump({'island_id': island_id,
+                    'round': migration_round,
+                    'migrants': migrants,
+                    'history': history}, file)
+    os.replace(tmp_path, _island_file(directory, island_id))
+
+
+def _read_islands(directory):
+    """
+    Returns {island_id: what the island published last} for all the islands
+    which have published something in directory
+    """
+    islands = {}
+    for path in glob.glob(os.path.join(directory, 'island*.pkl')):
+        with open(path, 'rb') as file:
+            published = pickle.load(file)
+        islands[published['island_id']] = published
+    return islands
+
+
+def merge_histories(directory):
+    """
+    Returns the histories of all the islands which ran in directory, merged
+    into one list of (policy, accuracy), like ``AaLearner.history``
+    """
+    islands = _read_islands(directory)
+    return [result for island_id in sorted(islands)
+                    for result in islands[island_id]['history']]
+
+
+def run_island(island_id,
+            learner_class,
+            learner_kwargs,
+            train_dataset,
+            test_dataset,
+            child_network_architecture,
+            num_evaluations,
+            directory,
+            migration_interval=10,
+            num_migrants=2,
+            seed=None):
+    """
+    Runs one island: a learner_class(**learner_kwargs) which evaluates
+    num_evaluations policies, exchanging migrants with the other islands
+    through directory every migration_interval evaluations.
+
+    Args:
+        island_id (int): distinct for every island sharing directory
+
+        learner_class (type): e.g. ``GenLearner``. The learners of all the
+                        islands of a search should be of the same class.
+
+        learner_kwargs (dict): passed on to learner_class, e.g. with the
+                        island's evaluator
+
+        train_dataset, test_dataset, child_network_architecture: as in
+                        ``AaLearner.learn``
+
+        num_evaluations (int): number of policies this island evaluates
+
+        directory (str): directory shared by the islands
+
+        migration_interval (int, optional): Defaults to 10.
+
+        num_migrants (int, optional): number of its best policies an island
+                        shares at every migration. Defaults to 2.
+
+        seed (int, optional): seeds random, numpy and torch. Defaults to None.
+
+    Returns:
+        AaLearner: the island's learner
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+    learner = learner_class(**learner_kwargs)
+    if hasattr(learner, 'set_controller_input'):
+        learner.set_controller_input(train_dataset)
+    if getattr(learner, 'steady_state', False):
+        search = learner._run_search_async
+    else:
+        search = learner._run_search
+
+    # the last round of migrants we took from each of the other islands
+    rounds_seen = {}
+    migration_round = 0
+    num_evaluated = 0
+    while num_evaluated < num_evaluations:
+        num_epoch_evaluations = min(migration_interval, num_evaluations - num_evaluated)
+        search(train_dataset, test_dataset, child_network_architecture, num_epoch_evaluations)
+        num_evaluated += num_epoch_evaluations
+
+        migration_round += 1
+        _publish(directory, island_id, migration_round,
+                learner.get_migrants(num_migrants), learner.history)
+
+        migrants = []
+        for other_id, published in _read_islands(directory).items():
+            if other_id != island_id and published['round'] > rounds_seen.get(other_id, 0):
+                rounds_seen[other_id] = published['round']
+                migrants += published['migrants']
+        if len(migrants) > 0:
+            learner.add_migrants(migrants)
+
+    return learner
+
+
+def _island_worker(island_id, num_islands, seed, kwargs):
+    """
+    What each process of run_islands runs
+    """
+    torch.set_num_threads(max(1, torch.get_num_threads() // num_islands))
+    run_island(island_id, seed=seed + island_id, **kwargs)
+
+
+def run_islands(learner_class,
+                learner_kwargs,
+                num_islands,
+                train_dataset,
+                test_dataset,
+                child_network_architecture,
+                num_evaluations,
+                migration_interval=10,
+                num_migrants=2,
+                directory=None):
+    """
+    Runs num_islands islands (see run_island) in local processes, each
+    evaluating num_evaluations policies with its own learner_class(**learner_kwargs)
+    (and so its own evaluator, e.g. ``learner_kwargs['evaluator']``, which is
+    pickled and sent to every process), and returns their merged history.
+
+    Args:
+        directory (str, optional): where the islands publish their migrants
+                        and histories. Defaults to None (a temporary
+                        directory, deleted afterwards).
+
+        for the other arguments, see run_island
+
+    Returns:
+        list[(policy, accuracy)]: the histories of all the islands
+    """
+    # each island has its own random seed, drawn from this process' generator
+    # so that runs stay reproducible with torch.manual_seed
+    seed = int(torch.randint(2**31 - num_islands, (1,)))
+
+    tmp_dir = None
+    if directory is None:
+        directory = tmp_dir = tempfile.mkdtemp()
+    try:
+        mp.spawn(_island_worker,
+                args=(num_islands,
+                        seed,
+                        {'learner_class': learner_class,
+                        'learner_kwargs': learner_kwargs,
+                        'train_dataset': train_dataset,
+                        'test_dataset': test_dataset,
+                        'child_network_architecture': child_network_architecture,
+                        'num_evaluations': num_evaluations,
+                        'directory': directory,
+                        'migration_interval': migration_interval,
+                        'num_migrants': num_migrants}),
+                nprocs=num_islands,
+                join=True)
+        return merge_histories(directory)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
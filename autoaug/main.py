@@ -1,7 +1,12 @@
+import contextlib
+import copy
 import numpy as np
+import random
 import torch
+import torch.distributed as dist
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
 import torchvision
 import torchvision.datasets as datasets
 #import autoaug.AutoAugmentDemo.ops as ops # 
@@ -10,11 +15,13 @@ import torchvision.datasets as datasets
 
 
 
-def create_toy(train_dataset, test_dataset, batch_size, n_samples, seed=100):
+def create_toy(train_dataset, test_dataset, batch_size, n_samples, seed=100, num_workers=0):
     if n_samples==1:
         # push into DataLoader
-        train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size)
-        test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size)
+        train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size,
+                                                num_workers=num_workers)
+        test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size,
+                                                num_workers=num_workers)
         return train_loader, test_loader
 
     # shuffle and take first n_samples %age of training dataset
@@ -34,12 +41,98 @@ def create_toy(train_dataset, test_dataset, batch_size, n_samples, seed=100):
     reduced_test_dataset = torch.utils.data.Subset(shuffled_test_dataset, indices_test)
 
     # push into DataLoader
-    train_loader = torch.utils.data.DataLoader(reduced_train_dataset, batch_size=batch_size)
-    test_loader = torch.utils.data.DataLoader(reduced_test_dataset, batch_size=batch_size)
+    train_loader = torch.utils.data.DataLoader(reduced_train_dataset, batch_size=batch_size,
+                                            num_workers=num_workers)
+    test_loader = torch.utils.data.DataLoader(reduced_test_dataset, batch_size=batch_size,
+                                            num_workers=num_workers)
 
     return train_loader, test_loader
 
 
+def _get_rng_state():
+    """
+    Returns the states of all the random number generators a child network
+    training run uses (torch, numpy and python's random), as a dictionary
+    that can be saved with ``torch.save``.
+    """
+    np_state = np.random.get_state()
+    state = {
+        'torch': torch.get_rng_state(),
+        'numpy': (np_state[0], torch.from_numpy(np_state[1].copy()), *np_state[2:]),
+        'random': random.getstate(),
+        }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def _set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np_name, np_keys, *np_rest = state['numpy']
+    np.random.set_state((np_name, np_keys.numpy(), *np_rest))
+    random.setstate(state['random'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+@contextlib.contextmanager
+def _rng_state(state):
+    """
+    Sets the random number generators to ``state`` (unless it is None) for
+    the duration of the with block and then puts the caller's states back,
+    so that resuming a checkpointed run does not rewind the random number
+    streams of the rest of the program.
+    """
+    if state is None:
+        yield
+        return
+    caller_state = _get_rng_state()
+    _set_rng_state(state)
+    try:
+        yield
+    finally:
+        _set_rng_state(caller_state)
+
+
+def _is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def validation_accuracy(child_network, test_loader, device):
+    """
+    Returns the accuracy (a 0-dim tensor) of child_network on test_loader.
+
+    If we are in a process group (see ``distributed``), each process holds a
+    shard of the validation set in test_loader, and the accuracy is that of all
+    the shards together.
+    """
+    correct = 0
+    _sum = 0
+    child_network.eval()
+    with torch.no_grad():
+        for idx, (test_x, test_label) in enumerate(test_loader):
+            # onto device
+            test_x = test_x.to(device=device, dtype=test_x.dtype)
+            test_label = test_label.to(device=device, dtype=test_label.dtype)
+
+            predict_y = child_network(test_x.float()).detach()
+            predict_ys = torch.argmax(predict_y, axis=-1)
+
+            # label_np = test_label.numpy()
+
+            _ = predict_ys == test_label
+            correct += torch.sum(_, axis=-1)
+            # correct += torch.sum(_.numpy(), axis=-1)
+            _sum += _.shape[0]
+
+    if _is_distributed():
+        counts = torch.tensor([float(correct), float(_sum)])
+        dist.all_reduce(counts)
+        correct, _sum = counts[0].to(device=device), counts[1].item()
+
+    return correct / _sum
+
+
 def train_child_network(child_network,
                         train_loader,
                         test_loader,
@@ -50,12 +143,70 @@ def train_child_network(child_network,
                         early_stop_flag=True,
                         average_validation=[15,25],
                         logging=False,
-                        print_every_epoch=True):
+                        print_every_epoch=True,
+                        stopping_rule=None,
+                        checkpoint_store=None,
+                        checkpoint_id=None,
+                        val_subsample=None,
+                        val_every=1,
+                        val_on_plateau=False,
+                        plateau_tol=1e-2,
+                        quantized_validation=None):
+    """
+    Trains child_network on train_loader and checks the validation accuracy
+    on test_loader after every epoch.
+
+    If ``stopping_rule`` (e.g. a ``stopping_rules.MedianStoppingRule``) is given,
+    we ask it after every epoch whether this run should be stopped early, and
+    add the learning curve of this run to it once training is finished.
+
+    If ``checkpoint_store`` (a ``checkpoints.CheckpointStore``) and 
+    ``checkpoint_id`` are given, we save the training state into the store
+    when training is finished. If the store already has a checkpoint under
+    ``checkpoint_id``, we first load it and continue that run exactly where it
+    stopped (e.g. with a larger ``max_epochs``). ``child_network`` and ``sgd``
+    have to be freshly initialised objects of the same kind as in the saved run.
+    The random number generators continue from the checkpoint during the
+    resumed training only, and are put back to the caller's states afterwards.
+    The learning curve of the resumed run replaces the one the saved run added
+    to ``stopping_rule``.
+
+    Validation does not have to happen on the whole of test_loader after every
+    epoch:
+
+        - If ``val_subsample`` (a ``validation.ValidationSubsample``) is given, 
+          the validation accuracy during training is measured on that (cached)
+          subsample of the validation set. Only the final best accuracy is
+          measured on the whole of test_loader, using the weights of the epoch
+          which did best on the subsample.
+        - We validate every ``val_every`` epochs, and in the last epoch. If 
+          ``val_on_plateau`` is True, we also validate in any epoch in which 
+          the training loss improved by less than a fraction ``plateau_tol``.
+          Early stopping counts validations rather than epochs. acc_log only
+          has entries for the epochs in which we validated.
+        - If ``quantized_validation`` (a ``validation.QuantizedValidation``) is
+          given, validation runs through an int8-quantized copy of 
+          child_network whenever that copy agrees closely enough with it.
+
+    child_network may be wrapped in a ``DistributedDataParallel`` (see
+    ``distributed.train_child_network_distributed``). Then each process
+    trains and validates on its own shard of the data, and the validation
+    accuracy and training loss are those of all the processes together, so
+    that every process makes the same early stopping decisions.
+
+    Returns:
+        best_acc (float), or (best_acc, acc_log) if logging is True, where
+        acc_log is the list of (epoch, validation accuracy) of every validation
+    """
     if torch.cuda.is_available():
         device = torch.device('cuda')
     else:
         device = torch.device('cpu')
     child_network = child_network.to(device=device)
+    # the network without the DistributedDataParallel wrapper, which is
+    # all that validation needs
+    model = child_network.module if isinstance(child_network, DistributedDataParallel) \
+                else child_network
     
     total_val=torch.tensor([0.0]).to(device=device)
     best_acc=torch.tensor([0.0]).to(device=device)
@@ -63,73 +214,135 @@ def train_child_network(child_network,
     
     # logging accuracy for plotting
     acc_log = [] 
+    stopped_by_rule = False
+
+    # weights of the epoch with the best validation accuracy, only needed
+    # when that accuracy was measured on a subsample
+    best_state = None
+    prev_loss = None
+
+    use_checkpoints = checkpoint_store is not None and checkpoint_id is not None
+    checkpoint = checkpoint_store.load(checkpoint_id) if use_checkpoints else None
+    if checkpoint is not None:
+        child_network.load_state_dict(checkpoint['model'])
+        sgd.load_state_dict(checkpoint['optimizer'])
+        total_val = checkpoint['total_val'].to(device=device)
+        best_acc = checkpoint['best_acc'].to(device=device)
+        early_stop_cnt = checkpoint['early_stop_cnt']
+        acc_log = [(epoch, acc.to(device=device)) for epoch, acc in checkpoint['acc_log']]
+        best_state = checkpoint.get('best_state')
+        prev_loss = checkpoint.get('prev_loss')
+
+    # a saved run which has already early stopped has nothing left to train
+    finished = checkpoint is not None and early_stop_flag and early_stop_cnt >= early_stop_num
 
     # train child_network and check validation accuracy each epoch
-    _epoch=0
-    while _epoch < max_epochs:
+    _epoch=checkpoint['epoch'] if checkpoint is not None else 0
+    # a resumed run continues the random number streams of its checkpoint,
+    # without touching those of the caller
+    with _rng_state(checkpoint['rng_state'] if checkpoint is not None else None):
+        while _epoch < max_epochs and not finished:
 
-        # train child_network
-        child_network.train()
-        for idx, (train_x, train_label) in enumerate(train_loader):
-            # onto device
-            train_x = train_x.to(device=device, dtype=train_x.dtype)
-            train_label = train_label.to(device=device, dtype=train_label.dtype)
-
-            # label_np = np.zeros((train_label.shape[0], 10))
-
-            sgd.zero_grad()
-            predict_y = child_network(train_x.float())
-            loss = cost(predict_y, train_label.long())
-            loss.backward()
-            sgd.step()
-
-        # check validation accuracy on validation set
-        correct = 0
-        _sum = 0
-        child_network.eval()
-        with torch.no_grad():
-            for idx, (test_x, test_label) in enumerate(test_loader):
+            # train child_network
+            child_network.train()
+            epoch_loss = 0.0
+            for idx, (train_x, train_label) in enumerate(train_loader):
                 # onto device
-                test_x = test_x.to(device=device, dtype=test_x.dtype)
-                test_label = test_label.to(device=device, dtype=test_label.dtype)
+                train_x = train_x.to(device=device, dtype=train_x.dtype)
+                train_label = train_label.to(device=device, dtype=train_label.dtype)
 
-                predict_y = child_network(test_x.float()).detach()
-                predict_ys = torch.argmax(predict_y, axis=-1)
+                # label_np = np.zeros((train_label.shape[0], 10))
 
-                # label_np = test_label.numpy()
+                sgd.zero_grad()
+                predict_y = child_network(train_x.float())
+                loss = cost(predict_y, train_label.long())
+                loss.backward()
+                sgd.step()
+                epoch_loss += loss.detach()
+            if _is_distributed():
+                epoch_loss = torch.as_tensor(epoch_loss, dtype=torch.float).cpu()
+                dist.all_reduce(epoch_loss)
+                epoch_loss /= dist.get_world_size()
+            epoch_loss = float(epoch_loss)
 
-                _ = predict_ys == test_label
-                correct += torch.sum(_, axis=-1)
-                # correct += torch.sum(_.numpy(), axis=-1)
-                _sum += _.shape[0]
-        
-        
-        acc = correct / _sum
+            # decide whether we check the validation accuracy in this epoch
+            plateaued = prev_loss is not None and prev_loss - epoch_loss < plateau_tol * abs(prev_loss)
+            prev_loss = epoch_loss
+            validate = (_epoch+1) % val_every == 0 or _epoch+1 >= max_epochs \
+                            or (val_on_plateau and plateaued)
+            if not validate:
+                _epoch+=1
+                continue
+
+            # check validation accuracy on validation set
+            val_network = model
+            if quantized_validation is not None:
+                val_network = quantized_validation.network_for_validation(model,
+                                                                        test_loader,
+                                                                        device)
+            if val_subsample is not None:
+                acc = val_subsample.evaluate(val_network, device)
+            else:
+                acc = validation_accuracy(val_network, test_loader, device)
+            acc_log.append((_epoch, acc))
 
-        if average_validation[0] <= _epoch <= average_validation[1]:
-            total_val += acc
+            if average_validation[0] <= _epoch <= average_validation[1]:
+                total_val += acc
 
 	# update best validation accuracy if it was higher, otherwise increase early stop count
-        if acc > best_acc :
-            best_acc = acc
-            early_stop_cnt = 0
-        else:
-            early_stop_cnt += 1
-
-        # exit if validation gets worse over 10 runs and using early stopping
-        if early_stop_cnt >= early_stop_num and early_stop_flag:
-            break
-
-        # exit if using fixed epoch length
-        if _epoch >= average_validation[1] and not early_stop_flag:
-            best_acc = total_val / (average_validation[1] - average_validation[0] + 1)
-            break
+            if acc > best_acc :
+                best_acc = acc
+                early_stop_cnt = 0
+                if val_subsample is not None:
+                    best_state = copy.deepcopy(model.state_dict())
+            else:
+                early_stop_cnt += 1
+
+            # exit if validation gets worse over 10 runs and using early stopping
+            if early_stop_cnt >= early_stop_num and early_stop_flag:
+                break
+
+            # exit if using fixed epoch length
+            if _epoch >= average_validation[1] and not early_stop_flag:
+                best_acc = total_val / (average_validation[1] - average_validation[0] + 1)
+                break
+
+            # exit if this run is doing worse than previous runs did at this epoch
+            if stopping_rule is not None and stopping_rule.should_stop(_epoch, best_acc.item()):
+                stopped_by_rule = True
+                break
         
-        if print_every_epoch:
-            print('main.train_child_network best accuracy: ', best_acc)
-        acc_log.append(acc)
+            if print_every_epoch:
+                print('main.train_child_network best accuracy: ', best_acc)
+
+            _epoch+=1
+
+        if stopping_rule is not None:
+            # a resumed run replaces the curve its checkpoint added
+            stopping_rule.add_curve(acc_log, stopped=stopped_by_rule,
+                                    curve_id=checkpoint_id if use_checkpoints else None)
+
+        if use_checkpoints:
+            checkpoint_store.save(checkpoint_id, {
+                'model': child_network.state_dict(),
+                'optimizer': sgd.state_dict(),
+                # training always ends with a validation
+                'epoch': acc_log[-1][0] + 1 if len(acc_log) > 0 else _epoch,
+                'total_val': total_val.cpu(),
+                'best_acc': best_acc.cpu(),
+                'early_stop_cnt': early_stop_cnt,
+                'acc_log': [(epoch, acc.cpu()) for epoch, acc in acc_log],
+                'best_state': best_state,
+                'prev_loss': prev_loss,
+                'rng_state': _get_rng_state(),
+                })
 
-        _epoch+=1
+    # the best accuracy on the subsample is only used to pick the best
+    # epoch. The score we report is measured on the whole validation set
+    if best_state is not None and early_stop_flag:
+        best_network = copy.deepcopy(model)
+        best_network.load_state_dict(best_state)
+        best_acc = validation_accuracy(best_network, test_loader, device)
 
     if logging:
         return best_acc.item(), acc_log
@@ -0,0 +1,200 @@
+import numpy as np
+
+
+
+
+class MedianStoppingRule:
+    """Stops evaluations whose learning curve falls behind earlier evaluations
+
+    Every call of ``AaLearner._test_autoaugment_policy`` produces a learning
+    curve ((epoch, validation accuracy) of each validation). This rule keeps
+    the curves of all previous evaluations and, while a new child network is
+    being trained, compares its best accuracy so far at epoch ``t`` with the
+    ``percentile``-th percentile of the best accuracies the previous
+    evaluations had reached at epoch ``t``. If it is lower, the evaluation is
+    stopped early. Previous evaluations which did not validate by epoch ``t``
+    (e.g. because they validated every few epochs) are left out of the
+    comparison rather than counted as 0.
+
+    With ``percentile=50`` this is the median stopping rule from Google Vizier.
+
+    Args:
+        percentile (float, optional): percentile (between 0 and 100) of previous
+                        curves the running evaluation has to keep up with.
+                        Defaults to 50.
+
+        grace_epochs (int, optional): number of epochs an evaluation is always
+                        allowed to run before the rule can stop it. Defaults to 5.
+
+        min_curves (int, optional): minimum number of previous curves that
+                        must have reached epoch ``t`` before we compare against
+                        them. Defaults to 3.
+
+    Attributes:
+        curves (list): learning curves (lists of (epoch, accuracy)) of all
+                        evaluations added through ``self.add_curve``
+
+        num_stopped (int): how many evaluations this rule has stopped
+
+        epochs_trained (int): total number of epochs trained over all the
+                        evaluations added through ``self.add_curve``
+
+        epochs_saved (int): estimate of how many epochs we did not have to train
+                        because of this rule. For each stopped evaluation this
+                        is the median number of epochs the previous evaluations
+                        were run for minus the number of epochs the evaluation
+                        was run for.
+
+    References
+    ----------
+    Daniel Golovin, et al.
+        "Google Vizier: A Service for Black-Box Optimization"
+        https://research.google/pubs/pub46180/
+    """
+
+    def __init__(self, percentile=50, grace_epochs=5, min_curves=3):
+        assert 0 <= percentile <= 100, percentile
+
+        self.percentile = percentile
+        self.grace_epochs = grace_epochs
+        self.min_curves = min_curves
+
+        self.curves = []
+        # self._best_curves[i] is (epochs, best) where epochs are the epochs
+        # self.curves[i] validated in, and best[j] is the best accuracy it
+        # reached up to (and including) epochs[j]
+        self._best_curves = []
+        # {curve_id: index in self.curves} of the curves added with an id
+        self._curve_idx = {}
+        # whether each of self.curves was stopped by this rule
+        self._stopped = []
+        # the epochs each of self.curves counts for in self.epochs_saved
+        self._saved = []
+
+        self.num_stopped = 0
+        self.epochs_trained = 0
+        self.epochs_saved = 0
+
+
+    def add_curve(self, curve, stopped=False, curve_id=None):
+        """
+        Adds the learning curve of a finished evaluation
+
+        Args:
+            curve (list[tuple]): (epoch, validation accuracy) of each validation.
+                        A list of accuracies is taken to have a validation in
+                        every epoch.
+
+            stopped (bool, optional): whether the evaluation was stopped by
+                        this rule. Defaults to False.
+
+            curve_id (str, optional): if a curve was already added under this
+                        id (e.g. by an evaluation which has since been resumed
+                        from its checkpoint), curve replaces it rather than
+                        being added as another evaluation. Defaults to None.
+        """
+        if len(curve) > 0 and np.ndim(curve[0]) == 0:
+            curve = enumerate(curve)
+        curve = [(int(epoch), float(acc)) for epoch, acc in curve]
+        best_curve = (np.array([epoch for epoch, _ in curve], dtype=int),
+                        np.maximum.accumulate([acc for _, acc in curve]) if len(curve)>0
+                            else np.array([]))
+
+        if curve_id is not None and curve_id in self._curve_idx:
+            idx = self._curve_idx[curve_id]
+            # only the epochs the resumed evaluation added were trained now,
+            # and what the replaced curve saved no longer counts
+            saved = _epochs_saved(curve, stopped, self.curves[:idx] + self.curves[idx+1:])
+            self.epochs_trained += _num_epochs(curve) - _num_epochs(self.curves[idx])
+            self.epochs_saved += saved - self._saved[idx]
+            self.curves[idx] = curve
+            self._best_curves[idx] = best_curve
+            self.num_stopped += int(stopped) - int(self._stopped[idx])
+            self._stopped[idx] = stopped
+            self._saved[idx] = saved
+            return
+
+        saved = _epochs_saved(curve, stopped, self.curves)
+        self.num_stopped += int(stopped)
+        self.epochs_trained += _num_epochs(curve)
+        self.epochs_saved += saved
+        if curve_id is not None:
+            self._curve_idx[curve_id] = len(self.curves)
+        self.curves.append(curve)
+        self._best_curves.append(best_curve)
+        self._stopped.append(stopped)
+        self._saved.append(saved)
+
+
+    def threshold(self, epoch):
+        """
+        Returns the accuracy an evaluation needs to have reached by ``epoch``
+        to not be stopped, or None if there are not enough previous curves
+        that reached ``epoch`` with a validation at or before it.
+        """
+        reached = []
+        for epochs, best in self._best_curves:
+            if len(epochs) == 0 or epochs[-1] < epoch:
+                continue
+            # the last validation at or before epoch
+            idx = np.searchsorted(epochs, epoch, side='right') - 1
+            if idx >= 0:
+                reached.append(best[idx])
+
+        if len(reached) < self.min_curves:
+            return None
+
+        return float(np.percentile(reached, self.percentile))
+
+
+    def should_stop(self, epoch, best_acc):
+        """
+        Called by ``main.train_child_network`` after every validation
+
+        Args:
+            epoch (int): the epoch that has just finished (starting at 0)
+
+            best_acc (float): best validation accuracy of the running evaluation
+                        so far
+
+        Returns:
+            bool: whether the running evaluation should be stopped
+        """
+        if epoch < self.grace_epochs:
+            return False
+
+        threshold = self.threshold(epoch)
+        if threshold is None:
+            return False
+
+        return best_acc < threshold
+
+
+    def get_compute_saved(self):
+        """
+        Returns a dictionary which summarises how much child network training
+        this rule has saved.
+        """
+        total = self.epochs_trained + self.epochs_saved
+
+        return {
+            'num_evaluations': len(self.curves),
+            'num_stopped': self.num_stopped,
+            'epochs_trained': self.epochs_trained,
+            'epochs_saved': self.epochs_saved,
+            'fraction_saved': self.epochs_saved / total if total > 0 else 0.0,
+        }
+
+
+def _num_epochs(curve):
+    # training always ends with a validation
+    return curve[-1][0] + 1 if len(curve) > 0 else 0
+
+
+def _epochs_saved(curve, stopped, other_curves):
+    # a stopped curve saved the epochs the median one of the others trained
+    # for beyond it
+    full_lengths = [_num_epochs(c) for c in other_curves]
+    if not stopped or len(full_lengths) == 0:
+        return 0
+    return max(0, int(np.median(full_lengths)) - _num_epochs(curve))
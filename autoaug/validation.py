@@ -0,0 +1,308 @@
+import math
+import threading
+import weakref
+from statistics import NormalDist
+
+import numpy as np
+import torch
+
+
+
+
+class ValidationSubsample:
+    """A fixed, cached subsample of a validation set
+
+    Checking the validation accuracy of a child network on the whole validation
+    set after every epoch is expensive (e.g. 10k images per epoch per policy
+    for MNIST with toy_size=1). Accuracy measured on n images has a
+    confidence interval of half-width
+
+        z * sqrt(acc * (1-acc) / n)
+
+    so we only need as many images as it takes to make this smaller than
+    ``target_ci``. This class keeps the validation images of a fixed random
+    order of the validation set in memory as tensors, and measures accuracy on
+    the first ``self.size`` of them. After each measurement, ``self.size`` is
+    grown (never shrunk) to what the measured accuracy requires, so the
+    subsample stays the same for all epochs and all policies, except that it
+    can grow. Several threads (e.g. of an ``evaluators.ThreadPoolEvaluator``)
+    can evaluate on the same subsample at once: each evaluation uses the size
+    the subsample had when it started.
+
+    Args:
+        dataset (torch.utils.data.Dataset): the validation set. Its transform
+                        has to be deterministic (e.g. ToTensor()).
+
+        target_ci (float, optional): half-width of the confidence interval of
+                        the measured accuracy we aim for. Defaults to 0.02.
+
+        confidence (float, optional): confidence level of the confidence interval.
+                        Defaults to 0.95.
+
+        min_size (int, optional): the subsample has at least this many images
+                        (or the whole validation set if it is smaller).
+                        Defaults to 200.
+
+        batch_size (int, optional): batch size of the forward passes.
+                        Defaults to 256.
+
+        seed (int, optional): seed of the random order. Defaults to 0.
+    """
+
+    def __init__(self, dataset, target_ci=0.02, confidence=0.95, min_size=200,
+                batch_size=256, seed=0):
+        self.dataset = dataset
+        self.target_ci = target_ci
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.batch_size = batch_size
+
+        self.order = np.random.RandomState(seed=seed).permutation(len(dataset))
+        self.size = min(min_size, len(dataset))
+
+        # cached images and labels of self.order[:len(self._labels)]
+        self._images = None
+        self._labels = None
+        # guards self.size and the cache
+        self._lock = threading.Lock()
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+    def required_size(self, acc):
+        """
+        Number of images needed so that the confidence interval of an accuracy
+        of ``acc`` has half-width at most self.target_ci
+        """
+        # we never assume a variance smaller than that of 1% or 99% accuracy
+        variance = max(acc * (1 - acc), 0.01 * 0.99)
+        return math.ceil(self.z**2 * variance / self.target_ci**2)
+
+
+    def ci_half_width(self, acc, n=None):
+        """
+        Half-width of the confidence interval of ``acc`` measured on n images
+        (by default self.size)
+        """
+        n = self.size if n is None else n
+        return self.z * math.sqrt(acc * (1 - acc) / n)
+
+
+    def _cache(self, n):
+        """
+        Makes sure the first n images of self.order are cached as tensors
+        """
+        cached = 0 if self._labels is None else len(self._labels)
+        if n <= cached:
+            return
+
+        images, labels = [], []
+        for idx in self.order[cached:n]:
+            image, label = self.dataset[int(idx)]
+            images.append(image)
+            labels.append(label)
+        images = torch.stack(images)
+        labels = torch.as_tensor(labels)
+
+        if self._labels is None:
+            self._images, self._labels = images, labels
+        else:
+            self._images = torch.cat([self._images, images])
+            self._labels = torch.cat([self._labels, labels])
+
+
+    def evaluate(self, child_network, device):
+        """
+        Returns the accuracy (a 0-dim tensor) of child_network on the
+        subsample, and grows the subsample if that accuracy needs more images
+        to reach self.target_ci.
+        """
+        with self._lock:
+            size = self.size
+            self._cache(size)
+            images, labels = self._images[:size], self._labels[:size]
+
+        correct = 0
+        child_network.eval()
+        with torch.no_grad():
+            for start in range(0, size, self.batch_size):
+                test_x = images[start:start+self.batch_size].to(device=device)
+                test_label = labels[start:start+self.batch_size].to(device=device)
+
+                predict_ys = torch.argmax(child_network(test_x.float()), axis=-1)
+                correct += torch.sum(predict_ys == test_label)
+
+        acc = correct / size
+
+        with self._lock:
+            self.size = min(len(self.dataset), max(self.size, self.required_size(acc.item())))
+        return acc
+
+
+
+
+class QuantizedValidation:
+    """Validates child networks through dynamically int8-quantized copies
+
+    The validation in ``main.train_child_network`` only needs the argmax of
+    the child network's outputs, so we can run it through a copy of the child
+    network whose ``nn.Linear`` layers are dynamically quantized to int8
+    (``torch.ao.quantization.quantize_dynamic``). For networks dominated by
+    Linear layers, e.g. ``EasyNet``, this makes validation considerably cheaper.
+
+    The copy is re-quantized from the live weights every time we validate.
+    In the first validation of each child network, and then every
+    ``check_every`` validations, we check on a fixed calibration sample of the
+    validation set that the quantized copy's argmax agrees with the fp32
+    network's on at least ``min_agreement`` of the images. If it does not (or
+    int8 is not available on this machine), we validate with the fp32 network
+    instead, until the next check. In between checks, we reuse the decision.
+
+    An agreement check costs an fp32 and an int8 forward pass over the
+    calibration images, so this is only a net win if the validation set (or
+    the ``validation.ValidationSubsample``) is several times larger than
+    the calibration sample, the checks are rare, and the network's cost is in
+    its Linear layers (convolutions are not quantized). For a small ``val_ci``
+    subsample, or a cheap network, validating in fp32 is faster.
+
+    Args:
+        min_agreement (float, optional): minimum fraction of calibration images
+                        on which the argmax of the quantized and fp32 networks
+                        have to agree. Defaults to 0.99.
+
+        calibration_size (int, optional): number of validation images used for
+                        the agreement check. Defaults to 256.
+
+        check_every (int, optional): number of validations of a child network
+                        after which we check the agreement again. Defaults to 5.
+
+    Attributes:
+        num_int8 (int): how many validations ran through a quantized copy
+
+        num_fp32 (int): how many validations fell back to the fp32 network
+
+        num_checks (int): how many agreement checks we ran
+    """
+
+    def __init__(self, min_agreement=0.99, calibration_size=256, check_every=5):
+        self.min_agreement = min_agreement
+        self.calibration_size = calibration_size
+        self.check_every = check_every
+
+        self._calibration_x = None
+        # {child_network: [validations since the last check, whether we use int8]}
+        self._decisions = weakref.WeakKeyDictionary()
+        self.num_int8 = 0
+        self.num_fp32 = 0
+        self.num_checks = 0
+        # guards the calibration images, the decisions and the counters, as
+        # threads (e.g. of an evaluators.ThreadPoolEvaluator) share this object
+        self._lock = threading.Lock()
+
+
+    def __getstate__(self):
+        # the decisions are about the networks of this process
+        state = self.__dict__.copy()
+        state['_decisions'] = None
+        del state['_lock']
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._decisions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def is_available(device):
+        """
+        dynamic quantization only runs on cpu, and needs a quantized engine
+        """
+        engines = [engine for engine in torch.backends.quantized.supported_engines
+                        if engine != 'none']
+        return device.type == 'cpu' and len(engines) > 0
+
+
+    def _calibration_images(self, test_loader):
+        with self._lock:
+            if self._calibration_x is None:
+                images = []
+                num_images = 0
+                for test_x, _ in test_loader:
+                    images.append(test_x)
+                    num_images += len(test_x)
+                    if num_images >= self.calibration_size:
+                        break
+                self._calibration_x = torch.cat(images)[:self.calibration_size].float()
+            return self._calibration_x
+
+
+    def network_for_validation(self, child_network, test_loader, device):
+        """
+        Returns the network the validation of this epoch should run through:
+        a freshly quantized copy of child_network if its argmax agreed enough
+        with child_network's on the calibration images at the last check,
+        otherwise child_network itself.
+        """
+        if not self.is_available(device):
+            with self._lock:
+                self.num_fp32 += 1
+            return child_network
+
+        with self._lock:
+            decision = self._decisions.get(child_network)
+            check = decision is None or decision[0] >= self.check_every
+            if not check and not decision[1]:
+                decision[0] += 1
+                self.num_fp32 += 1
+                return child_network
+
+        child_network.eval()
+        try:
+            quantized_network = torch.ao.quantization.quantize_dynamic(
+                                                child_network,
+                                                {torch.nn.Linear},
+                                                dtype=torch.qint8)
+        except (RuntimeError, AssertionError):
+            quantized_network = None
+
+        if check:
+            use_int8 = quantized_network is not None \
+                            and self._agreement(child_network,
+                                                quantized_network,
+                                                test_loader,
+                                                device) >= self.min_agreement
+            decision = [0, use_int8]
+            with self._lock:
+                self._decisions[child_network] = decision
+                self.num_checks += 1
+
+        with self._lock:
+            decision[0] += 1
+            use_int8 = decision[1] and quantized_network is not None
+            if use_int8:
+                self.num_int8 += 1
+            else:
+                self.num_fp32 += 1
+        return quantized_network if use_int8 else child_network
+
+
+    def _agreement(self, child_network, quantized_network, test_loader, device):
+        """
+        Returns the fraction of the calibration images on which the argmax of
+        quantized_network agrees with child_network's
+        """
+        calibration_x = self._calibration_images(test_loader).to(device=device)
+        with torch.no_grad():
+            fp32_ys = torch.argmax(child_network(calibration_x), axis=-1)
+            int8_ys = torch.argmax(quantized_network(calibration_x), axis=-1)
+        return (fp32_ys == int8_ys).float().mean().item()
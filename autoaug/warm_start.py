@@ -0,0 +1,170 @@
+import copy
+
+import numpy as np
+import torch.nn as nn
+import torch.optim as optim
+import torchvision.transforms as transforms
+
+from autoaug.main import train_child_network, create_toy
+from autoaug.dataset_views import transform_view
+
+
+
+
+def pretrain_child_network(child_network,
+                        train_dataset,
+                        test_dataset,
+                        batch_size,
+                        toy_size,
+                        learning_rate,
+                        max_epochs=20,
+                        early_stop_num=20,
+                        print_every_epoch=False):
+    """
+    Trains child_network on the un-augmented toy dataset and returns its
+    state dict. This is the checkpoint that AaLearner fine tunes from
+    when it uses warm_start=True.
+
+    Args:
+        child_network (nn.Module): freshly initialised child network
+
+        train_dataset, test_dataset (torchvision.dataset.vision.VisionDataset)
+
+        batch_size, toy_size, learning_rate, max_epochs, early_stop_num:
+                        child_network training parameters
+
+    Returns:
+        state_dict (dict): state dict of the pretrained child network (on cpu)
+    """
+    train_loader, test_loader = create_toy(transform_view(train_dataset, transforms.ToTensor()),
+                                        test_dataset,
+                                        batch_size=batch_size,
+                                        n_samples=toy_size,
+                                        seed=100)
+
+    train_child_network(child_network,
+                        train_loader,
+                        test_loader,
+                        sgd=optim.SGD(child_network.parameters(), lr=learning_rate),
+                        cost=nn.CrossEntropyLoss(),
+                        max_epochs=max_epochs,
+                        early_stop_num=early_stop_num,
+                        print_every_epoch=print_every_epoch)
+
+    return {key: value.detach().cpu().clone() for key, value in child_network.state_dict().items()}
+
+
+def freeze_early_layers(child_network, num_layers):
+    """
+    Freezes (sets requires_grad=False on) the parameters of the first
+    num_layers modules of child_network which have parameters of their own,
+    in the order in which they were defined. For LeNet, num_layers=2
+    freezes conv1 and conv2.
+
+    Returns:
+        frozen (list[str]): names of the frozen modules
+    """
+    frozen = []
+    for name, module in child_network.named_modules():
+        if len(frozen) >= num_layers:
+            break
+        own_params = list(module.parameters(recurse=False))
+        if len(own_params) == 0:
+            continue
+        for param in own_params:
+            param.requires_grad = False
+        frozen.append(name)
+
+    return frozen
+
+
+def _ranks(values):
+    """
+    Ranks of values (starting at 0), where ties get the average of their ranks
+    """
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values, kind='mergesort')
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+
+    for value in np.unique(values):
+        tied = values == value
+        ranks[tied] = ranks[tied].mean()
+
+    return ranks
+
+
+def spearman_rank_correlation(x, y):
+    """
+    Spearman's rank correlation coefficient between the sequences x and y
+    """
+    assert len(x) == len(y), (len(x), len(y))
+
+    rank_x = _ranks(x)
+    rank_y = _ranks(y)
+    if rank_x.std() == 0 or rank_y.std() == 0:
+        return float('nan')
+
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
+
+
+def warm_start_rank_correlation(learner,
+                                policies,
+                                child_network_architecture,
+                                train_dataset,
+                                test_dataset,
+                                print_every_epoch=False):
+    """
+    Evaluates each of the policies both by fine tuning from the pretrained child
+    network (as learner does with warm_start=True) and by training from scratch,
+    and reports how similarly the two rank the policies. If the rank
+    correlation is high, the (much cheaper) warm start evaluations can safely be
+    used to compare policies.
+
+    Nothing is added to learner.history.
+
+    Args:
+        learner (AaLearner): supplies the child network training parameters
+                        (e.g. fine_tune_epochs, freeze_layers, max_epochs)
+
+        policies (list): a sample of policies, e.g.
+                        [learner._generate_new_policy() for _ in range(10)]
+                        for an RsLearner
+
+        child_network_architecture (Union[function, nn.Module])
+
+        train_dataset, test_dataset (torchvision.dataset.vision.VisionDataset)
+
+    Returns:
+        dict: with keys 'spearman' (the rank correlation), 'warm_start_accs' and
+                        'scratch_accs' (the accuracies of each policy)
+    """
+    # the evaluations here must not interact with the learner's own runs
+    learner = copy.copy(learner)
+    learner.stopping_rule = None
+    learner.checkpoint_store = None
+
+    warm_start_accs = []
+    scratch_accs = []
+    for policy in policies:
+        acc, _ = learner._evaluate_policy(policy,
+                                        child_network_architecture,
+                                        train_dataset,
+                                        test_dataset,
+                                        print_every_epoch=print_every_epoch,
+                                        warm_start=True)
+        warm_start_accs.append(acc)
+
+        acc, _ = learner._evaluate_policy(policy,
+                                        child_network_architecture,
+                                        train_dataset,
+                                        test_dataset,
+                                        print_every_epoch=print_every_epoch,
+                                        warm_start=False)
+        scratch_accs.append(acc)
+
+    return {
+        'spearman': spearman_rank_correlation(warm_start_accs, scratch_accs),
+        'warm_start_accs': warm_start_accs,
+        'scratch_accs': scratch_accs,
+        }
@@ -0,0 +1,396 @@
+"""
+Evaluates policies for learners on other machines
+
+A learner with a ``QueueEvaluator`` puts its evaluations as jobs into a
+SQLite database (e.g. on NFS, shared by several nodes), and any number of
+workers, started with
+
+    python -m autoaug.worker --queue PATH
+
+claim the jobs, train the child networks and write the results back. There
+is no broker: the database is the queue. A worker holds a lease on the job it
+is running and renews it while training. If the worker dies, its lease
+expires and the job goes back to the queue for another worker, unless it
+has already been claimed max_attempts times: a job which keeps killing its
+workers (e.g. running out of memory) fails instead.
+"""
+import argparse
+import hashlib
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from autoaug.evaluators import Evaluator, EvaluationError, _run_task, _add_curves
+
+
+
+
+class SqliteQueue:
+    """A job queue in a SQLite database
+
+    Args:
+        path (str): path of the database file. It is created if it does not exist.
+
+        lease_timeout (float, optional): number of seconds after which a claimed
+                        job whose lease was not renewed goes back to the queue.
+                        Defaults to 600.
+
+        max_attempts (int, optional): a job whose lease expires after it has
+                        been claimed this many times fails instead of going
+                        back to the queue. Defaults to 3.
+    """
+
+    def __init__(self, path, lease_timeout=600, max_attempts=3):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        with self._connect() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                payload BLOB NOT NULL,
+                                status TEXT NOT NULL DEFAULT 'pending',
+                                worker TEXT,
+                                lease_expires REAL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                result BLOB,
+                                error TEXT)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                                key TEXT PRIMARY KEY,
+                                data BLOB NOT NULL)""")
+
+
+    def _connect(self):
+        # autocommit mode, so that we can open write transactions ourselves
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return _Connection(conn)
+
+
+    def put_blob(self, obj):
+        """
+        Stores obj (e.g. a dataset, which many jobs share) once and returns the
+        key jobs can refer to it by
+        """
+        data = pickle.dumps(obj)
+        key = hashlib.sha1(data).hexdigest()
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO blobs (key, data) VALUES (?, ?)', (key, data))
+        return key
+
+
+    def get_blob(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM blobs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+
+    def submit(self, payload):
+        """
+        Adds a job and returns its id
+        """
+        with self._connect() as conn:
+            cursor = conn.execute('INSERT INTO jobs (payload) VALUES (?)',
+                                (pickle.dumps(payload),))
+            return cursor.lastrowid
+
+
+    def claim(self, worker):
+        """
+        Claims the oldest pending job (first putting jobs with expired leases
+        back into the queue, or failing them if they have been claimed
+        self.max_attempts times) for worker.
+
+        Returns:
+            (job_id, payload), or None if there are no pending jobs
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute("""UPDATE jobs SET status = 'failed', worker = NULL,
+                                lease_expires = NULL,
+                                error = 'the lease of the job expired ' || attempts ||
+                                        ' times (its workers died, e.g. out of memory)'
+                                WHERE status = 'running' AND lease_expires < ?
+                                    AND attempts >= ?""", (now, self.max_attempts))
+                conn.execute("""UPDATE jobs SET status = 'pending', worker = NULL
+                                WHERE status = 'running' AND lease_expires < ?""", (now,))
+                row = conn.execute("""SELECT id, payload FROM jobs WHERE status = 'pending'
+                                    ORDER BY id LIMIT 1""").fetchone()
+                if row is not None:
+                    conn.execute("""UPDATE jobs SET status = 'running', worker = ?,
+                                    lease_expires = ?, attempts = attempts + 1
+                                    WHERE id = ?""",
+                                (worker, now + self.lease_timeout, row[0]))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1])
+
+
+    def renew(self, job_id, worker):
+        """
+        Extends the lease of worker on job_id. Returns False if worker has lost
+        the job (because its lease expired and the job went to another worker).
+        """
+        with self._connect() as conn:
+            cursor = conn.execute("""UPDATE jobs SET lease_expires = ?
+                                    WHERE id = ? AND worker = ? AND status = 'running'""",
+                                (time.time() + self.lease_timeout, job_id, worker))
+            return cursor.rowcount == 1
+
+
+    def complete(self, job_id, worker, result):
+        self._finish(job_id, worker, 'done', result=pickle.dumps(result))
+
+
+    def fail(self, job_id, worker, error):
+        self._finish(job_id, worker, 'failed', error=error)
+
+
+    def _finish(self, job_id, worker, status, result=None, error=None):
+        # a worker which has lost its job must not overwrite the result of
+        # the worker which has it now
+        with self._connect() as conn:
+            conn.execute("""UPDATE jobs SET status = ?, result = ?, error = ?,
+                            lease_expires = NULL
+                            WHERE id = ? AND worker = ? AND status = 'running'""",
+                        (status, result, error, job_id, worker))
+
+
+    def results(self, job_ids):
+        """
+        Returns {job_id: ('done', result) or ('failed', error)} for the
+        finished jobs among job_ids
+        """
+        finished = {}
+        with self._connect() as conn:
+            for job_id in job_ids:
+                row = conn.execute('SELECT status, result, error FROM jobs WHERE id = ?',
+                                (job_id,)).fetchone()
+                if row is None:
+                    raise KeyError(job_id)
+                status, result, error = row
+                if status == 'done':
+                    finished[job_id] = ('done', pickle.loads(result))
+                elif status == 'failed':
+                    finished[job_id] = ('failed', error)
+        return finished
+
+
+    def counts(self):
+        """
+        Returns the number of jobs of each status
+        """
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+
+class _Connection:
+    """
+    sqlite3 connections do not close when used as context managers
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *args):
+        self.conn.close()
+
+
+
+
+class QueueEvaluator(Evaluator):
+    """Evaluates policies through workers reading from a SqliteQueue
+
+    Args:
+        path (str): path of the queue's database, which the workers
+                        (``python -m autoaug.worker --queue PATH``) read from
+
+        num_workers (int, optional): how many workers there are, i.e. how
+                        many policies learners should propose at once.
+                        Defaults to 1.
+
+        lease_timeout (float, optional): see SqliteQueue. Defaults to 600.
+
+        poll_interval (float, optional): number of seconds between checks
+                        for results. Defaults to 1.
+
+        timeout (float, optional): maximum number of seconds to wait for the
+                        results of one call of evaluate. Defaults to None
+                        (no limit).
+    """
+
+    def __init__(self, path, num_workers=1, lease_timeout=600, poll_interval=1,
+                timeout=None):
+        self.queue = SqliteQueue(path, lease_timeout=lease_timeout)
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        # keys of the datasets we have stored in the queue
+        self._dataset_keys = {}
+
+
+    def _dataset_key(self, dataset):
+        if id(dataset) not in self._dataset_keys:
+            self._dataset_keys[id(dataset)] = (dataset, self.queue.put_blob(dataset))
+        return self._dataset_keys[id(dataset)][1]
+
+
+    def evaluate(self,
+                learner,
+                tasks,
+                child_network_architecture,
+                train_dataset,
+                test_dataset):
+        config = learner._child_training_config()
+        train_key = self._dataset_key(train_dataset)
+        test_key = self._dataset_key(test_dataset)
+
+        job_ids = [self.queue.submit({'config': config,
+                                    'child_network_architecture': child_network_architecture,
+                                    'train_dataset': train_key,
+                                    'test_dataset': test_key,
+                                    'task': task})
+                    for task in tasks]
+
+        start = time.monotonic()
+        finished = self.queue.results(job_ids)
+        while len(finished) < len(job_ids):
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise EvaluationError(f'{len(job_ids) - len(finished)} jobs of {self.queue.path} '
+                                    f'did not finish within {self.timeout} seconds')
+            time.sleep(self.poll_interval)
+            finished = self.queue.results(job_ids)
+
+        results = []
+        for job_id in job_ids:
+            status, result = finished[job_id]
+            if status == 'failed':
+                raise EvaluationError(result)
+            results.append(result)
+
+        _add_curves(learner, tasks, results)
+        return [(accuracy, acc_log) for accuracy, acc_log, _ in results]
+
+
+
+
+def run_worker(path,
+            worker_id=None,
+            lease_timeout=600,
+            max_attempts=3,
+            poll_interval=1,
+            idle_timeout=None,
+            max_jobs=None):
+    """
+    Claims jobs from the SqliteQueue at path and evaluates them until the
+    queue has been empty for idle_timeout seconds (or forever), or max_jobs
+    jobs have been done.
+
+    Args:
+        path (str): path of the queue's database
+
+        worker_id (str, optional): defaults to hostname-pid
+
+        lease_timeout (float, optional): see SqliteQueue. The lease is renewed
+                        every lease_timeout/3 seconds while a job runs.
+                        Defaults to 600.
+
+        max_attempts (int, optional): see SqliteQueue. Defaults to 3.
+
+        poll_interval (float, optional): number of seconds to wait before
+                        looking at an empty queue again. Defaults to 1.
+
+        idle_timeout (float, optional): defaults to None
+
+        max_jobs (int, optional): defaults to None
+
+    Returns:
+        int: number of jobs done
+    """
+    # imported here because the learners import autoaug.evaluators
+    from autoaug.autoaugment_learners.AaLearner import AaLearner
+
+    queue = SqliteQueue(path, lease_timeout=lease_timeout, max_attempts=max_attempts)
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    learner = AaLearner()
+    datasets = {}
+
+    num_jobs = 0
+    idle_since = time.monotonic()
+    while max_jobs is None or num_jobs < max_jobs:
+        claimed = queue.claim(worker_id)
+        if claimed is None:
+            if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        job_id, payload = claimed
+        for key in (payload['train_dataset'], payload['test_dataset']):
+            if key not in datasets:
+                datasets[key] = queue.get_blob(key)
+        for key, value in payload['config'].items():
+            setattr(learner, key, value)
+
+        # renew the lease in the background while the child network trains
+        done = threading.Event()
+        def _renew():
+            while not done.wait(lease_timeout / 3):
+                queue.renew(job_id, worker_id)
+        renewer = threading.Thread(target=_renew, daemon=True)
+        renewer.start()
+
+        try:
+            result = _run_task(learner,
+                            payload['child_network_architecture'],
+                            datasets[payload['train_dataset']],
+                            datasets[payload['test_dataset']],
+                            payload['task'])
+            queue.complete(job_id, worker_id, result)
+        except Exception:
+            queue.fail(job_id, worker_id, traceback.format_exc())
+        finally:
+            done.set()
+            renewer.join()
+
+        num_jobs += 1
+        idle_since = time.monotonic()
+
+    return num_jobs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluates policies from a queue')
+    parser.add_argument('--queue', required=True, help='path of the SQLite queue')
+    parser.add_argument('--worker-id', default=None)
+    parser.add_argument('--lease-timeout', type=float, default=600)
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='fail a job whose lease expired this many times')
+    parser.add_argument('--poll-interval', type=float, default=1)
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='exit after the queue has been empty for this many seconds')
+    parser.add_argument('--max-jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    run_worker(args.queue,
+            worker_id=args.worker_id,
+            lease_timeout=args.lease_timeout,
+            max_attempts=args.max_attempts,
+            poll_interval=args.poll_interval,
+            idle_timeout=args.idle_timeout,
+            max_jobs=args.max_jobs)
@@ -0,0 +1,98 @@
+import torchvision.datasets as datasets
+import torchvision
+import torch
+import matplotlib.pyplot as plt
+
+import autoaug.child_networks as cn
+import autoaug.autoaugment_learners as aal
+
+from .util_04_22 import *
+
+
+"""
+comparing GruLearner with and without a replay buffer on
+
+  fashionmnist with simple net
+
+by the best accuracy found after each number of evaluated policies
+(child networks trained), averaged over a few seeds
+
+run from the root of the repository with
+
+  python -m benchmark.scripts.replay_buffer_gru
+"""
+
+
+# AaLearner config
+config = {
+        'num_sub_policies' : 3,
+        'learning_rate' : 1e-1,
+        'toy_size' : 0.1,
+        'batch_size' : 32,
+        'max_epochs' : 100,
+        'early_stop_num' : 10,
+        'cont_mb_size' : 4,
+        }
+
+replay_config = {
+        **config,
+        'replay_size' : 32,
+        'replay_updates' : 4,
+        'clip_ratio' : 0.2,
+        }
+
+total_iter = 96
+seeds = [0, 1, 2]
+
+
+# FashionMNIST with SimpleNet
+train_dataset = datasets.FashionMNIST(root='./datasets/fashionmnist/train',
+                            train=True, download=True, transform=None)
+test_dataset = datasets.FashionMNIST(root='./datasets/fashionmnist/test',
+                        train=False, download=True,
+                        transform=torchvision.transforms.ToTensor())
+child_network_architecture = cn.SimpleNet
+
+
+def get_best_acc(save_file):
+    """
+    Returns the best accuracy found after each evaluation of the agent
+    pickled in save_file
+    """
+    with open(save_file, 'rb') as f:
+        agent = torch.load(f, map_location=device)
+
+    best_acc_list = []
+    best_acc = 0.0
+    for policy, acc in agent.history:
+        best_acc = max(best_acc, acc)
+        best_acc_list.append(best_acc)
+    return best_acc_list
+
+
+for name, agent_config in [('gru', config), ('gru_replay', replay_config)]:
+    curves = []
+    for seed in seeds:
+        save_file = f'./benchmark/pickles/replay_fm_sn_{name}_{seed}.pkl'
+
+        torch.manual_seed(seed)
+        run_benchmark(
+            save_file=save_file,
+            train_dataset=train_dataset,
+            test_dataset=test_dataset,
+            child_network_architecture=child_network_architecture,
+            agent_arch=aal.GruLearner,
+            config=agent_config,
+            total_iter=total_iter
+            )
+        curves.append(get_best_acc(save_file)[:total_iter])
+
+    mean_curve = torch.tensor(curves).mean(dim=0)
+    print(name, 'best accuracy after', total_iter, 'evaluations:', mean_curve[-1].item())
+    plt.plot(range(1, total_iter+1), mean_curve, label=name)
+
+plt.xlabel('no. of child networks trained')
+plt.ylabel('highest accuracy obtained until now')
+plt.legend()
+plt.savefig('./benchmark/pickles/replay_fm_sn_gru.png')
+plt.show()
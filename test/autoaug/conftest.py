@@ -0,0 +1,52 @@
+import pytest
+import torch
+import torchvision.datasets as datasets
+from torchvision.datasets.vision import VisionDataset
+import torchvision.transforms as transforms
+
+
+class _InMemoryImages(VisionDataset):
+    """
+    MNIST-like dataset whose images are in a tensor. Tests which read
+    datasets from several threads use it rather than FakeData: FakeData
+    seeds the global random number generator in __getitem__ (and then puts
+    it back), so a thread reading it can get the image another thread seeded.
+    """
+    def __init__(self, size, seed=0, transform=None):
+        super().__init__(root=None, transform=transform)
+        generator = torch.Generator().manual_seed(seed)
+        self.data = torch.randint(256, (size, 28, 28), dtype=torch.uint8, generator=generator)
+        self.targets = torch.randint(10, (size,), generator=generator)
+
+    def __getitem__(self, idx):
+        image = transforms.functional.to_pil_image(self.data[idx])
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.targets[idx])
+
+    def __len__(self):
+        return len(self.data)
+
+
+@pytest.fixture
+def fake_datasets():
+    """
+    (train_dataset, test_dataset): small MNIST-like FakeData datasets, the
+    training one without a transform (as learners take it) and the test one
+    with ToTensor
+    """
+    train_dataset = datasets.FakeData(size=32, image_size=(1, 28, 28))
+    test_dataset = datasets.FakeData(size=16, image_size=(1, 28, 28), random_offset=100,
+                            transform=transforms.ToTensor())
+    return train_dataset, test_dataset
+
+
+@pytest.fixture
+def thread_safe_datasets():
+    """
+    (train_dataset, test_dataset) like fake_datasets, which can be read from
+    several threads at once
+    """
+    train_dataset = _InMemoryImages(size=32)
+    test_dataset = _InMemoryImages(size=16, seed=1, transform=transforms.ToTensor())
+    return train_dataset, test_dataset
@@ -76,6 +76,47 @@ def test__translate_operation_tensor():
         agent._translate_operation_tensor(softmaxed_vector)
 
 
+def test__translate_operation_tensors():
+    """
+    _translate_operation_tensors translates whole (batches of) policies the
+    way _translate_operation_tensor translates single operations
+    """
+    for discrete_p_m in (True, False):
+        for _ in range(20):
+            p_bins = random.randint(2, 15)
+            m_bins = random.randint(2, 15)
+            agent = aal.AaLearner(p_bins=p_bins, m_bins=m_bins, discrete_p_m=discrete_p_m)
+
+            if discrete_p_m:
+                vectors = torch.rand(4, 6, agent.op_tensor_length)
+                fun_t, prob_t, mag_t = vectors.split([agent.fun_num, p_bins, m_bins], dim=-1)
+                vectors = torch.cat((fun_t.softmax(-1), prob_t.softmax(-1), mag_t.softmax(-1)), dim=-1)
+            else:
+                vectors = torch.rand(4, 6, agent.op_tensor_length)
+                vectors[..., :agent.fun_num] = vectors[..., :agent.fun_num].softmax(-1)
+                vectors[..., -1] = vectors[..., -1] * (m_bins-1)
+
+            operations = agent._translate_operation_tensors(vectors, argmax=True, validate=True)
+            assert len(operations) == 4
+            for policy_vectors, policy_operations in zip(vectors, operations):
+                assert policy_operations == [agent._translate_operation_tensor(vector, argmax=True)
+                                                for vector in policy_vectors]
+
+            if discrete_p_m:
+                policy_operations, log_prob = agent._translate_operation_tensors(vectors[0], 
+                                                                    return_log_prob=True)
+                assert len(policy_operations) == 6
+                assert log_prob.shape == ()
+
+                _, log_prob = agent._translate_operation_tensors(vectors, argmax=True,
+                                                                return_log_prob=True)
+                expected = [sum(agent._translate_operation_tensor(vector, argmax=True,
+                                                        return_log_prob=True)[1]
+                                for vector in policy_vectors)
+                            for policy_vectors in vectors]
+                assert torch.allclose(log_prob, torch.stack(expected))
+
+
 def test__test_autoaugment_policy():
     agent = aal.AaLearner(
                 num_sub_policies=5,
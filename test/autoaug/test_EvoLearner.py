@@ -1,8 +1,12 @@
+import importlib
+
 import autoaug.autoaugment_learners as aal
 import autoaug.child_networks as cn
 import torchvision
 import torchvision.datasets as datasets
 from pprint import pprint
+import pygad.torchga as torchga
+import torch
 
 def test_evo_learner():
     child_network_architecture = cn.SimpleNet
@@ -39,5 +43,40 @@ def test_evo_learner():
         )
 
 
+def test_get_population_policies():
+    """
+    the batched forward over the whole population selects the subpolicies
+    which each solution's controller selects on its own
+    """
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=6, num_parents_mating=3)
+    x = torch.rand(64, 1, 28, 28)
+
+    policies = learner._get_population_policies(learner.population, x)
+    assert len(policies) == 6
+    for solution, policy in zip(learner.population, policies):
+        learner.controller.load_state_dict(
+                torchga.model_weights_as_dict(model=learner.controller, weights_vector=solution))
+        with torch.no_grad():
+            assert learner._get_single_policy_cov(x) == policy
+
+
+def test_get_population_policies_without_torch_func(monkeypatch):
+    """
+    with torch < 2.0 (no torch.func), the controllers are run one at a time,
+    selecting the same subpolicies
+    """
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=6, num_parents_mating=3)
+    x = torch.rand(64, 1, 28, 28)
+    policies = learner._get_population_policies(learner.population, x)
+    weights = [param.clone() for param in learner.controller.parameters()]
+
+    monkeypatch.setattr(importlib.import_module('autoaug.autoaugment_learners.EvoLearner'),
+                        '_HAS_TORCH_FUNC', False)
+    assert learner._get_population_policies(learner.population, x) == policies
+    # the learner's own controller is left alone
+    for param, weight in zip(learner.controller.parameters(), weights):
+        assert torch.equal(param, weight)
+
+
 if __name__=="__main__":
     test_evo_learner()
@@ -1,3 +1,5 @@
+import numpy as np
+
 import autoaug.autoaugment_learners as aal
 import autoaug.child_networks as cn
 import torchvision
@@ -63,5 +65,41 @@ def test_GenLearner():
         )
 
 
+
+def test_breed():
+    learner = aal.GenLearner(num_sub_policies=2, exclude_method=['ShearX'])
+    for _ in range(2):
+        proposal_id, _ = learner.propose()[0]
+        learner.observe(proposal_id, 0.5)
+
+    children = learner._breed(1000)
+    assert children.shape == (1000, 6)
+    assert children.dtype == np.int8
+    assert ((0 <= children) & (children < learner._gene_high)).all()
+    # operations without a magnitude have magnitude gene 0
+    assert (children[:, [2, 5]][~learner._has_magnitude[children[:, [0, 3]]]] == 0).all()
+
+    for genome in children[:20]:
+        [((fun1, prob1, mag1), (fun2, prob2, mag2))] = learner._genome_to_policy(genome)
+        assert fun1 in learner.aug_space_dict and fun2 in learner.aug_space_dict
+        assert 0 <= prob1 <= 1 and 0 <= prob2 <= 1
+        assert (mag1 is None) == (not learner.aug_space_dict[fun1])
+
+
+def test_no_duplicate_proposals():
+    learner = aal.GenLearner(num_sub_policies=2, p_bins=2, m_bins=2,
+                            exclude_method=[name for name, _ in
+                                            aal.GenLearner().augmentation_space][3:])
+
+    # a small search space, so that children often repeat their parents
+    policies = []
+    for _ in range(30):
+        proposal_id, policy = learner.propose()[0]
+        learner.observe(proposal_id, 0.5)
+        policies.append(str(policy))
+    assert len(set(policies)) == len(policies)
+    assert len(learner.visited) == 30
+
+
 if __name__=="__main__":
     test_GenLearner()
@@ -1,5 +1,6 @@
 import autoaug.autoaugment_learners as aal
 import autoaug.child_networks as cn
+from autoaug.controller_networks.RnnController import RNNModel
 import torch
 import torchvision
 import torchvision.datasets as datasets
@@ -28,6 +29,41 @@ def test__generate_new_policy():
             assert isinstance(new_policy[0], list), new_policy
 
 
+def test_sample_policies():
+    """
+    many policies can be sampled at once, from the hand-written or the fused
+    controller, and their log probabilities computed again later
+    """
+    for fused_controller in (False, True):
+        agent = aal.GruLearner(num_sub_policies=3, fused_controller=fused_controller)
+        policies = agent.sample_policies(200)
+        assert len(policies) == 200
+        assert all(len(policy) == 3 for policy in policies)
+
+        policies, log_probs, actions = agent._sample_policies(5)
+        assert torch.allclose(agent._log_probs(actions), log_probs)
+
+
+def test_fused_controller():
+    """
+    the fused cells compute what the hand-written cells compute, with and
+    without a batch dimension
+    """
+    for mode in ('GRU', 'LSTM'):
+        controller = RNNModel(mode=mode, output_size=12, num_layers=2, bias=True)
+        inputs = torch.randn(3, 12)
+
+        outs = controller(inputs, time_steps=6)
+        controller.fused = True
+        fused_outs = controller(inputs, time_steps=6)
+        single_outs = controller(inputs[1], time_steps=6)
+
+        for out, fused_out, single_out in zip(outs, fused_outs, single_outs):
+            assert out.shape == (3, 12)
+            assert torch.allclose(out, fused_out, atol=1e-6)
+            assert torch.allclose(out[1], single_out, atol=1e-6)
+
+
 def test_learn():
     """
     tests the GruLearner.learn() method
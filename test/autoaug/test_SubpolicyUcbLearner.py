@@ -0,0 +1,39 @@
+import numpy as np
+
+import autoaug.autoaugment_learners as aal
+
+
+def test_credit_assignment():
+    learner = aal.SubpolicyUcbLearner(num_sub_policies=2, num_subpolicies=6)
+
+    proposals = learner.propose(n=4)
+    # policies proposed at once share no subpolicies
+    assert len(proposals) == 3
+    assert sorted(idx for _, idxs in learner.pending.values() for idx in idxs) == list(range(6))
+
+    for (proposal_id, policy), accuracy in zip(proposals, (0.2, 0.8, 0.5)):
+        learner.observe(proposal_id, accuracy)
+    assert learner.cnts.tolist() == [1]*6
+    assert learner.sums.tolist() == [0.2, 0.2, 0.8, 0.8, 0.5, 0.5]
+    assert learner.total_count == 6
+    assert learner.get_mega_policy(2) == learner.subpolicies[2:4]
+
+    # the subpolicies of the best policy have the highest UCB values
+    proposal_id, policy = learner.propose()[0]
+    assert policy == learner.subpolicies[2:4]
+
+
+def test_finds_good_subpolicies():
+    np.random.seed(0)
+    learner = aal.SubpolicyUcbLearner(num_sub_policies=5, num_subpolicies=50)
+    good = set(range(10, 15))
+
+    # the accuracy of a policy grows with the number of good subpolicies in it
+    for _ in range(60):
+        proposal_id, policy = learner.propose()[0]
+        idxs = learner.pending[proposal_id][1]
+        accuracy = 0.5 + 0.1*len(good.intersection(idxs)) + 0.05*np.random.rand()
+        learner.observe(proposal_id, accuracy)
+
+    mega_policy = learner.get_mega_policy(5)
+    assert sorted(learner.subpolicies.index(subpolicy) for subpolicy in mega_policy) == sorted(good)
@@ -4,6 +4,9 @@ import torchvision
 import torchvision.datasets as datasets
 from pprint import pprint
 
+import numpy as np
+import pytest
+
 def test_ucb_learner():
     child_network_architecture = cn.SimpleNet
     train_dataset = datasets.FashionMNIST(root='./datasets/fashionmnist/train',
@@ -54,5 +57,42 @@ def test_ucb_learner():
     print(learner.get_mega_policy(number_policies=50))
     print(learner.get_mega_policy(number_policies=3))
 
+def test_lazy_policies():
+    learner = aal.UcbLearner(num_sub_policies=2, num_policies=50000)
+    assert len(learner._policies) == 0
+
+    proposals = learner.propose(n=4)
+    assert [idx for _, idx in learner.pending.values()] == [0, 1, 2, 3]
+    assert len(learner._policies) == 4
+    for proposal_id, _ in proposals:
+        learner.observe(proposal_id, 0.5)
+    assert learner.cnts[:5].tolist() == [1, 1, 1, 1, 0]
+    assert learner.get_n_best_policies(2)[0][0] == learner._policies[0]
+
+
+def test_batched_ucb():
+    learner = aal.UcbLearner(num_sub_policies=2, num_policies=6)
+    for (proposal_id, _), acc in zip(learner.propose(n=6), [0.1, 0.9, 0.5, 0.8, 0.2, 0.3]):
+        learner.observe(proposal_id, acc)
+
+    # the best arms by UCB value, all different
+    learner.propose(n=3)
+    assert sorted(idx for _, idx in learner.pending.values()) == [1, 2, 3]
+    assert learner.q_plus_cnt[1] == pytest.approx(0.9 + np.sqrt(2*np.log(6)))
+
+
+def test_successive_elimination():
+    learner = aal.UcbLearner(num_sub_policies=2, num_policies=3,
+                            batch_strategy='elimination')
+    accs = [0.0, 1.0, 0.5]
+    for _ in range(60):
+        for proposal_id, _ in learner.propose(n=3):
+            learner.observe(proposal_id, accs[learner.pending[proposal_id][1]])
+
+    # the clearly worse arm is eliminated, and the arms left are pulled in turns
+    assert learner.eliminated.tolist() == [True, False, False]
+    assert learner.cnts[0] < learner.cnts[1] == learner.cnts[2]
+
+
 if __name__=="__main__":
     test_ucb_learner()
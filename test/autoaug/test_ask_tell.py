@@ -0,0 +1,310 @@
+import pickle
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import torch
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.evaluators import Evaluator, ThreadPoolEvaluator
+
+
+def test_propose_observe():
+    learner = aal.RsLearner(num_sub_policies=2)
+
+    proposals = learner.propose(n=3)
+    assert len(proposals) == 3
+    assert len({proposal_id for proposal_id, _ in proposals}) == 3
+    assert len(learner.pending) == 3
+
+    # results can come back in any order
+    for proposal_id, policy in reversed(proposals):
+        learner.observe(proposal_id, 0.5, curve=[0.4, 0.5])
+    assert learner.pending == {}
+    assert [policy for policy, _ in learner.history] == [policy for _, policy in reversed(proposals)]
+
+    with pytest.raises(KeyError):
+        learner.observe(proposals[0][0], 0.5)
+
+
+def test_ucb_propose_distinct_arms():
+    learner = aal.UcbLearner(num_sub_policies=2, num_policies=3)
+
+    # untested arms first, and never the same arm twice at once
+    proposals = learner.propose(n=5)
+    assert len(proposals) == 3
+    for (proposal_id, _), acc in zip(proposals, [0.1, 0.9, 0.5]):
+        learner.observe(proposal_id, acc)
+    assert learner.cnts.tolist() == [1, 1, 1]
+    assert learner.total_count == 3
+
+    proposal_id, policy = learner.propose()[0]
+    assert policy == learner.policies[1]
+    learner.observe(proposal_id, 0.7)
+    assert learner.cnts.tolist() == [1, 2, 1]
+    assert learner.avg_accs[1] == pytest.approx(0.8)
+
+
+def test_gen_waits_for_parents():
+    learner = aal.GenLearner(num_sub_policies=2, num_offspring=2)
+
+    # no children can be bred before two random policies have been tested
+    proposals = learner.propose(n=4)
+    assert len(proposals) == 2
+    for proposal_id, _ in proposals:
+        learner.observe(proposal_id, 0.5)
+    assert len(learner.propose(n=4)) == 4
+
+
+def test_gru_updates_after_minibatch():
+    learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=3)
+    weights = [param.detach().clone() for param in learner.controller.parameters()]
+
+    proposals = learner.propose(n=5)
+    assert len(proposals) == 3
+    for proposal_id, _ in proposals[:2]:
+        learner.observe(proposal_id, 0.5)
+    assert learner.propose(n=5) == []
+    learner.observe(proposals[2][0], 0.9)
+
+    # the controller has been updated and can propose the next minibatch
+    assert any(not param.equal(weight)
+                for param, weight in zip(learner.controller.parameters(), weights))
+    assert len(learner.propose(n=5)) == 3
+
+
+def test_evo_generation(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=4, num_parents_mating=2,
+                            cache_fitness=False)
+    learner.set_controller_input(train_dataset)
+
+    population = learner.population.copy()
+    proposals = learner.propose(n=5)
+    assert len(proposals) == 4
+    for (proposal_id, _), accuracy in zip(proposals, (0.2, 0.9, 0.5, 0.1)):
+        learner.observe(proposal_id, accuracy)
+
+    assert learner.generations_completed == 1
+    assert learner.population.shape == population.shape
+    # the best solution is kept (pygad's keep_elitism=1), the rest are offspring
+    assert np.array_equal(learner.population[0], population[1])
+    for solution in learner.population[1:]:
+        assert not any(np.array_equal(solution, parent) for parent in population)
+    assert len(learner.propose(n=5)) == 4
+
+
+def test_evo_learn(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=3, num_parents_mating=2,
+                            batch_size=8, max_epochs=1, cache_fitness=False)
+
+    solution, fitness, _ = learner.learn(train_dataset, test_dataset, cn.SimpleNet,
+                                        iterations=2)
+    assert len(learner.history) == 6
+    assert learner.generations_completed == 2
+    assert fitness == max(acc for _, acc in learner.history)
+
+
+def test_evo_fitness_cache(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=4, num_parents_mating=2)
+    learner.set_controller_input(train_dataset)
+    for proposal_id, _ in learner.propose(n=4):
+        learner.observe(proposal_id, 0.5)
+
+    # the best solution is kept as it is, so its subpolicy is not evaluated again
+    proposals = learner.propose(n=4)
+    proposed = {sol_idx for _, sol_idx in learner.pending.values()}
+    assert len(proposals) < 4
+    assert 0 not in proposed
+    assert learner.fitness[0] == 0.5
+    for proposal_id, _ in proposals:
+        learner.observe(proposal_id, 0.7)
+    assert learner.generations_completed == 2
+    assert len(learner.history) == 4 + len(proposals)
+
+
+def test_evo_duplicate_subpolicies(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=3, num_parents_mating=2)
+    learner.set_controller_input(train_dataset)
+
+    # every solution has the same controller, hence the same subpolicy
+    learner.population[:] = learner.population[0]
+    proposals = learner.propose(n=3)
+    assert len(proposals) == 1
+    learner.observe(proposals[0][0], 0.5)
+    assert learner.generations_completed == 1
+
+    # a generation of known subpolicies still evaluates one of them
+    learner.population[:] = learner.population[0]
+    assert len(learner.propose(n=3)) == 1
+
+
+def test_evo_learn_counts_generations(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=3, num_parents_mating=2,
+                            batch_size=8, max_epochs=1)
+
+    learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=2)
+    assert learner.generations_completed == 2
+    assert learner.pending == {}
+    assert 2 <= len(learner.history) <= 6
+
+
+class _FixedAccuracyEvaluator(Evaluator):
+    """Gives every policy a fixed accuracy, without training anything"""
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self.batch_sizes = []
+
+    def evaluate(self, learner, tasks, child_network_architecture, train_dataset, test_dataset):
+        self.batch_sizes.append(len(tasks))
+        return [(len(str(task['policy'])) % 7 / 7, []) for task in tasks]
+
+
+def test_gru_parallel_minibatch():
+    controllers = []
+    for num_workers in (1, 4):
+        torch.manual_seed(0)
+        evaluator = _FixedAccuracyEvaluator(num_workers)
+        learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=4, evaluator=evaluator)
+        learner.learn(None, None, cn.SimpleNet, iterations=3)
+        controllers.append(learner.controller)
+
+        # the whole minibatch is evaluated at once when there are enough workers
+        expected_batch_sizes = [1]*12 if num_workers == 1 else [4]*3
+        assert evaluator.batch_sizes == expected_batch_sizes
+
+    # and the controller is updated exactly as in serial
+    for param, parallel_param in zip(*(controller.parameters() for controller in controllers)):
+        assert torch.equal(param, parallel_param)
+
+
+class _SleepingEvaluator(Evaluator):
+    """Evaluates each policy in a background thread which just sleeps"""
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self.executor = ThreadPoolExecutor(num_workers)
+        # the number of evaluations running when each one was submitted
+        self.num_running = []
+        # {eval_id of the task: accuracy it was given}
+        self.accuracies = {}
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, learner, task, child_network_architecture, train_dataset, test_dataset):
+        with self._lock:
+            self.num_running.append(self._running)
+            self._running += 1
+            self.accuracies[task['eval_id']] = random.random()
+        return self.executor.submit(self._evaluate, self.accuracies[task['eval_id']])
+
+    def _evaluate(self, accuracy):
+        time.sleep(0.02 * random.random())
+        with self._lock:
+            self._running -= 1
+        return accuracy, []
+
+
+def test_gen_steady_state():
+    random.seed(0)
+    evaluator = _SleepingEvaluator(num_workers=4)
+    learner = aal.GenLearner(num_sub_policies=2, num_offspring=2, elite_size=3,
+                            steady_state=True, evaluator=evaluator)
+    learner.learn(None, None, cn.SimpleNet, iterations=20)
+
+    # all the workers are busy from the start, before there are parents
+    assert evaluator.num_running[:4] == [0, 1, 2, 3]
+    assert max(evaluator.num_running) == 3
+    assert len(learner.history) == 20
+    assert learner.pending == {}
+
+    # the ranking is kept as results arrive in any order
+    assert [idx for _, idx in learner.ranking] == \
+            sorted(range(20), key=lambda idx: (-learner.population_fitness[idx], idx))
+    elite = {idx for _, idx in learner.ranking[:3]}
+    assert set(learner._select_parents(100).flatten()) <= elite
+
+    # results finishing out of order are recorded under their task's eval_id
+    assert {eval_id: accuracy for eval_id, (_, accuracy) in learner.policy_record.items()} \
+            == evaluator.accuracies
+
+
+def test_gru_async_updates():
+    learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=2, async_updates=True,
+                            max_staleness=1)
+
+    # no minibatch barrier: policies keep coming from the latest controller
+    proposals = learner.propose(n=4)
+    assert len(proposals) == 4
+    for proposal_id, _ in proposals[:2]:
+        learner.observe(proposal_id, 0.5)
+    assert learner.controller_version == 1
+
+    new_proposal_id, _ = learner.propose()[0]
+    # one update old: still used, with importance weights
+    for proposal_id, _ in proposals[2:]:
+        learner.observe(proposal_id, 0.9)
+    assert learner.controller_version == 2
+
+    # two updates old: dropped
+    stale_id, _ = learner.propose()[0]
+    fresh = learner.propose(n=3)
+    learner.observe(new_proposal_id, 0.1)
+    for proposal_id, _ in fresh:
+        learner.observe(proposal_id, 0.1)
+    assert learner.controller_version == 4
+    learner.observe(stale_id, 0.1)
+    assert learner._mb == []
+    assert len(learner.history) == 9
+
+    assert learner.policy_versions == [0, 0, 0, 0, 1, 2, 2, 2, 2]
+
+
+def test_gru_async_learn(thread_safe_datasets):
+    train_dataset, test_dataset = thread_safe_datasets
+    with ThreadPoolEvaluator(num_workers=2) as evaluator:
+        learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=2, async_updates=True,
+                                batch_size=8, max_epochs=1, evaluator=evaluator)
+        learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=2)
+
+    assert len(learner.history) == 4
+    assert learner.controller_version == 2
+    assert learner.pending == {}
+
+
+def test_gru_replay_buffer():
+    learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=2, replay_size=3,
+                            replay_updates=2)
+
+    for reward in (0.9, 0.2):
+        weights = [param.detach().clone() for param in learner.controller.parameters()]
+        for proposal_id, _ in learner.propose(n=2):
+            learner.observe(proposal_id, reward)
+        assert any(not param.equal(weight)
+                    for param, weight in zip(learner.controller.parameters(), weights))
+
+    # the oldest policy has been evicted
+    assert len(learner.replay_buffer) == 3
+    assert [reward for _, _, reward in learner.replay_buffer] == [0.9, 0.2, 0.2]
+    assert learner.controller_version == 2
+
+
+def test_gru_proposals_are_plain_data():
+    learner = aal.GruLearner(num_sub_policies=2, cont_mb_size=3)
+    learner.propose(n=3)
+
+    # no autograd graphs are kept while the policies are evaluated, and the
+    # log probabilities can be computed again from the actions
+    infos = list(learner.pending.values())
+    pickle.dumps(infos)
+    log_probs = learner._log_probs([actions for _, (_, actions, _) in infos])
+    assert log_probs.tolist() == pytest.approx([log_prob for _, (log_prob, _, _) in infos])
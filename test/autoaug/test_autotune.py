@@ -0,0 +1,106 @@
+import pytest
+import torchvision.datasets as datasets
+import torchvision.transforms as transforms
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.autotune import autotune_loader_config, estimate_memory
+
+
+def test_autotune_loader_config(tmp_path, fake_datasets):
+    train_dataset, _ = fake_datasets
+    cache_path = str(tmp_path / 'autotune.json')
+    learner = aal.AaLearner()
+    sample = transforms.ToTensor()(train_dataset[0][0])
+
+    # only batch sizes 8 and 16 fit in memory
+    memory_limit = estimate_memory(cn.SimpleNet(), sample, 16)
+    result = autotune_loader_config(train_dataset,
+                                    learner._make_child_network,
+                                    cn.SimpleNet,
+                                    transforms.ToTensor(),
+                                    batch_sizes=(8, 16, 32),
+                                    num_workers=(0,),
+                                    num_threads=(1,),
+                                    memory_limit=memory_limit,
+                                    num_batches=2,
+                                    cache_path=cache_path,
+                                    verbose=False)
+
+    assert result['batch_size'] in (8, 16)
+    assert result['num_workers'] == 0 and result['num_threads'] == 1
+    assert result['samples_per_sec'] > 0
+    assert {m['batch_size'] for m in result['measurements']} == {8, 16}
+
+    kwargs = dict(batch_sizes=(8, 16, 32),
+                num_workers=(0,),
+                num_threads=(1,),
+                num_batches=2,
+                cache_path=cache_path,
+                verbose=False)
+
+    # the second time, the result comes from the cache
+    cached = autotune_loader_config(train_dataset,
+                                    learner._make_child_network,
+                                    cn.SimpleNet,
+                                    transforms.ToTensor(),
+                                    memory_limit=memory_limit,
+                                    **kwargs)
+    assert cached == result
+
+    # but not under other constraints
+    looser = autotune_loader_config(train_dataset,
+                                    learner._make_child_network,
+                                    cn.SimpleNet,
+                                    transforms.ToTensor(),
+                                    **kwargs)
+    assert {m['batch_size'] for m in looser['measurements']} == {8, 16, 32}
+
+    # or for another dataset of the same class and length
+    other_dataset = datasets.FakeData(size=32, image_size=(1, 28, 28), random_offset=1000)
+    other = autotune_loader_config(other_dataset,
+                                    learner._make_child_network,
+                                    cn.SimpleNet,
+                                    transforms.ToTensor(),
+                                    memory_limit=memory_limit,
+                                    **kwargs)
+    assert other != result
+
+
+def test_no_batch_size_fits(tmp_path, fake_datasets):
+    train_dataset, _ = fake_datasets
+    learner = aal.AaLearner()
+    sample = transforms.ToTensor()(train_dataset[0][0])
+    kwargs = dict(num_workers=(0,),
+                num_threads=(1,),
+                num_batches=2,
+                cache_path=str(tmp_path / 'autotune.json'),
+                verbose=False)
+
+    with pytest.raises(ValueError):
+        autotune_loader_config(train_dataset, learner._make_child_network, cn.SimpleNet,
+                                transforms.ToTensor(), max_batch_size=4, **kwargs)
+    with pytest.raises(ValueError):
+        autotune_loader_config(train_dataset, learner._make_child_network, cn.SimpleNet,
+                                transforms.ToTensor(),
+                                memory_limit=estimate_memory(cn.SimpleNet(), sample, 8) - 1,
+                                **kwargs)
+    # and nothing was cached
+    assert not (tmp_path / 'autotune.json').exists()
+
+
+def test_learner_auto_tune(tmp_path, fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.RsLearner(
+                        batch_size=8,
+                        max_epochs=2,
+                        auto_tune=True,
+                        max_batch_size=16,
+                        autotune_cache=str(tmp_path / 'autotune.json'),
+                        )
+    learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=2)
+
+    assert learner.autotune_result is not None
+    assert learner.batch_size == learner.autotune_result['batch_size'] <= 16
+    assert learner.num_workers == learner.autotune_result['num_workers']
+    assert len(learner.history) == 2
@@ -0,0 +1,138 @@
+import os
+
+import torch
+import torchvision.transforms as transforms
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+import autoaug.main as main
+from autoaug.autoaugment_learners.autoaugment import AutoAugment
+from autoaug.checkpoints import CheckpointStore
+from autoaug.dataset_views import transform_view
+from autoaug.stopping_rules import MedianStoppingRule
+
+
+def _loaders(datasets):
+    train_dataset, test_dataset = datasets
+    aa_transform = AutoAugment()
+    aa_transform.subpolicies = [
+            (("Rotate", 0.7, 2), ("Invert", 0.8, None)),
+            (("ShearY", 0.5, 8), ("Contrast", 0.2, 6)),
+            ]
+    train_dataset = transform_view(train_dataset,
+                            transforms.Compose([aa_transform, transforms.ToTensor()]))
+    return main.create_toy(train_dataset, test_dataset, batch_size=8, n_samples=1)
+
+
+def _train(datasets, store, checkpoint_id, max_epochs):
+    train_loader, test_loader = _loaders(datasets)
+    model = cn.SimpleNet()
+    return main.train_child_network(
+                            model,
+                            train_loader,
+                            test_loader,
+                            sgd=torch.optim.SGD(model.parameters(), lr=0.1),
+                            cost=torch.nn.CrossEntropyLoss(),
+                            max_epochs=max_epochs,
+                            early_stop_num=100,
+                            logging=True,
+                            print_every_epoch=False,
+                            checkpoint_store=store,
+                            checkpoint_id=checkpoint_id,
+                            ), model
+
+
+def test_resume_is_exact(tmp_path, fake_datasets):
+    """
+    training for 2 epochs and then resuming for 2 more epochs should give
+    exactly the same run as training for 4 epochs in one go
+    """
+    store = CheckpointStore(str(tmp_path))
+
+    torch.manual_seed(0)
+    (acc, acc_log), model = _train(fake_datasets, store, 'full', max_epochs=4)
+
+    torch.manual_seed(0)
+    _train(fake_datasets, store, 'resumed', max_epochs=2)
+    # use the random number generators in between, as another evaluation would
+    torch.rand(100)
+    (acc_resumed, acc_log_resumed), model_resumed = _train(fake_datasets, store, 'resumed', max_epochs=4)
+
+    assert acc == acc_resumed
+    assert [(epoch, float(a)) for epoch, a in acc_log] == \
+                [(epoch, float(a)) for epoch, a in acc_log_resumed]
+    for p1, p2 in zip(model.parameters(), model_resumed.parameters()):
+        assert torch.equal(p1, p2)
+    assert store.load('resumed')['epoch'] == 4
+
+
+def test_quota(tmp_path):
+    state = {'weights': torch.zeros(1000)}
+    store = CheckpointStore(str(tmp_path))
+    store.save('a', state)
+    size = store.total_bytes()
+
+    store = CheckpointStore(str(tmp_path), max_bytes=int(2.5*size))
+    store.save('b', state)
+    os.utime(store._path('a'), (0, 0))
+    os.utime(store._path('b'), (1, 1))
+    store.save('c', state)
+
+    # 'a' was the least recently used checkpoint
+    assert 'a' not in store
+    assert 'b' in store and 'c' in store
+    assert store.total_bytes() <= store.max_bytes
+
+
+def test_resume_keeps_caller_rng(tmp_path, fake_datasets):
+    """
+    resuming a run must not rewind the random number generators of the
+    rest of the program
+    """
+    store = CheckpointStore(str(tmp_path))
+    _train(fake_datasets, store, 'run', max_epochs=1)
+
+    train_loader, test_loader = _loaders(fake_datasets)
+    model = cn.SimpleNet()
+    torch.rand(100)
+    rng_state = torch.get_rng_state()
+    main.train_child_network(model,
+                            train_loader,
+                            test_loader,
+                            sgd=torch.optim.SGD(model.parameters(), lr=0.1),
+                            cost=torch.nn.CrossEntropyLoss(),
+                            max_epochs=2,
+                            print_every_epoch=False,
+                            checkpoint_store=store,
+                            checkpoint_id='run')
+    assert torch.equal(torch.get_rng_state(), rng_state)
+    assert store.load('run')['epoch'] == 2
+
+
+def test_learner_resume(tmp_path, fake_datasets):
+    """
+    a resumed evaluation replaces its first result, and learners sharing a
+    store do not resume each other's checkpoints
+    """
+    train_dataset, test_dataset = fake_datasets
+    store = CheckpointStore(str(tmp_path))
+    rule = MedianStoppingRule()
+    learner = aal.RsLearner(num_sub_policies=2, early_stop_num=100,
+                            checkpoint_store=store, stopping_rule=rule)
+    policy = learner._generate_new_policy()
+
+    learner._test_autoaugment_policy(policy, cn.SimpleNet, train_dataset, test_dataset,
+                                    max_epochs=1)
+    learner._test_autoaugment_policy(policy, cn.SimpleNet, train_dataset, test_dataset,
+                                    eval_id='pol0', max_epochs=2)
+    assert len(learner.history) == 1
+    assert list(learner.policy_record) == ['pol0']
+    assert [len(curve) for curve in learner.learning_curves] == [2]
+    assert rule.curves == learner.learning_curves
+    assert rule.epochs_trained == 2
+
+    other = aal.RsLearner(num_sub_policies=2, checkpoint_store=store)
+    assert other._checkpoint_id(policy, 'pol0', cn.SimpleNet) != \
+                learner._checkpoint_id(policy, 'pol0', cn.SimpleNet)
+    assert learner._checkpoint_id(learner._generate_new_policy(), 'pol0', cn.SimpleNet) != \
+                learner._checkpoint_id(policy, 'pol0', cn.SimpleNet)
@@ -0,0 +1,53 @@
+import concurrent.futures
+
+import torch
+import torchvision.datasets as datasets
+import torchvision.transforms as transforms
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.dataset_views import transform_view
+from autoaug.evaluators import ThreadPoolEvaluator
+
+
+def test_transform_view():
+    base = datasets.FakeData(size=8, image_size=(1, 28, 28))
+    subset = torch.utils.data.Subset(base, [3, 5])
+
+    to_tensor = transform_view(base, transforms.ToTensor())
+    flipped = transform_view(subset, transforms.Compose([transforms.RandomVerticalFlip(p=1),
+                                                    transforms.ToTensor()]))
+
+    assert base.transform is None
+    assert torch.equal(flipped[0][0], to_tensor[3][0].flip(-2))
+    assert flipped[1][1] == base[5][1]
+
+
+def test_concurrent_views(thread_safe_datasets):
+    """
+    views with different transforms over one dataset can be read from
+    several threads at once
+    """
+    base, _ = thread_safe_datasets
+    expected = [transforms.ToTensor()(base[idx][0]) for idx in range(len(base))]
+
+    def _read(scale):
+        view = transform_view(base, transforms.Compose([transforms.ToTensor(),
+                                                    transforms.Lambda(lambda x: x * scale)]))
+        assert view.data is base.data
+        return all(torch.equal(view[idx][0], expected[idx] * scale)
+                    for idx in range(len(view)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(_read, range(8)))
+
+
+def test_learners_do_not_change_dataset(thread_safe_datasets):
+    train_dataset, test_dataset = thread_safe_datasets
+
+    with ThreadPoolEvaluator(num_workers=2) as evaluator:
+        learner = aal.RsLearner(batch_size=8, max_epochs=1, evaluator=evaluator)
+        learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=2)
+
+    assert train_dataset.transform is None
+    assert len(learner.history) == 2
@@ -0,0 +1,67 @@
+import pytest
+import torch
+import torchvision.transforms as transforms
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+import autoaug.main as main
+from autoaug.dataset_views import transform_view
+from autoaug.distributed import train_child_network_distributed
+from autoaug.validation import QuantizedValidation
+
+
+def test_validation_is_gathered(fake_datasets):
+    """
+    with a learning rate of 0 the weights do not change, so the accuracy
+    gathered from the shards of 3 processes has to be the accuracy of the
+    initial network on the whole validation set
+    """
+    train_dataset, test_dataset = fake_datasets
+    # unlike a learner, train_child_network_distributed does not add ToTensor
+    train_dataset = transform_view(train_dataset, transforms.ToTensor())
+    torch.manual_seed(0)
+    model = cn.SimpleNet()
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=4)
+    expected = main.validation_accuracy(model, test_loader, torch.device('cpu')).item()
+
+    best_acc, acc_log = train_child_network_distributed(model,
+                                                        train_dataset,
+                                                        test_dataset,
+                                                        num_processes=3,
+                                                        batch_size=6,
+                                                        learning_rate=0,
+                                                        max_epochs=2,
+                                                        print_every_epoch=False)
+
+    assert [epoch for epoch, _ in acc_log] == [0, 1]
+    assert [acc for _, acc in acc_log] == pytest.approx([expected, expected])
+    assert best_acc == pytest.approx(expected)
+
+
+def test_learner_num_processes(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.RsLearner(batch_size=8, max_epochs=2, num_processes=2)
+    learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=1)
+
+    acc = learner.history[0][1]
+    assert isinstance(acc, float) and 0 <= acc <= 1
+    assert len(learner.learning_curves[0]) == 2
+
+    with pytest.raises(ValueError):
+        aal.RsLearner(num_processes=2, checkpoint_store=object())
+    with pytest.raises(ValueError):
+        aal.RsLearner(num_processes=2, val_ci=0.05)
+    with pytest.raises(ValueError):
+        aal.RsLearner(num_processes=2, quantized_validation=True)
+
+
+def test_rejects_per_shard_validation(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    with pytest.raises(ValueError):
+        train_child_network_distributed(cn.SimpleNet(),
+                                        transform_view(train_dataset, transforms.ToTensor()),
+                                        test_dataset,
+                                        num_processes=2,
+                                        batch_size=8,
+                                        learning_rate=0.1,
+                                        quantized_validation=QuantizedValidation())
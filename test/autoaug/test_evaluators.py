@@ -0,0 +1,92 @@
+import os
+import time
+
+import pytest
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.evaluators import ThreadPoolEvaluator, ProcessPoolEvaluator, EvaluationError
+from autoaug.stopping_rules import MedianStoppingRule
+
+
+POLICIES = [
+    [(("Rotate", 0.7, 2), ("Invert", 0.8, None))],
+    [(("ShearY", 0.5, 8), ("Contrast", 0.2, 6))],
+    [(("Sharpness", 0.8, 1), ("Sharpness", 0.9, 3))],
+    ]
+
+
+def crash_once_net():
+    # the worker process dies the first time this is called
+    marker = os.environ['AUTOAUG_CRASH_MARKER']
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return cn.SimpleNet()
+
+
+def sleepy_net():
+    time.sleep(600)
+    return cn.SimpleNet()
+
+
+def _check_order(learner):
+    assert [policy for policy, _ in learner.history] == POLICIES
+    assert list(learner.policy_record) == ['pol0', 'pol1', 'pol2']
+    assert len(learner.learning_curves) == 3
+
+
+def test_serial_evaluator(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    learner = aal.RsLearner(num_sub_policies=1, batch_size=8, max_epochs=1)
+    learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=3)
+
+    # one id per evaluation, whichever evaluator runs them
+    assert list(learner.policy_record) == ['pol0', 'pol1', 'pol2']
+
+
+def test_thread_pool_evaluator(thread_safe_datasets):
+    train_dataset, test_dataset = thread_safe_datasets
+    with ThreadPoolEvaluator(num_workers=2) as evaluator:
+        learner = aal.AaLearner(batch_size=8, max_epochs=2, evaluator=evaluator,
+                                stopping_rule=MedianStoppingRule())
+        accs = learner._test_autoaugment_policies(POLICIES, cn.SimpleNet,
+                                        train_dataset, test_dataset,
+                                        print_every_epoch=False)
+
+    assert accs == [acc for _, acc in learner.history]
+    _check_order(learner)
+    assert len(learner.stopping_rule.curves) == 3
+
+
+def test_process_pool_evaluator(tmp_path, monkeypatch, fake_datasets):
+    monkeypatch.setenv('AUTOAUG_CRASH_MARKER', str(tmp_path / 'crashed'))
+    train_dataset, test_dataset = fake_datasets
+
+    with ProcessPoolEvaluator(num_workers=2, retries=1) as evaluator:
+        learner = aal.AaLearner(batch_size=8, max_epochs=2, evaluator=evaluator,
+                                stopping_rule=MedianStoppingRule())
+        learner._test_autoaugment_policies(POLICIES, crash_once_net,
+                                        train_dataset, test_dataset,
+                                        print_every_epoch=False)
+
+        # one worker crashed and its evaluation was retried
+        assert os.path.exists(tmp_path / 'crashed')
+        _check_order(learner)
+        assert len(learner.stopping_rule.curves) == 3
+
+        # the workers are still usable, e.g. by a learner
+        learner = aal.RsLearner(batch_size=8, max_epochs=1, evaluator=evaluator)
+        learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=3)
+        assert len(learner.history) == 3
+
+
+def test_process_pool_timeout(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+
+    with ProcessPoolEvaluator(num_workers=1, timeout=5, retries=0) as evaluator:
+        learner = aal.AaLearner(batch_size=8, max_epochs=1, evaluator=evaluator)
+        with pytest.raises(EvaluationError):
+            learner._test_autoaugment_policies(POLICIES[:1], sleepy_net,
+                                            train_dataset, test_dataset)
+    assert len(learner.history) == 0
@@ -0,0 +1,75 @@
+import numpy as np
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.islands import run_island, run_islands, merge_histories, _publish
+
+
+def test_gen_migrants():
+    learner = aal.GenLearner(num_sub_policies=2)
+    for accuracy in (0.2, 0.9, 0.5):
+        proposal_id, _ = learner.propose()[0]
+        learner.observe(proposal_id, accuracy)
+
+    migrants = learner.get_migrants(2)
+    assert [accuracy for _, accuracy in migrants] == [0.9, 0.5]
+    assert migrants[0][0] == learner.history[1][0]
+
+    other = aal.GenLearner(num_sub_policies=2)
+    other.add_migrants(migrants)
+    other.add_migrants(migrants)
+    assert len(other.population) == 2
+    assert other.get_migrants(2) == migrants
+    # the migrants were tested on their island, not here
+    assert other.history == []
+
+
+def test_evo_migrants(fake_datasets):
+    train_dataset, _ = fake_datasets
+    learner = aal.EvoLearner(num_sub_policies=2, num_solutions=4, num_parents_mating=2,
+                            cache_fitness=False)
+    learner.set_controller_input(train_dataset)
+    assert learner.get_migrants(2) == []
+
+    immigrant = np.full(learner.population.shape[1], 0.5)
+    learner.add_migrants([immigrant])
+    for (proposal_id, _), accuracy in zip(learner.propose(n=4), (0.2, 0.9, 0.5, 0.1)):
+        learner.observe(proposal_id, accuracy)
+
+    population, _ = learner.last_generation
+    assert np.array_equal(learner.get_migrants(2)[0], population[1])
+    assert np.array_equal(learner.population[-1], immigrant)
+
+
+def test_run_island(tmp_path, fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+
+    # another island has already published its best policy
+    other = aal.GenLearner(num_sub_policies=2)
+    proposal_id, policy = other.propose()[0]
+    _publish(str(tmp_path), 1, 1, [(policy, 1.0)], [(policy, 1.0)])
+
+    learner = run_island(0, aal.GenLearner,
+                        {'num_sub_policies': 2, 'batch_size': 8, 'max_epochs': 1},
+                        train_dataset, test_dataset, cn.SimpleNet,
+                        num_evaluations=3, directory=str(tmp_path),
+                        migration_interval=2, num_migrants=1, seed=0)
+
+    assert len(learner.history) == 3
+    assert learner.get_migrants(1) == [(policy, 1.0)]
+    assert len(merge_histories(str(tmp_path))) == 4
+
+
+def test_run_islands(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+
+    history = run_islands(aal.GenLearner,
+                        {'num_sub_policies': 2, 'batch_size': 8, 'max_epochs': 1},
+                        num_islands=2,
+                        train_dataset=train_dataset,
+                        test_dataset=test_dataset,
+                        child_network_architecture=cn.SimpleNet,
+                        num_evaluations=4,
+                        migration_interval=2,
+                        num_migrants=1)
+    assert len(history) == 8
@@ -0,0 +1,84 @@
+import pytest
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.autoaugment_learners.autoaugment import RandAugmentPolicy
+
+
+def _accuracy(policy):
+    # peaks at magnitude 10 for every number of operations, 2 operations being best
+    return 0.5 - abs(policy.magnitude - 10)/100 - abs(policy.num_ops - 2)/10
+
+
+def test_pruned_sweeps():
+    learner = aal.RandAugmentLearner(num_ops=(1, 2), magnitudes=range(0, 31, 5),
+                                    max_sweep_pending=1, num_rounds=0)
+
+    # one magnitude of each sweep at a time, in increasing order
+    proposals = learner.propose(n=4)
+    assert [policy for _, policy in proposals] == [RandAugmentPolicy(1, 0), RandAugmentPolicy(2, 0)]
+
+    while len(proposals) > 0:
+        for proposal_id, policy in proposals:
+            learner.observe(proposal_id, _accuracy(policy))
+        proposals = learner.propose(n=4)
+
+    # the sweeps stopped two magnitudes after the peak
+    assert sorted(learner.results[0]) == [RandAugmentPolicy(num_ops, magnitude)
+                                        for num_ops in (1, 2) for magnitude in range(0, 21, 5)]
+    assert RandAugmentPolicy(2, 25) in learner.pruned
+    assert learner.finished
+    assert learner.get_best_policy() == (RandAugmentPolicy(2, 10), 0.5)
+
+
+def test_successive_halving():
+    learner = aal.RandAugmentLearner(num_ops=(1, 2, 3), magnitudes=(0, 10),
+                                    min_epochs=1, eta=3, num_rounds=2, max_epochs=5)
+
+    accuracies = {RandAugmentPolicy(1, 0): 0.3, RandAugmentPolicy(1, 10): 0.6,
+                    RandAugmentPolicy(2, 0): 0.4, RandAugmentPolicy(2, 10): 0.5,
+                    RandAugmentPolicy(3, 0): 0.2, RandAugmentPolicy(3, 10): 0.1}
+    proposals = learner.propose(n=10)
+    assert len(proposals) == 6
+    for proposal_id, policy in proposals:
+        learner.observe(proposal_id, accuracies[policy])
+
+    # the best third of the grid, with three times the budget
+    assert learner.round == 1
+    assert learner.max_epochs == 3
+    proposals = learner.propose(n=10)
+    assert [policy for _, policy in proposals] == [RandAugmentPolicy(1, 10), RandAugmentPolicy(2, 10)]
+    for proposal_id, policy in proposals:
+        learner.observe(proposal_id, 1 - accuracies[policy])
+
+    # the budget is capped at max_epochs
+    assert learner.max_epochs == 5
+    proposals = learner.propose(n=10)
+    assert [policy for _, policy in proposals] == [RandAugmentPolicy(2, 10)]
+    learner.observe(proposals[0][0], 0.7)
+
+    assert learner.finished
+    assert learner.propose() == []
+    assert learner.get_best_policy() == (RandAugmentPolicy(2, 10), 0.7)
+
+
+def test_magnitudes_in_bins():
+    with pytest.raises(ValueError):
+        aal.RandAugmentLearner(magnitudes=range(0, 31, 5), num_magnitude_bins=21)
+    with pytest.raises(ValueError):
+        aal.RandAugmentLearner(magnitudes=(-1, 5))
+
+    learner = aal.RandAugmentLearner(magnitudes=range(0, 21, 5), num_magnitude_bins=21)
+    assert learner.magnitudes == [0, 5, 10, 15, 20]
+
+
+def test_learn(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+
+    learner = aal.RandAugmentLearner(num_ops=(1, 2), magnitudes=(5, 15), num_rounds=1,
+                                    min_epochs=1, max_epochs=1)
+    best_policy, accuracy = learner.learn(train_dataset, test_dataset, cn.SimpleNet)
+
+    assert len(learner.history) == 6
+    assert best_policy in learner.results[1]
+    assert 0 <= accuracy <= 1
@@ -0,0 +1,103 @@
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.stopping_rules import MedianStoppingRule
+
+
+def test_median_stopping_rule():
+    """
+    make sure the rule only stops runs which are behind the median of
+    previous runs, and only after the grace epochs
+    """
+    rule = MedianStoppingRule(percentile=50, grace_epochs=2, min_curves=3)
+
+    # not enough previous curves to compare to yet
+    assert not rule.should_stop(5, 0.0)
+
+    rule.add_curve([0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+    rule.add_curve([0.2, 0.3, 0.4, 0.5, 0.6, 0.7])
+    rule.add_curve([0.3, 0.4, 0.5, 0.4, 0.3, 0.2])
+
+    # best-so-far values at epoch 3 are 0.4, 0.5 and 0.5
+    assert rule.threshold(3) == 0.5
+    assert rule.should_stop(3, 0.45)
+    assert not rule.should_stop(3, 0.5)
+
+    # grace epochs
+    assert not rule.should_stop(1, 0.0)
+
+    # no previous curve has reached epoch 10
+    assert rule.threshold(10) is None
+    assert not rule.should_stop(10, 0.0)
+
+    rule.add_curve([0.1, 0.1, 0.1, 0.1], stopped=True)
+    report = rule.get_compute_saved()
+    assert report['num_stopped'] == 1
+    assert report['epochs_trained'] == 22
+    assert report['epochs_saved'] == 2
+
+
+def test_replaced_curve():
+    """
+    a curve replaced by that of its resumed evaluation no longer counts
+    for the epochs saved
+    """
+    rule = MedianStoppingRule()
+    rule.add_curve([0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+    rule.add_curve([0.1, 0.1], stopped=True, curve_id='pol1')
+    assert rule.epochs_saved == 4
+
+    # resumed, it was stopped again later
+    rule.add_curve([0.1, 0.1, 0.2, 0.2], stopped=True, curve_id='pol1')
+    assert rule.epochs_saved == 2
+    # and then trained to the end
+    rule.add_curve([0.1, 0.1, 0.2, 0.2, 0.3, 0.3], curve_id='pol1')
+    report = rule.get_compute_saved()
+    assert report['num_stopped'] == 0
+    assert report['epochs_trained'] == 12
+    assert report['epochs_saved'] == 0
+
+
+def test_sparse_validation():
+    """
+    curves which validated every few epochs should be compared by epoch,
+    without counting the epochs they did not validate in
+    """
+    rule = MedianStoppingRule(percentile=50, grace_epochs=0, min_curves=3)
+    rule.add_curve([(1, 0.5), (3, 0.7), (4, 0.6)])
+    rule.add_curve([(1, 0.6), (3, 0.8), (4, 0.9)])
+    rule.add_curve([(1, 0.4), (3, 0.6), (4, 0.5)])
+
+    # no curve had validated by epoch 0
+    assert rule.threshold(0) is None
+    # at epoch 2, the last validations were in epoch 1
+    assert rule.threshold(2) == 0.5
+    assert rule.threshold(4) == 0.7
+    assert rule.threshold(5) is None
+    assert rule.epochs_trained == 15
+
+
+def test_learning_curves(fake_datasets):
+    """
+    every evaluation's learning curve should be kept in the learner
+    and fed to its stopping rule
+    """
+    train_dataset, test_dataset = fake_datasets
+    rule = MedianStoppingRule(grace_epochs=1, min_curves=1)
+    agent = aal.RsLearner(
+                        num_sub_policies=2,
+                        max_epochs=4,
+                        early_stop_num=10,
+                        stopping_rule=rule,
+                        )
+    agent.learn(train_dataset,
+                test_dataset,
+                child_network_architecture=cn.SimpleNet,
+                iterations=3)
+
+    assert len(agent.learning_curves) == len(agent.history) == 3
+    for curve in agent.learning_curves:
+        assert 1 <= len(curve) <= 4
+        assert [epoch for epoch, _ in curve] == list(range(len(curve)))
+        assert all(isinstance(acc, float) for _, acc in curve)
+    assert rule.curves == agent.learning_curves
+    assert agent.get_compute_saved()['num_evaluations'] == 3
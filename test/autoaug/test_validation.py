@@ -0,0 +1,135 @@
+import concurrent.futures
+
+import torch
+import torchvision
+import torchvision.datasets as datasets
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+import autoaug.main as main
+from autoaug.validation import ValidationSubsample, QuantizedValidation
+
+
+def test_validation_subsample():
+    """
+    the subsample should be a fixed prefix of the validation set which
+    only grows when the measured accuracy needs more images
+    """
+    test_dataset = datasets.FakeData(size=500, image_size=(1, 28, 28),
+                            transform=torchvision.transforms.ToTensor())
+    subsample = ValidationSubsample(test_dataset, target_ci=0.1, min_size=50)
+
+    # 0.5 accuracy is the worst case: 1.96**2 * 0.25 / 0.1**2 ~ 97 images
+    assert subsample.required_size(0.5) == 97
+    assert subsample.required_size(0.99) < subsample.required_size(0.9)
+
+    model = cn.SimpleNet()
+    acc = subsample.evaluate(model, torch.device('cpu'))
+    assert 0 <= acc.item() <= 1
+    assert 50 <= subsample.size <= 97
+    assert len(subsample._labels) == 50
+
+    sizes = []
+    for _ in range(3):
+        subsample.evaluate(model, torch.device('cpu'))
+        sizes.append(subsample.size)
+    assert sizes == sorted(sizes)
+    assert subsample.ci_half_width(0.5, n=97) <= 0.1
+
+
+def test_subsampled_validation(fake_datasets):
+    # a larger test set than that of fake_datasets, to subsample
+    train_dataset, _ = fake_datasets
+    test_dataset = datasets.FakeData(size=300, image_size=(1, 28, 28),
+                            transform=torchvision.transforms.ToTensor())
+    agent = aal.RsLearner(
+                        num_sub_policies=2,
+                        max_epochs=5,
+                        early_stop_num=10,
+                        val_ci=0.2,
+                        val_every=2,
+                        )
+    agent.learn(train_dataset,
+                test_dataset,
+                child_network_architecture=cn.SimpleNet,
+                iterations=2)
+
+    subsample = agent._val_subsamples[id(test_dataset)]
+    assert subsample.size < len(test_dataset)
+    for curve in agent.learning_curves:
+        # every second epoch, and the last one
+        assert [epoch for epoch, _ in curve] == [1, 3, 4]
+
+
+def test_quantized_validation():
+    test_dataset = datasets.FakeData(size=64, image_size=(1, 28, 28),
+                            transform=torchvision.transforms.ToTensor())
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=16)
+    model = cn.EasyNet()
+    device = torch.device('cpu')
+
+    quantized_validation = QuantizedValidation(min_agreement=0.0, calibration_size=20)
+    network = quantized_validation.network_for_validation(model, test_loader, device)
+    if QuantizedValidation.is_available(device):
+        assert len(quantized_validation._calibration_x) == 20
+        assert network is not model
+        assert quantized_validation.num_int8 == 1
+        # the quantized copy gives (nearly) the same accuracy
+        acc = main.validation_accuracy(model, test_loader, device)
+        int8_acc = main.validation_accuracy(network, test_loader, device)
+        assert abs(acc.item() - int8_acc.item()) <= 0.1
+
+    # an impossible threshold makes us fall back to fp32
+    quantized_validation = QuantizedValidation(min_agreement=1.1)
+    network = quantized_validation.network_for_validation(model, test_loader, device)
+    assert network is model
+    assert quantized_validation.num_fp32 == 1
+
+
+def test_quantized_validation_checks():
+    """
+    the agreement of a child network is only checked every check_every
+    validations, and the decision is reused in between
+    """
+    test_dataset = datasets.FakeData(size=64, image_size=(1, 28, 28),
+                            transform=torchvision.transforms.ToTensor())
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=16)
+    device = torch.device('cpu')
+    if not QuantizedValidation.is_available(device):
+        return
+
+    quantized_validation = QuantizedValidation(min_agreement=1.1, check_every=3)
+    model = cn.EasyNet()
+    for _ in range(4):
+        assert quantized_validation.network_for_validation(model, test_loader, device) is model
+    assert quantized_validation.num_checks == 2
+    assert quantized_validation.num_fp32 == 4
+
+    # every child network gets its own first check
+    quantized_validation.network_for_validation(cn.EasyNet(), test_loader, device)
+    assert quantized_validation.num_checks == 3
+
+
+def test_validation_subsample_threads():
+    """
+    evaluations running in threads at once must each divide by the size of
+    the subsample they evaluated on
+    """
+    test_dataset = datasets.FakeData(size=400, image_size=(1, 28, 28),
+                            transform=torchvision.transforms.ToTensor())
+    subsample = ValidationSubsample(test_dataset, target_ci=0.01, min_size=20, batch_size=8)
+    labels = [test_dataset[int(idx)][1] for idx in subsample.order]
+
+    # always predicts class 0
+    model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(784, 10))
+    torch.nn.init.zeros_(model[1].weight)
+    with torch.no_grad():
+        model[1].bias.copy_(torch.arange(10, 0, -1).float())
+    prefix_accs = {sum(label == 0 for label in labels[:n]) / n for n in range(1, 401)}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        accs = list(executor.map(lambda _: subsample.evaluate(model, torch.device('cpu')),
+                                range(16)))
+    for acc in accs:
+        assert any(abs(acc.item() - prefix_acc) < 1e-6 for prefix_acc in prefix_accs)
+    assert subsample.size > 20
@@ -0,0 +1,45 @@
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.warm_start import (freeze_early_layers, spearman_rank_correlation,
+                                warm_start_rank_correlation)
+
+
+def test_spearman_rank_correlation():
+    assert spearman_rank_correlation([1, 2, 3, 4], [10, 20, 30, 40]) == 1.0
+    assert spearman_rank_correlation([1, 2, 3, 4], [4, 3, 2, 1]) == -1.0
+    # ties get the average rank
+    assert abs(spearman_rank_correlation([1, 1, 2], [1, 2, 3]) - 0.8660254) < 1e-6
+
+
+def test_freeze_early_layers():
+    model = cn.LeNet()
+    frozen = freeze_early_layers(model, 2)
+    assert frozen == ['conv1', 'conv2']
+    assert not model.conv2.weight.requires_grad
+    assert model.fc1.weight.requires_grad
+
+
+def test_warm_start(fake_datasets):
+    train_dataset, test_dataset = fake_datasets
+    agent = aal.RsLearner(
+                        num_sub_policies=2,
+                        max_epochs=3,
+                        warm_start=True,
+                        pretrain_epochs=2,
+                        fine_tune_epochs=2,
+                        freeze_layers=1,
+                        )
+    agent.learn(train_dataset,
+                test_dataset,
+                child_network_architecture=cn.EasyNet,
+                iterations=2)
+
+    # we only pretrain once, and fine tune for exactly fine_tune_epochs epochs
+    assert len(agent._warm_start_states) == 1
+    assert [len(curve) for curve in agent.learning_curves] == [2, 2]
+
+    policies = [agent._generate_new_policy() for _ in range(3)]
+    report = warm_start_rank_correlation(agent, policies, cn.EasyNet,
+                                        train_dataset, test_dataset)
+    assert len(report['warm_start_accs']) == len(report['scratch_accs']) == 3
+    assert len(agent.history) == 2
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import time
+
+import autoaug.autoaugment_learners as aal
+import autoaug.child_networks as cn
+from autoaug.worker import SqliteQueue, QueueEvaluator
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    queue = SqliteQueue(str(tmp_path / 'queue.db'), lease_timeout=0.5)
+    job_id = queue.submit({'policy': 'a'})
+
+    assert queue.claim('dead worker') == (job_id, {'policy': 'a'})
+    assert queue.claim('other worker') is None
+
+    # the dead worker never renews its lease
+    time.sleep(1)
+    assert queue.claim('other worker') == (job_id, {'policy': 'a'})
+
+    # the dead worker can no longer finish the job
+    assert not queue.renew(job_id, 'dead worker')
+    queue.complete(job_id, 'dead worker', 'wrong')
+    queue.complete(job_id, 'other worker', 'right')
+    assert queue.results([job_id]) == {job_id: ('done', 'right')}
+
+
+def test_job_killing_workers_fails(tmp_path):
+    queue = SqliteQueue(str(tmp_path / 'queue.db'), lease_timeout=0.5, max_attempts=2)
+    job_id = queue.submit({'policy': 'a'})
+
+    # both workers which claim the job die
+    assert queue.claim('dead worker 1') == (job_id, {'policy': 'a'})
+    time.sleep(1)
+    assert queue.claim('dead worker 2') == (job_id, {'policy': 'a'})
+    time.sleep(1)
+
+    # so the job is not handed to a third one
+    assert queue.claim('other worker') is None
+    (status, error), = queue.results([job_id]).values()
+    assert status == 'failed'
+    assert 'expired 2 times' in error
+
+
+def test_workers(tmp_path, fake_datasets):
+    path = str(tmp_path / 'queue.db')
+    train_dataset, test_dataset = fake_datasets
+
+    evaluator = QueueEvaluator(path, num_workers=2, poll_interval=0.2, timeout=600)
+    workers = [subprocess.Popen([sys.executable, '-m', 'autoaug.worker',
+                                '--queue', path,
+                                '--poll-interval', '0.2',
+                                '--idle-timeout', '20'],
+                                cwd=REPO_ROOT)
+                for _ in range(2)]
+    try:
+        learner = aal.RsLearner(batch_size=8, max_epochs=1, evaluator=evaluator)
+        learner.learn(train_dataset, test_dataset, cn.SimpleNet, iterations=4)
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+    assert len(learner.history) == 4
+    assert list(learner.policy_record) == ['pol0', 'pol1', 'pol2', 'pol3']
+    assert evaluator.queue.counts() == {'done': 4}